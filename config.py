@@ -5,12 +5,22 @@ import os
 # YouTube handle of the desired channel, it appears with a @<username> in the profile page.
 channel_handle = "kurzgesagt" # without @
 
+# Channels of the multi-channel harvest (python -m src.harvest) and their share of the quota
+channel_weights = {
+    channel_handle: 1,
+}
+
 ############################
 # API
 load_dotenv()
 API_SERVICE_NAME = 'youtube'
 API_VERSION = 'v3'
 API_KEY = os.getenv('api_key')
+# optional pool of keys, comma separated, their daily quotas add up
+API_KEYS = [key.strip() for key in os.getenv('api_keys', '').split(',') if key.strip()]
+API_KEY = API_KEY or (API_KEYS[0] if API_KEYS else None)
+if API_KEY and API_KEY not in API_KEYS:
+    API_KEYS.insert(0, API_KEY)
 
 if not API_KEY:
     raise ValueError("API_KEY not found.Please create a .env file in the project root.")
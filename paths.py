@@ -22,7 +22,9 @@ class Paths:
         self.processed_data_dir = os.path.join(self.base_dir, "data", "processed")
         self._clean_comments_dir = os.path.join(self.processed_data_dir, "comments")
         self._enriched_comments_dir = os.path.join(self.processed_data_dir, "enriched")
+        self._rollups_dir = os.path.join(self.processed_data_dir, "rollups")
         self.results_dir = os.path.join(self.processed_data_dir, "results")
+        self.metrics_dir = os.path.join(self.base_dir, "data", "metrics")
 
         self.resolve_all_paths(create_dirs=True)
 
@@ -30,11 +32,21 @@ class Paths:
         # Static file paths (do not change with date)
         self.videos_file_path = os.path.join(self.raw_data_dir, f"{channel_handle}_videos.json")
         self.playlists_file_path = os.path.join(self.raw_data_dir, f"{channel_handle}_playlists.json")
+        self.reply_threads_file_path = os.path.join(self.raw_data_dir, f"{channel_handle}_videos_replies.json")
+        self.pipeline_state_file_path = os.path.join(self.base_dir, "data", f"{channel_handle}_pipeline_state.json")
+        self.thread_index_dir = os.path.join(self.processed_data_dir, "threads", channel_handle)
+        self.near_duplicates_dir = os.path.join(self.processed_data_dir, "near_duplicates", channel_handle)
+        self.search_index_dir = os.path.join(self.processed_data_dir, "search", channel_handle)
+        self.vocabulary_file_path = os.path.join(self.processed_data_dir, f"{channel_handle}_vocabulary.parquet")
+        self.word_cloud_cache_dir = os.path.join(self.processed_data_dir, "word_clouds")
 
     # --- Raw Data Paths ---
     @property
     def raw_comments_file_path(self) -> str:
-        """Return the path of the raw comments, ndjson format."""
+        """
+        Return the path of the raw comments, ndjson format. Newer harvests are stored as
+        compressed segments sharing this name, see `src.raw_storage`.
+        """
         return os.path.join(
             self._raw_comments_dir,
             f"{self.channel_handle}_comments_{self.date_str}.ndjson"
@@ -57,6 +69,40 @@ class Paths:
             f"{self.channel_handle}_enriched_comments_{self.date_str}.parquet"
         )
 
+    @property
+    def rollup_file_path(self) -> str:
+        """Return the path of the engagement rollup of this date's comments, parquet format."""
+        return os.path.join(
+            self._rollups_dir,
+            f"{self.channel_handle}_rollup_{self.date_str}.parquet"
+        )
+
+    def analyzer_output_dir(self, analyzer: str) -> str:
+        """Return the folder of the streamed analyzer results (parquet parts) for this date."""
+        return os.path.join(
+            self.processed_data_dir,
+            "analyzers",
+            analyzer,
+            f"{self.channel_handle}_{self.date_str}"
+        )
+
+    # --- Metrics Paths ---
+    @property
+    def metrics_log_file_path(self) -> str:
+        """Return the path of the pipeline metrics events, JSON-lines format."""
+        return os.path.join(
+            self.metrics_dir,
+            f"{self.channel_handle}_metrics_{self.date_str}.jsonl"
+        )
+
+    @property
+    def metrics_snapshot_file_path(self) -> str:
+        """Return the path of the latest metrics snapshot, Prometheus text format."""
+        return os.path.join(
+            self.metrics_dir,
+            f"{self.channel_handle}_metrics.prom"
+        )
+
     def as_dict(self) -> dict:
         """Return all dynamic paths as a dictionary."""
         return {
@@ -65,15 +111,28 @@ class Paths:
         }
     
     def list_raw_files(self, show_complete_path: bool = True) -> List[str]:
-        """List all raw NDJSON comment files for this channel."""
+        """List all raw comment files for this channel, NDJSON files and compressed segments."""
         prefix = f"{self.channel_handle}_comments_"
-        suffix = ".ndjson"
+        suffix = (".ndjson", ".arrows")
         return sorted([
             os.path.join(self._raw_comments_dir, f) if show_complete_path else f
             for f in os.listdir(self._raw_comments_dir)
             if f.startswith(prefix) and f.endswith(suffix)
         ])
     
+    def list_raw_dates(self) -> List[str]:
+        """Return a list of dates (YYYY_MM_DD) for which raw comment files exist."""
+        prefix = f"{self.channel_handle}_comments_"
+        dates = set()
+        for filename in self.list_raw_files(show_complete_path=False):
+            date_str = filename[len(prefix):len(prefix) + len("YYYY_MM_DD")]
+            try:
+                datetime.strptime(date_str, "%Y_%m_%d")
+                dates.add(date_str)
+            except ValueError:
+                continue  # Skip malformed filenames
+        return sorted(dates)
+
     def list_processed_files(self, show_complete_path: bool = True) -> List[str]:
         """List all processed PARQUET comment files for this channel."""
         prefix = f"{self.channel_handle}_comments_"
@@ -90,7 +149,7 @@ class Paths:
         suffix = ".parquet"
 
         dates = []
-        for filename in os.listdir(self.processed_data_dir):
+        for filename in os.listdir(self._clean_comments_dir):
             if filename.startswith(prefix) and filename.endswith(suffix):
                 try:
                     date_str = filename[len(prefix):-len(suffix)]
@@ -112,9 +171,19 @@ class Paths:
             if f.startswith(prefix) and f.endswith(suffix)
         ])
     
+    def list_rollup_files(self, show_complete_path: bool = True) -> List[str]:
+        """List all engagement rollup PARQUET files for this channel."""
+        prefix = f"{self.channel_handle}_rollup_"
+        suffix = ".parquet"
+        return sorted([
+            os.path.join(self._rollups_dir, f) if show_complete_path else f
+            for f in os.listdir(self._rollups_dir)
+            if f.startswith(prefix) and f.endswith(suffix)
+        ])
+
     def resolve_all_paths(self, create_dirs: bool = True) -> None:
         """Ensure that base data directories exist. Create them if specified."""
-        for folder in [self.raw_data_dir, self.processed_data_dir, self._raw_comments_dir, self._clean_comments_dir, self._enriched_comments_dir, self.results_dir]:
+        for folder in [self.raw_data_dir, self.processed_data_dir, self._raw_comments_dir, self._clean_comments_dir, self._enriched_comments_dir, self._rollups_dir, self.results_dir, self.metrics_dir]:
             if not os.path.exists(folder):
                 if create_dirs:
                     os.makedirs(folder, exist_ok=True)
@@ -0,0 +1,197 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Iterator, List, Optional
+from src.metrics import metrics
+import statistics
+import platform
+import logging
+import random
+import json
+import time
+import os
+
+# host level cache, shared by every channel
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "autotune.json")
+
+def host_key() -> str:
+    """Identifies the current machine for the tuning cache."""
+    return f"{platform.node()}|{platform.machine()}|{os.cpu_count()}"
+
+def length_bucket(texts: List[str]) -> int:
+    """
+    Bucket the median text length to the nearest lower power of two, so that corpora with
+    a similar length distribution share a tuned configuration.
+    """
+    if not texts:
+        return 0
+    median = statistics.median(len(t) if isinstance(t, str) else 0 for t in texts)
+    return 1 << max(0, int(median).bit_length() - 1)
+
+def load_cache(cache_path: str = DEFAULT_CACHE_PATH) -> dict:
+    try:
+        with open(cache_path, "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+    except json.JSONDecodeError:
+        logging.error(f"Autotune cache at {cache_path} is not valid JSON, ignoring it.")
+        return {}
+
+def save_cache(cache: dict, cache_path: str = DEFAULT_CACHE_PATH) -> None:
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(cache, file, indent=4)
+        os.replace(tmp_path, cache_path)
+    except (OSError, IOError) as e:
+        logging.error(f"Failed to save autotune cache: {e}")
+
+def cache_key(analyzer: str, texts: List[str]) -> str:
+    return f"{host_key()}|{analyzer}|len{length_bucket(texts)}"
+
+def measure_throughput(func: Callable, initializer: Callable, sample: List[str], workers: int, chunk_size: int) -> float:
+    """
+    Items per second of `func` over `sample` for one pool configuration.
+    Pool start up and worker initialization are excluded from the timing.
+    """
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer) as executor:
+        # warm up every worker, so the initializer cost is not measured
+        list(executor.map(func, sample[:workers], chunksize=1))
+
+        start = time.perf_counter()
+        for _ in executor.map(func, sample, chunksize=chunk_size):
+            pass
+        elapsed = time.perf_counter() - start
+    return len(sample) / max(elapsed, 1e-9)
+
+def calibrate(func: Callable, initializer: Callable, texts: List[str], analyzer: str,
+              sample_size: int = 2_000, max_workers: Optional[int] = None, min_gain: float = 0.05, seed: int = 0) -> dict:
+    """
+    Runs short timed trials over a sample of the input and picks the worker count and chunk size
+    with the best throughput for this machine.
+
+    Worker counts are explored doubling (1, 2, 4, ...) up to `max_workers`, stopping once an extra
+    step gains less than `min_gain`, since throughput flattens well before all logical cores are used.
+    Chunk sizes are then compared for the chosen worker count.
+
+    Args:
+        func (Callable): top-level (picklable) function applied to each text.
+        initializer (Callable): pool initializer, e.g. loading the analyzer model.
+        texts (List[str]): input to sample from.
+        analyzer (str): analyzer name, used for metrics.
+        sample_size (int): items per trial.
+        max_workers (int): upper bound for the worker count, defaults to the CPU count.
+        min_gain (float): relative throughput gain required to keep adding workers.
+        seed (int): sampling seed.
+    Returns:
+        dict: {"workers", "chunk_size", "throughput", "tuned_at"}
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    rng = random.Random(seed)
+    sample = rng.sample(texts, sample_size) if len(texts) > sample_size else list(texts)
+    if not sample:
+        return {"workers": 1, "chunk_size": 1, "throughput": 0.0, "tuned_at": datetime.now(timezone.utc).isoformat()}
+
+    def default_chunk(workers: int) -> int:
+        return max(1, len(sample) // (workers * 4))
+
+    candidates = []
+    w = 1
+    while w < max_workers:
+        candidates.append(w)
+        w *= 2
+    candidates.append(max_workers)
+
+    best_workers, best_throughput = 1, 0.0
+    with metrics.timer("autotune_seconds", analyzer=analyzer):
+        for workers in candidates:
+            throughput = measure_throughput(func, initializer, sample, workers, default_chunk(workers))
+            metrics.event("autotune_trial", analyzer=analyzer, workers=workers, chunk_size=default_chunk(workers), throughput=round(throughput, 2))
+            if throughput > best_throughput * (1 + min_gain):
+                best_workers, best_throughput = workers, throughput
+            else:
+                break # flattened, more workers only add contention
+
+        best_chunk = default_chunk(best_workers)
+        for divisor in (1, 16, 64):
+            chunk_size = max(1, len(sample) // (best_workers * divisor))
+            if chunk_size == best_chunk:
+                continue
+            throughput = measure_throughput(func, initializer, sample, best_workers, chunk_size)
+            metrics.event("autotune_trial", analyzer=analyzer, workers=best_workers, chunk_size=chunk_size, throughput=round(throughput, 2))
+            if throughput > best_throughput:
+                best_chunk, best_throughput = chunk_size, throughput
+
+    result = {
+        "workers": best_workers,
+        "chunk_size": best_chunk,
+        "throughput": round(best_throughput, 2),
+        "tuned_at": datetime.now(timezone.utc).isoformat(),
+    }
+    logging.info(f"Autotune {analyzer}: {best_workers} workers, chunk size {best_chunk}, {best_throughput:.2f} c/s")
+    metrics.event("autotune_result", analyzer=analyzer, **result)
+    return result
+
+def get_config(func: Callable, initializer: Callable, texts: List[str], analyzer: str,
+               cache_path: str = DEFAULT_CACHE_PATH, retune: bool = False, **calibrate_kwargs) -> dict:
+    """Returns the cached configuration for this host, analyzer and text length, calibrating if missing."""
+    cache = load_cache(cache_path)
+    key = cache_key(analyzer, texts)
+    if not retune and key in cache:
+        return cache[key]
+
+    config = calibrate(func, initializer, texts, analyzer, **calibrate_kwargs)
+    cache[key] = config
+    save_cache(cache, cache_path)
+    return config
+
+def imap_autotuned(func: Callable, initializer: Callable, texts: List[str], analyzer: str,
+                   segment_size: int = 50_000, drift_tolerance: float = 0.7, drift_patience: int = 2,
+                   cache_path: str = DEFAULT_CACHE_PATH, **calibrate_kwargs) -> Iterator:
+    """
+    Applies `func` to every text in a process pool sized by the autotuner, yielding results in order.
+
+    The input is mapped in segments of `segment_size`; when the throughput of `drift_patience`
+    consecutive segments falls under `drift_tolerance` times the tuned throughput, the next
+    segment is used to re-calibrate and the pool is rebuilt if the worker count changed.
+
+    Args:
+        func (Callable): top-level (picklable) function applied to each text.
+        initializer (Callable): pool initializer.
+        texts (List[str]): input texts.
+        analyzer (str): analyzer name, part of the cache key.
+        segment_size (int): items mapped between throughput checks.
+        drift_tolerance (float): fraction of the tuned throughput considered a drift.
+        drift_patience (int): consecutive drifting segments before re-tuning.
+        cache_path (str): location of the per host cache.
+    """
+    config = get_config(func, initializer, texts, analyzer, cache_path=cache_path, **calibrate_kwargs)
+    slow_segments = 0
+    executor = ProcessPoolExecutor(max_workers=config["workers"], initializer=initializer)
+    try:
+        for offset in range(0, len(texts), segment_size):
+            segment = texts[offset:offset + segment_size]
+            start = time.perf_counter()
+            for result in executor.map(func, segment, chunksize=config["chunk_size"]):
+                yield result
+            throughput = len(segment) / max(time.perf_counter() - start, 1e-9)
+            metrics.set_gauge("autotune_segment_throughput", throughput, analyzer=analyzer)
+
+            # a short tail segment is not representative
+            if len(segment) < segment_size:
+                continue
+
+            slow_segments = slow_segments + 1 if throughput < config["throughput"] * drift_tolerance else 0
+            if slow_segments >= drift_patience and offset + segment_size < len(texts):
+                logging.info(f"Autotune {analyzer}: throughput drifted to {throughput:.2f} c/s, re-tuning.")
+                metrics.inc("autotune_retunes_total", analyzer=analyzer)
+                upcoming = texts[offset + segment_size:offset + 2 * segment_size]
+                workers = config["workers"]
+                config = get_config(func, initializer, upcoming, analyzer, cache_path=cache_path, retune=True, **calibrate_kwargs)
+                if config["workers"] != workers:
+                    executor.shutdown()
+                    executor = ProcessPoolExecutor(max_workers=config["workers"], initializer=initializer)
+                slow_segments = 0
+    finally:
+        executor.shutdown(cancel_futures=True)
@@ -0,0 +1,79 @@
+from typing import List
+from src.preprocessing import detect_script, extract_emojis
+from src.raw_storage import read_raw_comments
+from src.encoding import compact_dtypes
+import polars as pl
+import logging
+
+# raw (flattened) API field -> clean column, same as notebook 02_1
+RENAME_MAP = {
+    "id": "comment_id",
+    "videoId": "video_id",
+    "channelId": "channel_id",
+    "totalReplyCount": "reply_count",
+    "textDisplay": "comment",
+    "authorDisplayName": "author",
+    "authorChannelId": "author_id",
+    "likeCount": "likes",
+    "publishedAt": "published_at",
+    "parentId": "parent_id"
+}
+
+def clean_raw_comments(raw_comments_file_path: str, previous_files: List[str]) -> pl.DataFrame:
+    """
+    Headless version of the `02_1_data_cleaning` notebook: loads the raw comments of a day,
+    removes local and global duplicates, renames, re-types and adds the derived columns.
+
+    Args:
+        raw_comments_file_path (str): `Paths.raw_comments_file_path` of the day.
+        previous_files (List[str]): clean files of other days, used for global deduplication.
+    Returns:
+        pl.DataFrame: clean comments, with the compact dtypes of `src.encoding.CLEAN_DTYPES`.
+    """
+    today_df = read_raw_comments(raw_comments_file_path)
+
+    # only older ndjson harvests rely on the file order for the videoId of replies
+    today_df = today_df.with_columns([
+        pl.col("videoId").forward_fill().alias("videoId")
+    ])
+    local_duplicates = today_df.height
+    today_df = today_df.unique(subset=["id"], maintain_order=True)
+    local_duplicates -= today_df.height
+
+    global_duplicates = 0
+    if previous_files:
+        previous_ids_df = pl.scan_parquet(previous_files).select("comment_id").unique().collect()
+        before = today_df.height
+        today_df = today_df.join(previous_ids_df, left_on="id", right_on="comment_id", how="anti")
+        global_duplicates = before - today_df.height
+    logging.info(f"Removed {local_duplicates} local duplicates and {global_duplicates} global duplicates.")
+
+    today_df = today_df.rename(RENAME_MAP)
+
+    today_df = today_df.with_columns([
+        pl.col("published_at").str.to_datetime(time_unit="ms", time_zone="Zulu").alias("published_at"),
+        pl.col("reply_count").fill_null(0)
+    ])
+
+    today_df = today_df.with_columns([
+        # 1. Is it a reply? (parent_id not null)
+        pl.col("parent_id").is_not_null().alias("is_reply"),
+
+        # 2. Comment length in characters
+        pl.col("comment").str.len_chars().alias("comment_length"),
+
+        # 3. Word count (count non-space sequences)
+        pl.col("comment").str.count_matches(r"\S+").alias("word_count"),
+
+        # 4. Script detection
+        pl.col("comment").map_elements(detect_script, return_dtype=pl.Utf8).alias("script"),
+
+        # 5. Extract emojis
+        pl.col("comment").map_elements(extract_emojis, return_dtype=pl.List(pl.Utf8)).alias("comment_emojis"),
+    ])
+
+    # 6. Count emojis (length of list column)
+    today_df = today_df.with_columns([
+        pl.col("comment_emojis").list.len().alias("emoji_count")
+    ])
+    return compact_dtypes(today_df)
@@ -3,10 +3,15 @@ import os
 import json
 import time
 import logging
-from typing import TextIO
+from contextlib import contextmanager
+from contextvars import ContextVar
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 from googleapiclient.discovery import build
 from tqdm import tqdm
 from googleapiclient.errors import HttpError
+from src.metrics import metrics
+from src.raw_storage import RawCommentWriter, flatten_comment
+from src.quota import KeyPool, QuotaExhausted, key_fingerprint
 
 # make logging info visible
 logging.basicConfig(level=logging.INFO)
@@ -16,6 +21,81 @@ API_SERVICE_NAME = config.API_SERVICE_NAME
 API_VERSION = config.API_VERSION
 API_KEY = config.API_KEY
 
+# key pool of the current harvest (thread), requests use config.API_KEY without one,
+# and the units charged to it inside the current `use_key_pool` block
+_key_pool: ContextVar[KeyPool | None] = ContextVar("key_pool", default=None)
+_pool_usage: ContextVar[dict | None] = ContextVar("pool_usage", default=None)
+
+@contextmanager
+def use_key_pool(pool: KeyPool):
+    """
+    Routes the API requests made inside the block (in this thread) through the keys of `pool`.
+    Yields a dict whose "units" are the quota units charged to the pool inside the block.
+    """
+    usage = {"units": 0}
+    token, usage_token = _key_pool.set(pool), _pool_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _key_pool.reset(token)
+        _pool_usage.reset(usage_token)
+
+def is_quota_error(e: Exception) -> bool:
+    """The daily quota of the key, or of every key of the pool, is spent."""
+    if isinstance(e, QuotaExhausted):
+        return True
+    return isinstance(e, HttpError) and e.resp.status == 403 and "quotaExceeded" in str(e)
+
+def _with_api_key(uri: str, api_key: str) -> str:
+    scheme, netloc, path, query, fragment = urlsplit(uri)
+    params = [(k, v) for k, v in parse_qsl(query, keep_blank_values=True) if k != "key"]
+    params.append(("key", api_key))
+    return urlunsplit((scheme, netloc, path, urlencode(params), fragment))
+
+def execute_request(request, method: str, quota_cost: int = 1) -> dict:
+    """
+    Executes a YouTube Data API request, recording the call, its quota units and
+    its latency per API method in the shared metrics registry.
+
+    Inside `use_key_pool`, the call is charged to the key of the pool with the most quota left,
+    and retried on the next key when the API answers `quotaExceeded`.
+
+    Args:
+        request (HttpRequest): request built from the API resource.
+        method (str): API method name, used as metric label (e.g. "commentThreads.list").
+        quota_cost (int): quota units charged for the call.
+    Returns:
+        dict: the API response.
+    Raises:
+        QuotaExhausted: no key of the pool has quota left.
+    """
+    pool = _key_pool.get()
+    while True:
+        if pool is not None:
+            api_key = pool.acquire(quota_cost)
+            _pool_usage.get()["units"] += quota_cost
+            request.uri = _with_api_key(request.uri, api_key)
+        try:
+            return _execute_request(request, method, quota_cost)
+        except HttpError as e:
+            if pool is None or not is_quota_error(e):
+                raise
+            pool.mark_exhausted(api_key)
+            metrics.inc("api_retries_total", method=method, reason="quotaExceeded")
+            metrics.event("key_exhausted", key=key_fingerprint(api_key), method=method)
+
+def _execute_request(request, method: str, quota_cost: int) -> dict:
+    try:
+        with metrics.timer("api_latency_seconds", method=method):
+            return request.execute()
+    except HttpError as e:
+        metrics.inc("api_errors_total", method=method, status=e.resp.status)
+        raise
+    finally:
+        # failed calls are charged as well
+        metrics.inc("api_calls_total", method=method)
+        metrics.inc("quota_units_total", quota_cost, method=method)
+
 def save_channel_playlists(channel_id: str, save_location: str, overwrite: bool = False) -> None:
     """
     Saves all playlists for a given channel ID into a JSON file, writing incrementally.
@@ -54,7 +134,7 @@ def save_channel_playlists(channel_id: str, save_location: str, overwrite: bool
                 )
 
                 request = youtube.playlists().list(**params)
-                response = request.execute()
+                response = execute_request(request, "playlists.list")
 
                 page_items = response.get('items', [])
 
@@ -108,7 +188,7 @@ def get_channel_uploads_playlist(channel_id: str) -> str | None:
             )
 
             request = youtube.channels().list(**params)
-            response = request.execute()
+            response = execute_request(request, "channels.list")
             items = response.get('items', [])
             if not items:
                 logging.info(f"The information for the channel ID {channel_id} returned empty.")
@@ -157,7 +237,7 @@ def save_playlist_videos(playlist_id: str, save_location: str, overwrite: bool =
                 )
 
                 request = youtube.playlistItems().list(**params)
-                response = request.execute()
+                response = execute_request(request, "playlistItems.list")
 
                 for item in response.get("items",[]):
                     video_id = item["contentDetails"]["videoId"]
@@ -189,18 +269,22 @@ def save_playlist_videos(playlist_id: str, save_location: str, overwrite: bool =
         logging.error(f"An error has occurred {e}.")
     
 
-def save_video_comments(video_id: str, next_page_token: str, save_location: str, quota_remaining: int) -> tuple[int, str | None, int, int, bool]:
+def save_video_comments(video_id: str, next_page_token: str, writer: RawCommentWriter, quota_remaining: int, reply_queue: dict) -> tuple[int, str | None, int, int, bool, bool]:
     """
-    Saves all comments and replies for a given YouTube video ID into a NDJSON file.
+    Saves all comments for a given YouTube video ID into the raw comments storage, with the replies
+    that come inline with each thread. Threads with more than 5 replies are recorded in the
+    reply queue instead, to be fetched later by `save_queued_replies`.
 
     Args:
         video_id (str): ID of the YouTube video.
         next_page_token (str): Starts the search from this page.
-        save_location (str): Path of the ndjson file.
+        writer (RawCommentWriter): raw comments writer.
         quota_remaining (int): Quota left for usage.
+        reply_queue (dict): Reply threads state, see `queue_reply_thread`.
 
     Returns:
-        (tuple(int, str, int, int, bool)): quota remaining, next page token (if not finished), comments count and replies count, finished bool
+        (tuple(int, str, int, int, bool, bool)): quota used, next page token (if not finished), comments count and replies count,
+        finished bool and whether the API quota ran out
     """
 
     # quota costs from Google Data API V3
@@ -213,8 +297,7 @@ def save_video_comments(video_id: str, next_page_token: str, save_location: str,
 
     # logging.info(f"Trying to fetch comments for video {video_id}...")
     try:
-        with build(API_SERVICE_NAME, API_VERSION, developerKey=API_KEY) as youtube, \
-            open(save_location, 'a') as file:
+        with build(API_SERVICE_NAME, API_VERSION, developerKey=API_KEY) as youtube:
 
             while current_quota_usage < quota_remaining:
                 # artificial delay, avoid rate limits
@@ -249,7 +332,7 @@ def save_video_comments(video_id: str, next_page_token: str, save_location: str,
                 )
 
                 request = youtube.commentThreads().list(**params)
-                response = request.execute()
+                response = execute_request(request, "commentThreads.list", COMMENT_THREADS_QUOTA_COST)
 
                 # one call, quota usage increase
                 current_quota_usage += COMMENT_THREADS_QUOTA_COST
@@ -260,27 +343,22 @@ def save_video_comments(video_id: str, next_page_token: str, save_location: str,
                     comment_id = item['snippet']['topLevelComment']['id']
                     
                     # save the top comment
-                    file.write(json.dumps({**item['snippet']['topLevelComment'], "totalReplyCount": reply_count, "videoId": video_id}, ensure_ascii=False) + '\n')
+                    writer.write(flatten_comment(item['snippet']['topLevelComment'], video_id, reply_count))
                     comments_count += 1
+                    metrics.inc("comments_saved_total", kind="top_level")
 
-                    # if there are more than 5 replies
+                    # if there are more than 5 replies, the inline ones are incomplete:
+                    # defer the whole thread to the replies phase
                     if reply_count > 5:
-                        # make separate call
-                        comments_quota_used, current_replies_count = save_comment_replies(comment_id, file, quota_remaining - current_quota_usage)
-                        replies_count += current_replies_count
-                        current_quota_usage += comments_quota_used
-
-                        # if comments filled quota, we repeat the same page next time
-                        if current_quota_usage >= quota_remaining:
-                            logging.info(f"Comments for video {video_id} fetched partially: {comments_count} comments saved, {replies_count} replies saved.")
-                            return (current_quota_usage, next_page_token, comments_count, replies_count, False)
+                        queue_reply_thread(reply_queue, comment_id, video_id, reply_count)
 
                     elif 'replies' in item:
                         # for every reply with the comment
                         replies_count += reply_count
                         
                         for reply in item['replies']['comments']:
-                            file.write(json.dumps(reply, ensure_ascii=False) + '\n')
+                            writer.write(flatten_comment(reply, video_id))
+                        metrics.inc("comments_saved_total", len(item['replies']['comments']), kind="reply")
 
                 next_page_token = response.get('nextPageToken')               
 
@@ -290,42 +368,44 @@ def save_video_comments(video_id: str, next_page_token: str, save_location: str,
         # if pages remaining
         if current_quota_usage >= quota_remaining and next_page_token != None:
             logging.info(f"Comments for video {video_id} fetched partially: {comments_count} comments saved, {replies_count} replies saved.")
-            return (0, next_page_token, comments_count, replies_count, False)
+            return (current_quota_usage, next_page_token, comments_count, replies_count, False, False)
         
         # return quota used
         #logging.info(f"Comments for video {video_id} fetched successfully: {comments_count} comments saved, {replies_count} replies saved.")
-        return (current_quota_usage, None, comments_count, replies_count, True)
+        return (current_quota_usage, None, comments_count, replies_count, True, False)
         
     except (KeyError, IndexError, TypeError):
         logging.error(f"There was an error parsing the resource for video {video_id}")
-    except HttpError as e:
-        if e.resp.status == 403 and "quotaExceeded" in str(e):
+    except (HttpError, QuotaExhausted) as e:
+        if is_quota_error(e):
             logging.error(f'Quota limit exceded at video {video_id}')
             if next_page_token != None:
                 logging.info(f"Comments for video {video_id} fetched partially: {comments_count} comments saved, {replies_count} replies saved.")
-            return (float('inf'), next_page_token, comments_count, replies_count, False)
+            return (current_quota_usage, next_page_token, comments_count, replies_count, False, True)
 
         logging.error(f"An error has occurred for video {video_id} {e}.")
     except (IOError, OSError) as e:
         logging.error(f"A system-level error has occurred for video {video_id}: {e}")
-    return (current_quota_usage, next_page_token, comments_count, replies_count, False)
+    return (current_quota_usage, next_page_token, comments_count, replies_count, False, False)
 
-def save_comment_replies(top_comment_id: str, file: TextIO, quota_remaining: int) -> tuple[int, int]:
+def save_comment_replies(top_comment_id: str, video_id: str, writer: RawCommentWriter, quota_remaining: int, next_page_token: str | None = None) -> tuple[int, int, str | None, bool, bool]:
     """
         Saves the textDisplay of a YouTube reply to the specified parent ID.
 
         Args:
             top_comment_id (str): Comment ID of the topLevelComment.
-            file (TextIO): file to append the comments.
+            video_id (str): ID of the YouTube video, stored with every reply.
+            writer (RawCommentWriter): raw comments writer.
             quota_remaining (int): Quota left for usage.
+            next_page_token (str | None): Resumes the replies from this page.
         Returns:
-            tuple(int, int): Total quota used and replies count processed.
+            tuple(int, int, str | None, bool, bool): Total quota used, replies count processed,
+            next page token (if not finished), finished bool and whether the API quota ran out.
     """
 
     COMMENTS_QUOTA_COST = 1
     current_quota_usage = 0
     replies_count = 0
-    next_page_token = None
 
     try:
         with build(API_SERVICE_NAME, API_VERSION, developerKey=API_KEY) as youtube:
@@ -353,45 +433,192 @@ def save_comment_replies(top_comment_id: str, file: TextIO, quota_remaining: int
                 )
 
                 request = youtube.comments().list(**params)
-                response = request.execute()
+                response = execute_request(request, "comments.list", COMMENTS_QUOTA_COST)
                 current_quota_usage += COMMENTS_QUOTA_COST
 
                 next_page_token = response.get('nextPageToken')
 
                 for item in response.get('items', []):
-                    file.write(json.dumps(item, ensure_ascii=False) + '\n')
+                    writer.write(flatten_comment(item, video_id))
                     replies_count += 1
+                metrics.inc("comments_saved_total", len(response.get('items', [])), kind="reply")
 
                 if not next_page_token:
                     break
-        return (current_quota_usage, replies_count)
+        return (current_quota_usage, replies_count, next_page_token, next_page_token is None, False)
 
     except (KeyError, IndexError, TypeError):
         logging.error(f"There was an error parsing the resource for comment {top_comment_id}")
-    except HttpError as e:
-        if e.resp.status == 403 and "quotaExceeded" in str(e):
+    except (HttpError, QuotaExhausted) as e:
+        if is_quota_error(e):
             logging.error(f'Quota limit exceeded in replies for top comment {top_comment_id}')
-            return (float('inf'), replies_count)
+            return (current_quota_usage, replies_count, next_page_token, False, True)
+        if e.resp.status == 404:
+            # the thread was deleted, nothing left to fetch
+            logging.info(f"Top comment {top_comment_id} no longer exists, skipping its replies.")
+            return (current_quota_usage, replies_count, None, True, False)
         logging.error(f"An error has occurred for top comment {top_comment_id}, {e}.")
     except (OSError, IOError) as e:
         logging.error(f"A system-level error has occurred for top  comment {top_comment_id}: {e}")
             
-    return (current_quota_usage, replies_count)
+    return (current_quota_usage, replies_count, next_page_token, False, False)
+
+def load_reply_queue(queue_location: str) -> dict:
+    """
+    Loads the reply threads state: {threadId: {videoId, totalReplyCount, done, nextPageToken}}.
+    Returns an empty queue if the file does not exist yet.
+
+    Args:
+        queue_location (str): Path of the JSON reply threads file.
+    """
+    if not os.path.exists(queue_location):
+        return {}
+    with open(queue_location, 'r') as file:
+        return json.load(file)
+
+def save_reply_queue(reply_queue: dict, queue_location: str) -> None:
+    """
+    Saves the reply threads state, replacing the file atomically.
+
+    Args:
+        reply_queue (dict): Reply threads state.
+        queue_location (str): Path of the JSON reply threads file.
+    """
+    try:
+        with open(queue_location + '.tmp', 'w') as file:
+            json.dump(reply_queue, file, indent=4)
+        os.replace(queue_location + '.tmp', queue_location)
+    except IOError as e:
+        logging.error(f"Failed to save reply threads progress: {e}")
 
-def save_all_videos_comments(videos_location: str, comments_location: str, debugging: bool, log_every_count: int = 1) -> None:
+def queue_reply_thread(reply_queue: dict, thread_id: str, video_id: str, total_reply_count: int) -> bool:
+    """
+    Records a thread whose replies must be fetched separately. Threads already queued, or already
+    fetched, with the same totalReplyCount are left untouched so their replies are not downloaded again.
+
+    Args:
+        reply_queue (dict): Reply threads state.
+        thread_id (str): Comment ID of the topLevelComment.
+        video_id (str): ID of the YouTube video.
+        total_reply_count (int): totalReplyCount reported by the thread.
+    Returns:
+        bool: True if the thread was (re)queued.
+    """
+    entry = reply_queue.get(thread_id)
+    if entry is not None and entry['totalReplyCount'] == total_reply_count:
+        metrics.inc("reply_threads_skipped_total")
+        return False
+
+    reply_queue[thread_id] = {'videoId': video_id, 'totalReplyCount': total_reply_count, 'done': False, 'nextPageToken': None}
+    metrics.inc("reply_threads_queued_total")
+    return True
+
+def save_queued_replies(reply_queue: dict, queue_location: str, writer: RawCommentWriter, quota_remaining: int, save_every_count: int = 50) -> tuple[int, int, bool, bool]:
+    """
+    Drains the pending reply threads into the raw comments storage, resuming every thread
+    from its saved page. The queue state is saved periodically and when the phase ends,
+    always after a writer checkpoint.
+
+    Args:
+        reply_queue (dict): Reply threads state.
+        queue_location (str): Path of the JSON reply threads file.
+        writer (RawCommentWriter): raw comments writer.
+        quota_remaining (int): Quota left for usage.
+        save_every_count (int): Threads processed between state saves.
+    Returns:
+        tuple(int, int, bool, bool): quota used, replies count, whether every thread is done and
+        whether the API quota ran out.
+    """
+    current_quota_usage = 0
+    replies_count = 0
+    threads_count = 0
+    quota_exhausted = False
+
+    try:
+        for thread_id, entry in reply_queue.items():
+            if entry['done']:
+                continue
+            if current_quota_usage >= quota_remaining:
+                break
+
+            quota_used, thread_replies_count, next_page_token, done, quota_exhausted = save_comment_replies(
+                thread_id, entry['videoId'], writer, quota_remaining - current_quota_usage, entry['nextPageToken'])
+            current_quota_usage += quota_used
+            replies_count += thread_replies_count
+            threads_count += 1
+
+            entry['nextPageToken'] = next_page_token
+            entry['done'] = done
+
+            if quota_exhausted:
+                break
+            if threads_count % save_every_count == 0:
+                writer.checkpoint()
+                save_reply_queue(reply_queue, queue_location)
+    except (OSError, IOError) as e:
+        logging.error(f"A system-level error has occurred while saving replies: {e}")
+    finally:
+        writer.checkpoint()
+        save_reply_queue(reply_queue, queue_location)
+
+    finished = all(entry['done'] for entry in reply_queue.values())
+    logging.info(f"Replies phase: {threads_count} threads processed, {replies_count} replies saved. Finished: {finished}")
+    return (current_quota_usage, replies_count, finished, quota_exhausted)
+
+def get_replies_progress(queue_location: str) -> dict[str: int] | None:
+    """
+    Returns the current progress as dict for all queued reply threads:
+    {done: int, half_way: int, undone: int}
+
+    Args:
+        queue_location (str): Path of the JSON reply threads file.
+
+    Returns:
+        dict(str, int): Progress for reply threads.
+    """
+    try:
+        reply_queue = load_reply_queue(queue_location)
+        result = {'done': 0, 'half_way': 0, 'undone': 0}
+        for entry in reply_queue.values():
+            if entry['done']:
+                result['done'] += 1
+            elif entry['nextPageToken'] != None:
+                result['half_way'] += 1
+            else:
+                result['undone'] += 1
+        return result
+    except json.JSONDecodeError:
+        logging.error("Error: file is not valid JSON.")
+    except KeyError:
+        logging.error("Error: the given file has the incorrect format.")
+    return None
+
+def save_all_videos_comments(videos_location: str, comments_location: str, debugging: bool, log_every_count: int = 1,
+                             replies_location: str | None = None, daily_quota: int | None = None) -> int:
     """
     Reads the videos from a file and fetches the comments for them.
     If a video is finished it is marked as done.
     If a video is left unfinished the nextPageToken is saved, for later processing.
 
+    Threads with more than 5 replies are queued in the replies file and drained in a separate
+    phase under the same daily quota: pending threads from previous runs first, then the
+    threads queued during this run with the quota left.
+
     Args:
         videos_location (str): Location to the JSON file containing the videos.
-        comments_location (str): Location to the NDJSON file containing the comments.
+        comments_location (str): Location of the raw comments (`Paths.raw_comments_file_path`),
+            written as compressed segments next to it, see `src.raw_storage`.
         debugging (bool): Makes a test run, with only 50 units.
         log_every_count (int): The program will report every count of videos.
+        replies_location (str | None): Location of the JSON reply threads file,
+            defaults to `<videos file>_replies.json` (see `Paths.reply_threads_file_path`).
+        daily_quota (int | None): Units this run may spend, defaults to 9900 (10 when debugging).
+
+    Returns:
+        int: Quota units used (charged to the API).
     """
 
-    DAILY_QUOTA = 10 if debugging else 9900
+    DAILY_QUOTA = daily_quota if daily_quota is not None else (10 if debugging else 9900)
     current_quota_usage = 0
     skiped_videos = 0
     current_videos_count = 0
@@ -400,76 +627,114 @@ def save_all_videos_comments(videos_location: str, comments_location: str, debug
     start_time = time.time()
     if log_every_count <= 0:
         log_every_count = 1 # fallback
+    if replies_location is None:
+        replies_location = os.path.splitext(videos_location)[0] + "_replies.json"
+    reply_queue = None
+    quota_exhausted = False
+    writer = RawCommentWriter(comments_location)
 
     #load all videos
     logging.info("Comments fetch initialized...")
-    try:
-        with open(videos_location, 'r') as file:
-            videos = json.load(file)
-        logging.info(f"Videos list from {videos_location} loaded successfully.")
-
-        for video in videos:
-            if video['done'] == False:
-                video_id = video['videoId']
-                next_page_token = video['nextPageToken']
-
-                if next_page_token != None:
-                    logging.info(f"Resuming comments fetch for video {video_id} from page {next_page_token}")
-
-                quota_video_used, next_page_token, video_comments_count, video_replies_count, done = save_video_comments(video_id, next_page_token, comments_location, DAILY_QUOTA - current_quota_usage)
-
-                current_comments_count += video_comments_count
-                current_replies_count += video_replies_count
-                current_quota_usage += quota_video_used
-                current_videos_count += 1
-
-                # save page
-                video['nextPageToken'] = next_page_token
-
-                # quota_met
-                if current_quota_usage >= DAILY_QUOTA:
-                    logging.info(f"Daily quota limit reached, {current_videos_count} videos saved.")
+    with metrics.stage("harvest"):
+        try:
+            with open(videos_location, 'r') as file:
+                videos = json.load(file)
+            logging.info(f"Videos list from {videos_location} loaded successfully.")
+
+            # replies left pending by previous runs go first
+            reply_queue = load_reply_queue(replies_location)
+            quota_replies_used, replies_phase_count, _, quota_exhausted = save_queued_replies(reply_queue, replies_location, writer, DAILY_QUOTA)
+            current_quota_usage += quota_replies_used
+            current_replies_count += replies_phase_count
+
+            for video in videos:
+                # the replies phase may have used the whole quota
+                if quota_exhausted or current_quota_usage >= DAILY_QUOTA:
+                    logging.info("Daily quota limit reached before fetching more videos.")
                     break
 
-                # Report every single video
-                if log_every_count == 1:
-                    elapsed = time.time() - start_time
-                    logging.info(f"Video {video_id} processed. Finished: {done}. Comments: {video_comments_count}, Replies: {video_replies_count}")
-
-                # Report every count of videos
-                elif current_videos_count % log_every_count == 0:
-                    elapsed = time.time() - start_time
-                    logging.info(f"{current_videos_count} videos processed ({elapsed:.2f}s), current comments: {current_comments_count}, current replies: {current_replies_count}")
-
-                # video done
-                if done:
-                    video['done'] = True
-                
-                # save progress after each video is processed
-                try:
-                    with open(videos_location, 'w') as file:
-                        json.dump(videos, file, indent=4)
-                except IOError as e:
-                    logging.error(f"Failed to save progress for video {video_id}: {e}")
-            else:
-                skiped_videos += 1
-
-        end_time = time.time() - start_time
-        logging.info(f"Success. Skipped: {skiped_videos}, Processed: {current_videos_count}, Comments: {current_comments_count}, Replies: {current_replies_count}. ({end_time:.2f}s)")
-    except json.JSONDecodeError:
-        logging.error("Error: File is not valid JSON")
-    except KeyError:
-        logging.error("Error parsing JSON")
-    except (OSError, IOError) as e:
-        logging.error(f"A system-level error has occurred {e}")
-    finally:
-        #save videos list
-        try:
-            with open(videos_location, 'w') as file:
-                json.dump(videos, file, indent=4)
-            logging.info(f"Videos saved successfully, videos count: {current_videos_count}, comments & replies: {current_comments_count + current_replies_count}")
-        except IOError as e:
-            logging.error(f"Failed to save progress to file: {e}")
+                if video['done'] == False:
+                    video_id = video['videoId']
+                    next_page_token = video['nextPageToken']
+
+                    if next_page_token != None:
+                        logging.info(f"Resuming comments fetch for video {video_id} from page {next_page_token}")
+
+                    quota_video_used, next_page_token, video_comments_count, video_replies_count, done, quota_exhausted = save_video_comments(video_id, next_page_token, writer, DAILY_QUOTA - current_quota_usage, reply_queue)
+
+                    current_comments_count += video_comments_count
+                    current_replies_count += video_replies_count
+                    current_quota_usage += quota_video_used
+                    current_videos_count += 1
+
+                    # save page
+                    video['nextPageToken'] = next_page_token
+
+                    metrics.inc("videos_processed_total", done=done)
+                    metrics.set_gauge("quota_remaining", max(0, DAILY_QUOTA - current_quota_usage))
+                    metrics.event("video", video_id=video_id, done=done, comments=video_comments_count,
+                                  replies=video_replies_count, quota_used=quota_video_used)
+
+                    # video done, also when it used the last units
+                    if done:
+                        video['done'] = True
+
+                    # quota_met, progress is saved on the way out
+                    if quota_exhausted or current_quota_usage >= DAILY_QUOTA:
+                        logging.info(f"Daily quota limit reached, {current_videos_count} videos saved.")
+                        break
+
+                    # Report every single video
+                    if log_every_count == 1:
+                        elapsed = time.time() - start_time
+                        logging.info(f"Video {video_id} processed. Finished: {done}. Comments: {video_comments_count}, Replies: {video_replies_count}")
+
+                    # Report every count of videos
+                    elif current_videos_count % log_every_count == 0:
+                        elapsed = time.time() - start_time
+                        logging.info(f"{current_videos_count} videos processed ({elapsed:.2f}s), current comments: {current_comments_count}, current replies: {current_replies_count}")
+
+                    # save progress after each video is processed, once its comments are on disk,
+                    # and queued threads along with the pages that found them
+                    writer.checkpoint()
+                    save_reply_queue(reply_queue, replies_location)
+                    try:
+                        with open(videos_location, 'w') as file:
+                            json.dump(videos, file, indent=4)
+                    except IOError as e:
+                        logging.error(f"Failed to save progress for video {video_id}: {e}")
+                else:
+                    skiped_videos += 1
+
+            # replies queued during this run, with the quota left
+            if not quota_exhausted and current_quota_usage < DAILY_QUOTA:
+                quota_replies_used, replies_phase_count, _, quota_exhausted = save_queued_replies(reply_queue, replies_location, writer, DAILY_QUOTA - current_quota_usage)
+                current_quota_usage += quota_replies_used
+                current_replies_count += replies_phase_count
+
+            end_time = time.time() - start_time
+            logging.info(f"Success. Skipped: {skiped_videos}, Processed: {current_videos_count}, Comments: {current_comments_count}, Replies: {current_replies_count}. ({end_time:.2f}s)")
+        except json.JSONDecodeError:
+            logging.error("Error: File is not valid JSON")
+        except KeyError:
+            logging.error("Error parsing JSON")
+        except (OSError, IOError) as e:
+            logging.error(f"A system-level error has occurred {e}")
+        finally:
+            #save videos list and reply threads, once the comments are on disk
+            try:
+                writer.close()
+            except (OSError, IOError) as e:
+                logging.error(f"Failed to close the raw comments storage: {e}")
+            if reply_queue is not None:
+                save_reply_queue(reply_queue, replies_location)
+            try:
+                with open(videos_location, 'w') as file:
+                    json.dump(videos, file, indent=4)
+                logging.info(f"Videos saved successfully, videos count: {current_videos_count}, comments & replies: {current_comments_count + current_replies_count}")
+            except IOError as e:
+                logging.error(f"Failed to save progress to file: {e}")
+    return current_quota_usage
 
 def get_videos_progress(videos_location: str) -> dict[str: int] | None:
     """
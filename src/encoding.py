@@ -0,0 +1,128 @@
+from typing import List, Optional
+from src.metrics import metrics
+from src.locks import file_lock
+import polars as pl
+import threading
+import os
+
+# list columns of the enriched files stored as vocabulary ids
+ENCODED_LIST_COLUMNS = ["tokens_simple", "tokens_wo_stop", "emojis", "mentions", "hashtags"]
+TOKEN_ID = pl.UInt32
+
+# narrowest types of the clean columns, fixed so the daily files share one schema
+# (comments are at most 10,000 characters long)
+CLEAN_DTYPES = {
+    "video_id": pl.Categorical,
+    "channel_id": pl.Categorical,
+    "author_id": pl.Categorical,
+    "lang": pl.Categorical,
+    "script": pl.Enum(["korean", "latin", "other"]),
+    "likes": pl.UInt32,
+    "reply_count": pl.UInt32,
+    "comment_length": pl.UInt16,
+    "word_count": pl.UInt16,
+    "emoji_count": pl.UInt16,
+}
+
+def compact_dtypes(df: pl.DataFrame | pl.LazyFrame, dtypes: dict = CLEAN_DTYPES) -> pl.DataFrame | pl.LazyFrame:
+    """Casts the columns of `dtypes` present in `df`, low cardinality strings to categories and counts to small unsigned ints."""
+    columns = df.collect_schema().names()
+    return df.with_columns([pl.col(c).cast(dtype) for c, dtype in dtypes.items() if c in columns])
+
+def scan_clean_files(files: List[str]) -> pl.LazyFrame:
+    """
+    The clean files as one LazyFrame with the compact dtypes, also for files written before them
+    or before the analyzers added their columns.
+    """
+    return pl.concat([compact_dtypes(pl.scan_parquet(f)) for f in files], how="diagonal_relaxed")
+
+class Vocabulary:
+    """
+    Global vocabulary of the tokens, emojis, mentions and hashtags of a channel, with stable
+    UInt32 ids: a token keeps its id forever, new tokens get the next ones. Stored as a
+    Parquet file (`id`, `token`), see `Paths.vocabulary_file_path`.
+
+    New ids are saved before they are handed out, under a file lock and after reading the ids
+    other processes saved meanwhile, so every process (and every file it writes) agrees on the
+    id of a token. Encoding is thread-safe, so concurrent enrichment runs can share one instance.
+    """
+    def __init__(self, vocabulary_file_path: str):
+        self.path = vocabulary_file_path
+        self._lock = threading.Lock()
+        self.frame = pl.DataFrame(schema={"id": TOKEN_ID, "token": pl.Utf8})
+        self._signature = None
+        self._reload()
+
+    def __len__(self) -> int:
+        return self.frame.height
+
+    def _reload(self) -> None:
+        """Reads the saved vocabulary if it changed since it was last read, it holds every id of this one."""
+        if not os.path.exists(self.path):
+            return
+        stat = os.stat(self.path)
+        signature = (stat.st_size, stat.st_mtime_ns)
+        if signature != self._signature:
+            self.frame = pl.read_parquet(self.path).select(["id", "token"])
+            self._signature = signature
+
+    def add(self, tokens: pl.Series) -> None:
+        """Gives ids to the tokens not in the vocabulary yet, and saves them."""
+        tokens = tokens.drop_nulls().unique(maintain_order=True).to_frame("token")
+        with self._lock:
+            if tokens.join(self.frame, on="token", how="anti").is_empty():
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with file_lock(self.path + ".lock"):
+                self._reload()
+                new = tokens.join(self.frame, on="token", how="anti")
+                if new.is_empty():
+                    return
+                new = new.with_columns(pl.int_range(len(self), len(self) + new.height, dtype=TOKEN_ID).alias("id"))
+                frame = pl.concat([self.frame, new.select(["id", "token"])])
+                frame.write_parquet(self.path + ".tmp")
+                os.replace(self.path + ".tmp", self.path)
+                self.frame = frame
+                stat = os.stat(self.path)
+                self._signature = (stat.st_size, stat.st_mtime_ns)
+            metrics.inc("vocabulary_tokens_added_total", new.height)
+
+    def encode(self, series: pl.Series) -> pl.Series:
+        """List[Utf8] -> List[UInt32], adding the unknown tokens to the vocabulary."""
+        self.add(series.explode())
+        frame = self.frame
+        return series.list.eval(pl.element().replace_strict(frame["token"], frame["id"], return_dtype=TOKEN_ID))
+
+    def decode(self, series: pl.Series) -> pl.Series:
+        """List[UInt32] -> List[Utf8]."""
+        frame = self.frame
+        return series.list.eval(pl.element().replace_strict(frame["id"], frame["token"], return_dtype=pl.Utf8))
+
+    def decode_ids(self, ids: pl.Series) -> pl.Series:
+        """UInt32 ids -> tokens."""
+        return ids.replace_strict(self.frame["id"], self.frame["token"], return_dtype=pl.Utf8)
+
+def is_encoded(df: pl.DataFrame | pl.LazyFrame, column: str) -> bool:
+    return df.collect_schema()[column] == pl.List(TOKEN_ID)
+
+def encode_lists(df: pl.DataFrame, vocabulary: Vocabulary, columns: List[str] = ENCODED_LIST_COLUMNS) -> pl.DataFrame:
+    """Replaces the List[Utf8] `columns` of `df` by their vocabulary ids."""
+    columns = [c for c in columns if c in df.columns and not is_encoded(df, c)]
+    if columns:
+        # one save for the new tokens of every column
+        vocabulary.add(pl.concat([df[c].explode().alias("token") for c in columns]))
+    return df.with_columns([vocabulary.encode(df[c]) for c in columns])
+
+def decode_lists(df: pl.DataFrame, vocabulary: Vocabulary, columns: List[str] = ENCODED_LIST_COLUMNS) -> pl.DataFrame:
+    """Replaces the encoded `columns` of `df` by their tokens."""
+    return df.with_columns([
+        vocabulary.decode(df[c]) for c in columns if c in df.columns and is_encoded(df, c)
+    ])
+
+def read_enriched(enriched_comments_file_path: str, vocabulary: Optional[Vocabulary] = None,
+                  columns: Optional[List[str]] = None) -> pl.DataFrame:
+    """Reads an enriched file with its list columns as tokens, encoded or not."""
+    df = pl.read_parquet(enriched_comments_file_path, columns=columns)
+    if vocabulary is None:
+        return df
+    return decode_lists(df, vocabulary)
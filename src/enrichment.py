@@ -0,0 +1,51 @@
+from typing import Optional
+from src.preprocessing import tokenize_mixed, extract_emojis, extract_mentions, extract_hashtags
+from src.encoding import Vocabulary, encode_lists
+import polars as pl
+
+# same enrichers as notebook 02_2
+def add_tokens_simple(df: pl.DataFrame) -> pl.Series:
+    return df["comment"].map_elements(lambda t: tokenize_mixed(t, keep_stopwords=True), return_dtype=pl.List(pl.Utf8))
+
+def add_tokens_wo_stop(df: pl.DataFrame) -> pl.Series:
+    return df["comment"].map_elements(lambda t: tokenize_mixed(t, keep_stopwords=False), return_dtype=pl.List(pl.Utf8))
+
+def add_emojis(df: pl.DataFrame) -> pl.Series:
+    return df["comment"].map_elements(lambda t: extract_emojis(t), return_dtype=pl.List(pl.Utf8))
+
+def add_mentions(df: pl.DataFrame) -> pl.Series:
+    return df['comment'].map_elements(lambda t: extract_mentions(t), return_dtype=pl.List(pl.Utf8))
+
+def add_hashtags(df: pl.DataFrame) -> pl.Series:
+    return df['comment'].map_elements(lambda t: extract_hashtags(t), return_dtype=pl.List(pl.Utf8))
+
+ENRICHERS = {
+    "tokens_simple": add_tokens_simple,
+    "tokens_wo_stop": add_tokens_wo_stop,
+    "emojis": add_emojis,
+    "mentions": add_mentions,
+    "hashtags": add_hashtags
+}
+
+def add_or_patch_columns(df: pl.DataFrame, enrichers: dict = ENRICHERS) -> pl.DataFrame:
+    """Apply only the enrichers whose column is missing from `df`."""
+    missing = [col for col in enrichers if col not in df.columns]
+    for col in missing:
+        df = df.with_columns([
+            enrichers[col](df).alias(col)
+        ])
+    return df
+
+def enrich_comments(clean_comments_file_path: str, enriched_comments_file_path: str,
+                    vocabulary: Optional[Vocabulary] = None) -> None:
+    """
+    Headless version of the `02_2_enriched_columns` notebook: adds the token, emoji, mention
+    and hashtag columns to the clean comments of a day and saves them without the text.
+    With a `vocabulary`, the list columns are stored as List[UInt32] token ids.
+    """
+    df = pl.read_parquet(clean_comments_file_path, columns=['comment_id', 'comment'])
+    df = add_or_patch_columns(df, ENRICHERS)
+    if vocabulary is not None:
+        # saves the new ids before the file refers to them
+        df = encode_lists(df, vocabulary)
+    df.drop("comment").write_parquet(enriched_comments_file_path, compression='zstd')
@@ -0,0 +1,154 @@
+"""
+Multi-channel harvest: the comments of many channels under the pooled quota of many API keys.
+
+Every round splits the quota left in the key pool among the channels by their weight and
+harvests them concurrently. Channels with nothing left to fetch drop out, the others share
+what is left in the next round, until the pool is spent or every channel is done.
+
+Usage, from the project root:
+    python -m src.harvest                                   # config.channel_weights
+    python -m src.harvest --channels kurzgesagt:2,veritasium:1 --workers 4
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, List
+import argparse
+import logging
+import os
+
+import config
+from paths import Paths
+from src.quota import KeyPool, QuotaExhausted, next_reset
+from src.metrics import metrics
+from src.data_acquisition import (
+    use_key_pool, save_all_videos_comments, get_channel_uploads_playlist, save_playlist_videos,
+    get_videos_progress, get_replies_progress
+)
+from src.utils import get_channel_id
+
+def fair_shares(weights: Dict[str, float], total: int) -> Dict[str, int]:
+    """Splits `total` units by weight, the remainder units go to the heaviest channels."""
+    weight_sum = sum(weights.values())
+    if weight_sum <= 0:
+        return {channel: 0 for channel in weights}
+    shares = {channel: int(total * w // weight_sum) for channel, w in weights.items()}
+    leftover = total - sum(shares.values())
+    for channel in sorted(weights, key=weights.get, reverse=True)[:leftover]:
+        shares[channel] += 1
+    return shares
+
+def has_pending_work(channel_paths: Paths) -> bool:
+    """Videos or reply threads of the channel not fully harvested yet."""
+    videos = get_videos_progress(channel_paths.videos_file_path) or {}
+    replies = get_replies_progress(channel_paths.reply_threads_file_path) or {}
+    return any(progress.get("half_way", 0) + progress.get("undone", 0) for progress in (videos, replies))
+
+def harvest_channel(channel_handle: str, pool: KeyPool, quota_budget: Optional[int] = None, debugging: bool = False,
+                    log_every_count: int = 10, channel_paths: Optional[Paths] = None) -> tuple[int, bool]:
+    """
+    Harvests today's comments of one channel, spending at most `quota_budget` units of the pool
+    (everything left in it by default, 10 units when debugging).
+
+    Returns:
+        tuple(int, bool): units charged to the pool, and whether the channel has work left.
+    """
+    channel_paths = channel_paths or Paths(channel_handle)
+    if quota_budget is None:
+        quota_budget = 10 if debugging else pool.remaining()
+    with use_key_pool(pool) as usage:
+        try:
+            if not os.path.exists(channel_paths.videos_file_path):
+                # channel and playlist lookups, charged to the pool like any other call
+                channel_id = get_channel_id(channel_handle)
+                if channel_id is None:
+                    return usage["units"], False
+                uploads_playlist_id = get_channel_uploads_playlist(channel_id)
+                save_playlist_videos(uploads_playlist_id, channel_paths.videos_file_path)
+            save_all_videos_comments(
+                channel_paths.videos_file_path, channel_paths.raw_comments_file_path, debugging=debugging,
+                log_every_count=log_every_count, replies_location=channel_paths.reply_threads_file_path,
+                daily_quota=max(0, quota_budget - usage["units"]))
+        except QuotaExhausted as e:
+            logging.warning(f"[{channel_handle}] {e}")
+    metrics.inc("channel_quota_units_total", usage["units"], channel=channel_handle)
+    return usage["units"], has_pending_work(channel_paths)
+
+def harvest_channels(weights: Dict[str, float], pool: KeyPool, max_workers: int = 4, min_budget: int = 50,
+                     debugging: bool = False, log_every_count: int = 10, base_dir: Optional[str] = None) -> Dict[str, int]:
+    """
+    Harvests every channel of `weights` (handle -> weight) with fair shares of the pool quota.
+
+    Args:
+        min_budget (int): smallest share worth a run, rounds stop below it.
+        base_dir (str | None): project root of the data files, see `Paths`.
+    Returns:
+        Dict[str, int]: units used per channel.
+    """
+    used = {channel: 0 for channel in weights}
+    active = {channel: w for channel, w in weights.items() if w > 0}
+    round_index = 0
+
+    with metrics.stage("multi_harvest", sample_resources=False):
+        while active:
+            remaining = pool.remaining()
+            budgets = {c: b for c, b in fair_shares(active, remaining).items() if b >= min_budget}
+            if not budgets:
+                logging.info(f"Quota left ({remaining} units) is below the minimum share, next reset at {next_reset().isoformat()}.")
+                break
+
+            round_index += 1
+            logging.info(f"Harvest round {round_index}: {budgets}")
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {
+                    channel: executor.submit(harvest_channel, channel, pool, budget, debugging, log_every_count,
+                                             Paths(channel, base_dir=base_dir))
+                    for channel, budget in budgets.items()
+                }
+            for channel, future in futures.items():
+                try:
+                    channel_used, pending = future.result()
+                except Exception as e:
+                    logging.error(f"[{channel}] harvest failed: {e}")
+                    channel_used, pending = 0, False
+                used[channel] += channel_used
+                # done, or no progress with a whole share (failing videos only)
+                if not pending or channel_used == 0:
+                    active.pop(channel)
+                metrics.event("channel_round", channel=channel, round=round_index,
+                              budget=budgets[channel], used=channel_used)
+            # channels without a share this round have nothing to wait for
+            for channel in [c for c in active if c not in budgets]:
+                active.pop(channel)
+            if debugging:
+                break
+
+    pool.flush()
+    logging.info(f"Multi-channel harvest finished, units used per channel: {used}")
+    return used
+
+def parse_channels(value: Optional[str]) -> Dict[str, float]:
+    """"handle:weight,handle" -> {handle: weight}, weight 1 by default."""
+    if not value:
+        return dict(config.channel_weights)
+    channels = {}
+    for item in value.split(","):
+        handle, _, weight = item.strip().lstrip("@").partition(":")
+        if handle:
+            channels[handle] = float(weight) if weight else 1.0
+    return channels
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Harvest the comments of many channels with a pool of API keys.")
+    parser.add_argument("--channels", default=None, help="handle:weight,... defaults to config.channel_weights")
+    parser.add_argument("--workers", type=int, default=4, help="channels harvested concurrently")
+    parser.add_argument("--min-budget", type=int, default=50, help="smallest quota share worth a run")
+    parser.add_argument("--log-every", type=int, default=10, help="progress report every count of videos")
+    parser.add_argument("--debugging", action="store_true", help="a single round with the given budget")
+    options = parser.parse_args(argv)
+
+    pool = KeyPool(config.API_KEYS)
+    used = harvest_channels(parse_channels(options.channels), pool, max_workers=options.workers,
+                            min_budget=options.min_budget, debugging=options.debugging, log_every_count=options.log_every)
+    return 0 if any(used.values()) else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,6 +1,14 @@
 from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
 from langdetect import detect_langs, DetectorFactory
 from tqdm.notebook import tqdm
+from src.metrics import metrics, track_batches
+from src.autotune import imap_autotuned
+from src.streaming import stream_analyzer, run_streaming
+from src.near_duplicates import REPRESENTATIVES
+from src.sampling import StratifiedSample
+from typing import Iterable, Iterator, List, Optional
+import polars as pl
 import time
 
 def init_workers():
@@ -18,23 +26,61 @@ def detect_single(text: str, min_confidence: int = 0.9) -> str:
     except Exception:
         return "und"
     
-def detect_parallel(texts, max_workers = 4, chunk_size = None):
+def detect_parallel(texts, max_workers = 4, chunk_size = None, autotune = False):
+    """
+    Detects the language of every text in a process pool.
+    With `autotune=True` the worker count and chunk size are picked by `src.autotune`
+    for the current machine (cached per host), and `max_workers`/`chunk_size` are ignored.
+    """
     if chunk_size == None:
         chunk_size = max(1, len(texts) // (max_workers * 4))
 
-    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_workers) as executor:
-        futures_iterator = executor.map(detect_single, texts, chunksize=chunk_size)
+    with metrics.stage("langdetect"), ExitStack() as stack:
+        if autotune:
+            futures_iterator = imap_autotuned(detect_single, init_workers, texts, analyzer="langdetect")
+        else:
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=max_workers, initializer=init_workers))
+            futures_iterator = executor.map(detect_single, texts, chunksize=chunk_size)
 
         # start tracking
         start = time.time()
         result = []
-        for r in tqdm(futures_iterator, total=len(texts)):
+        for r in tqdm(track_batches(futures_iterator, "langdetect", chunk_size), total=len(texts)):
             result.append(r)
         end = time.time()
+        metrics.set_gauge("throughput_items_per_second", len(texts)/(end - start), stage="langdetect")
 
     print(f"Finished translation in {end - start:.2f}s, {len(texts)/(end - start):.2f} c/s")
     return result
 
+def detect_stream(batches: Iterable[tuple[int, pl.DataFrame]], max_workers: int = 4, chunk_size: int = 1_000,
+                  max_in_flight: Optional[int] = None) -> Iterator[tuple[int, pl.DataFrame]]:
+    """
+    Streaming variant of `detect_parallel`: consumes (batch_index, DataFrame[comment_id, comment])
+    batches and yields (batch_index, DataFrame[comment_id, lang]) as they complete.
+    """
+    return stream_analyzer(batches, detect_single, init_workers, "lang", pl.Categorical,
+                           workers=max_workers, chunk_size=chunk_size, max_in_flight=max_in_flight)
+
+def detect_parquet(files: str | List[str], output_dir: str, batch_size: int = 50_000, max_workers: int = 4,
+                   chunk_size: int = 1_000, max_in_flight: Optional[int] = None,
+                   representatives_only: bool = False, predicate: Optional[pl.Expr] = None,
+                   sample: Optional[StratifiedSample] = None) -> int:
+    """
+    Out-of-core language detection over one or many clean Parquet files. Results are written
+    incrementally as `comment_id`/`lang` parts to `output_dir` and resumed on restart.
+    With `representatives_only`, near-duplicate comments are detected once per `dup_cluster_id`,
+    broadcast the results with `attach_results(..., broadcast_on="dup_cluster_id")`.
+    `predicate` restricts the run to some rows, `sample` to a stratified sample,
+    recorded in the resume manifest.
+    """
+    if sample is not None:
+        predicate = sample.predicate() if predicate is None else predicate & sample.predicate()
+    if representatives_only:
+        predicate = REPRESENTATIVES if predicate is None else REPRESENTATIVES & predicate
+    return run_streaming(files, output_dir, detect_single, init_workers, "lang", pl.Categorical, "langdetect",
+                         batch_size=batch_size, workers=max_workers, chunk_size=chunk_size, max_in_flight=max_in_flight,
+                         predicate=predicate, sample=None if sample is None else sample.descriptor())
 
 # (doesn't work on windows without this)
 if __name__ == "__main__":
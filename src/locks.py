@@ -0,0 +1,18 @@
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows, the lock is a no-op there
+    fcntl = None
+
+@contextmanager
+def file_lock(lock_path: str):
+    """Exclusive lock between processes on `lock_path`, for files several processes read and rewrite."""
+    with open(lock_path, "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,291 @@
+import os
+import json
+import time
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+
+# default histogram buckets in seconds, from a single fast API call up to a big analyzer batch
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(key: tuple, extra: Optional[dict] = None) -> str:
+    pairs = list(key) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + body + "}"
+
+class Histogram:
+    """Cumulative histogram with fixed upper bounds, Prometheus style."""
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1) # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        result = []
+        running = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            running += count
+            result.append(("+Inf" if bound == float('inf') else repr(bound), running))
+        return result
+
+class ResourceSampler:
+    """
+    Background thread sampling RSS and CPU usage of the current process and its children
+    (the process pool workers). Reusable replacement for the ad-hoc CPU monitor of the benchmarks.
+    """
+    def __init__(self, registry: "MetricsRegistry", interval: float = 1.0, stage: str = ""):
+        self.registry = registry
+        self.interval = interval
+        self.stage = stage
+        self.cpu_samples: list[float] = []
+        self.rss_samples: list[int] = []
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self) -> "ResourceSampler":
+        try:
+            import psutil
+        except ImportError:
+            logging.warning("psutil is not installed, resource sampling is disabled.")
+            return self
+
+        process = psutil.Process(os.getpid())
+        # first call primes the counter, psutil returns 0.0 for it
+        psutil.cpu_percent(interval=None)
+
+        def run():
+            while not self._stop_event.wait(self.interval):
+                self.sample(psutil, process)
+
+        self._thread = threading.Thread(target=run, name=f"resource-sampler-{self.stage}", daemon=True)
+        self._thread.start()
+        return self
+
+    def sample(self, psutil, process) -> None:
+        cpu = psutil.cpu_percent(interval=None)
+        try:
+            rss = process.memory_info().rss
+            for child in process.children(recursive=True):
+                try:
+                    rss += child.memory_info().rss
+                except psutil.Error:
+                    continue # worker exited between listing and reading
+        except psutil.Error:
+            return
+
+        self.cpu_samples.append(cpu)
+        self.rss_samples.append(rss)
+        self.registry.set_gauge("process_rss_bytes", rss, stage=self.stage)
+        self.registry.set_gauge("system_cpu_percent", cpu, stage=self.stage)
+        self.registry.event("resource", stage=self.stage, rss_bytes=rss, cpu_percent=cpu)
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    @property
+    def avg_cpu(self) -> float:
+        return sum(self.cpu_samples) / len(self.cpu_samples) if self.cpu_samples else 0.0
+
+    @property
+    def peak_rss(self) -> int:
+        return max(self.rss_samples) if self.rss_samples else 0
+
+class MetricsRegistry:
+    """
+    Thread-safe store of counters, gauges and latency histograms shared by all pipeline stages.
+
+    Events are appended as JSON lines to `jsonl_path` (if configured) and the aggregated state
+    can be exported as a Prometheus text snapshot.
+    """
+    def __init__(self, jsonl_path: Optional[str] = None, prometheus_path: Optional[str] = None, sample_interval: float = 1.0):
+        self._lock = threading.Lock()
+        self.counters: dict[str, dict[tuple, float]] = {}
+        self.gauges: dict[str, dict[tuple, float]] = {}
+        self.histograms: dict[str, dict[tuple, Histogram]] = {}
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.sample_interval = sample_interval
+
+    def configure(self, jsonl_path: Optional[str] = None, prometheus_path: Optional[str] = None, sample_interval: Optional[float] = None) -> None:
+        """Set the output files (usually from `Paths.metrics_log_file_path` and `Paths.metrics_snapshot_file_path`)."""
+        with self._lock:
+            self.jsonl_path = jsonl_path
+            self.prometheus_path = prometheus_path
+            if sample_interval is not None:
+                self.sample_interval = sample_interval
+
+    def reset(self) -> None:
+        """Drop all recorded values, output configuration is kept."""
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    # --- recording ---
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self.gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """Observe the wall time of the block into the histogram `name`, even if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def event(self, kind: str, **fields) -> None:
+        """Append a single JSON line event, no-op if no JSON-lines output is configured."""
+        if not self.jsonl_path:
+            return
+        record = {"ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"), "event": kind, **fields}
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        try:
+            with self._lock, open(self.jsonl_path, "a", encoding="utf-8") as file:
+                file.write(line)
+        except (OSError, IOError) as e:
+            logging.error(f"Failed to write metrics event: {e}")
+
+    @contextmanager
+    def stage(self, name: str, sample_resources: bool = True) -> Iterator[ResourceSampler]:
+        """
+        Wrap a pipeline stage: logs start and end events, samples process resources while it runs,
+        and writes a Prometheus snapshot when it finishes.
+
+        Args:
+            name (str): stage name (harvest, clean, enrich, langdetect, sentiment...).
+            sample_resources (bool): start a background RSS/CPU sampler for the stage.
+        """
+        sampler = ResourceSampler(self, interval=self.sample_interval, stage=name)
+        if sample_resources:
+            sampler.start()
+        self.event("stage_start", stage=name)
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            yield sampler
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            sampler.stop()
+            elapsed = time.perf_counter() - start
+            self.observe("stage_duration_seconds", elapsed, stage=name)
+            self.inc("stage_runs_total", stage=name, status=status)
+            self.event("stage_end", stage=name, status=status, duration_s=round(elapsed, 3),
+                       avg_cpu_percent=round(sampler.avg_cpu, 2), peak_rss_bytes=sampler.peak_rss,
+                       counters=self.snapshot()["counters"])
+            if self.prometheus_path:
+                self.write_prometheus(self.prometheus_path)
+
+    # --- export ---
+    def snapshot(self) -> dict:
+        """Return counters, gauges and histogram summaries as plain JSON-serializable dicts."""
+        def flat(key: tuple) -> str:
+            return ",".join(f"{k}={v}" for k, v in key)
+
+        with self._lock:
+            return {
+                "counters": {name: {flat(k): v for k, v in series.items()} for name, series in self.counters.items()},
+                "gauges": {name: {flat(k): v for k, v in series.items()} for name, series in self.gauges.items()},
+                "histograms": {
+                    name: {flat(k): {"count": h.count, "sum": round(h.sum, 6)} for k, h in series.items()}
+                    for name, series in self.histograms.items()
+                },
+            }
+
+    def to_prometheus(self) -> str:
+        """Render the current state in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                lines.extend(f"{name}{_format_labels(k)} {v}" for k, v in series.items())
+            for name, series in sorted(self.gauges.items()):
+                lines.append(f"# TYPE {name} gauge")
+                lines.extend(f"{name}{_format_labels(k)} {v}" for k, v in series.items())
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for k, hist in series.items():
+                    for bound, count in hist.cumulative():
+                        lines.append(f"{name}_bucket{_format_labels(k, {'le': bound})} {count}")
+                    lines.append(f"{name}_sum{_format_labels(k)} {hist.sum}")
+                    lines.append(f"{name}_count{_format_labels(k)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """Write the Prometheus snapshot atomically, so a scraper never reads a partial file."""
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                file.write(self.to_prometheus())
+            os.replace(tmp_path, path)
+        except (OSError, IOError) as e:
+            logging.error(f"Failed to write metrics snapshot to {path}: {e}")
+
+# shared registry, every stage records into it
+metrics = MetricsRegistry()
+
+def track_batches(iterator, stage: str, batch_size: int) -> Iterator:
+    """
+    Pass-through generator for analyzer results that records items processed and the latency
+    of every `batch_size` items into the shared registry.
+
+    Args:
+        iterator (Iterator): results as they are produced, e.g. from `executor.map`.
+        stage (str): stage label.
+        batch_size (int): number of items per recorded batch, usually the pool chunk size.
+    """
+    batch_size = max(1, batch_size)
+    in_batch = 0
+    batch_start = time.perf_counter()
+    for item in iterator:
+        yield item
+        in_batch += 1
+        if in_batch == batch_size:
+            elapsed = time.perf_counter() - batch_start
+            metrics.inc("items_processed_total", in_batch, stage=stage)
+            metrics.observe("batch_latency_seconds", elapsed, stage=stage)
+            metrics.event("batch", stage=stage, items=in_batch, duration_s=round(elapsed, 4))
+            in_batch = 0
+            batch_start = time.perf_counter()
+    if in_batch:
+        elapsed = time.perf_counter() - batch_start
+        metrics.inc("items_processed_total", in_batch, stage=stage)
+        metrics.observe("batch_latency_seconds", elapsed, stage=stage)
+        metrics.event("batch", stage=stage, items=in_batch, duration_s=round(elapsed, 4))
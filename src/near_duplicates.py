@@ -0,0 +1,263 @@
+from typing import List
+from src.metrics import metrics
+import numpy as np
+import polars as pl
+import logging
+import json
+import zlib
+import re
+import os
+
+# rows analyzed once per cluster, see `dup_representative`
+REPRESENTATIVES = pl.col("dup_representative").fill_null(True)
+
+DEFAULT_NUM_PERM = 128
+DEFAULT_BANDS = 16  # 8 rows per band, candidate pairs from a Jaccard similarity of ~0.7
+DEFAULT_THRESHOLD = 0.8
+SHINGLE_SIZE = 5
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+# shingles hashed at once, and permutations per pass over them: 16 x 100k uint64 is ~13 MB
+MAX_SHINGLES = 100_000
+PERM_BLOCK = 16
+
+html_tag_re = re.compile(r"<[^>]+>")
+space_re = re.compile(r"\s+")
+
+def normalize(text: str) -> str:
+    """Lowercase text without HTML tags (textDisplay keeps them) and repeated whitespace."""
+    if not isinstance(text, str):
+        return ""
+    return space_re.sub(" ", html_tag_re.sub(" ", text)).strip().lower()
+
+def shingle_hashes(text: str, k: int = SHINGLE_SIZE) -> np.ndarray:
+    """32 bit hashes of the character k-grams of a normalized text, a text shorter than k is one shingle."""
+    if len(text) <= k:
+        return np.array([zlib.crc32(text.encode())], dtype=np.uint64)
+    return np.unique(np.fromiter(
+        (zlib.crc32(text[i:i + k].encode()) for i in range(len(text) - k + 1)),
+        dtype=np.uint64, count=len(text) - k + 1
+    ))
+
+class MinHasher:
+    """
+    MinHash signatures with `num_perm` multiply-shift hash functions, and the LSH band keys
+    of those signatures (`bands` bands of num_perm / bands rows). Seeded, so signatures written
+    by different runs are comparable.
+    """
+    def __init__(self, num_perm: int = DEFAULT_NUM_PERM, bands: int = DEFAULT_BANDS, seed: int = 0):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands}).")
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        # odd multipliers, uint64 arithmetic wraps around (mod 2^64)
+        self.a = rng.integers(1, 2**63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+        self.band_mult = rng.integers(1, 2**63, size=self.rows, dtype=np.uint64) | np.uint64(1)
+
+    def signatures(self, texts: List[str], max_shingles: int = MAX_SHINGLES) -> np.ndarray:
+        """
+        (len(texts), num_perm) uint32 signatures. Texts are hashed in chunks of about `max_shingles`
+        shingles (a longer text alone), `PERM_BLOCK` permutations at a time, so memory does not
+        grow with the length of the comments.
+        """
+        signatures = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+        start, shingles, count = 0, [], 0
+        for i, text in enumerate(texts):
+            shingles.append(shingle_hashes(normalize(text)))
+            count += len(shingles[-1])
+            if count >= max_shingles or i == len(texts) - 1:
+                signatures[start:i + 1] = self._chunk_signatures(shingles)
+                start, shingles, count = i + 1, [], 0
+        return signatures
+
+    def _chunk_signatures(self, shingles: List[np.ndarray]) -> np.ndarray:
+        offsets = np.cumsum([0] + [len(s) for s in shingles[:-1]])
+        flat = np.concatenate(shingles)
+        signatures = np.empty((len(shingles), self.num_perm), dtype=np.uint32)
+        for p in range(0, self.num_perm, PERM_BLOCK):
+            a, b = self.a[p:p + PERM_BLOCK, None], self.b[p:p + PERM_BLOCK, None]
+            hashed = ((a * flat[None, :] + b) >> np.uint64(32)) & _MAX_HASH
+            signatures[:, p:p + PERM_BLOCK] = np.minimum.reduceat(hashed, offsets, axis=1).T
+        return signatures
+
+    def band_keys(self, signatures: np.ndarray) -> np.ndarray:
+        """(n, bands) uint64 keys, equal keys mean an identical band."""
+        banded = signatures.astype(np.uint64).reshape(len(signatures), self.bands, self.rows)
+        return (banded * self.band_mult).sum(axis=2, dtype=np.uint64)
+
+def similarity(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """Estimated Jaccard similarity of paired signatures, the share of equal MinHash values."""
+    return (left == right).mean(axis=1)
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = np.arange(n)
+
+    def find(self, x: int) -> int:
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, x: int, y: int) -> None:
+        x, y = self.find(x), self.find(y)
+        if x != y:
+            self.parent[max(x, y)] = min(x, y)
+
+class NearDuplicateIndex:
+    """
+    Incremental MinHash-LSH index of near-duplicate comment clusters.
+
+    Every cluster keeps the signature of its first comment (its row in `signatures.npy` is the
+    `dup_cluster_id`) and the LSH band keys of that signature (`bands.parquet`). New comments
+    are compared with the clusters sharing a band with them, then with each other; a candidate
+    joins a cluster when the estimated Jaccard similarity of the character shingles reaches
+    `threshold`, otherwise it starts a new cluster.
+
+    Args:
+        directory (str): folder of the index, see `Paths.near_duplicates_dir`.
+        num_perm, bands, threshold: MinHash and LSH parameters, fixed once the index exists.
+    """
+    def __init__(self, directory: str, num_perm: int = DEFAULT_NUM_PERM, bands: int = DEFAULT_BANDS,
+                 threshold: float = DEFAULT_THRESHOLD):
+        self.directory = directory
+        self.meta = {"num_perm": num_perm, "bands": bands, "threshold": threshold, "clusters": 0, "dates": []}
+        meta_path = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r") as file:
+                self.meta = json.load(file)
+        self.hasher = MinHasher(self.meta["num_perm"], self.meta["bands"])
+        self.threshold = self.meta["threshold"]
+
+        signatures_path = os.path.join(directory, "signatures.npy")
+        bands_path = os.path.join(directory, "bands.parquet")
+        self.signatures = (np.load(signatures_path) if os.path.exists(signatures_path)
+                           else np.empty((0, self.meta["num_perm"]), dtype=np.uint32))
+        self.bands = (pl.read_parquet(bands_path) if os.path.exists(bands_path)
+                      else pl.DataFrame(schema={"band": pl.UInt16, "key": pl.UInt64, "dup_cluster_id": pl.Int64}))
+        if len(self.signatures) != self.meta["clusters"]:
+            raise ValueError(f"Near duplicate index at {directory} is inconsistent with its meta.json, rebuild it.")
+
+    def _band_frame(self, keys: np.ndarray, ids: np.ndarray, id_column: str) -> pl.DataFrame:
+        n, bands = keys.shape
+        return pl.DataFrame({
+            "band": np.tile(np.arange(bands, dtype=np.uint16), n),
+            "key": keys.ravel(),
+            id_column: np.repeat(ids, bands),
+        })
+
+    def assign(self, texts: List[str]) -> np.ndarray:
+        """
+        Assigns a dup_cluster_id to every text, adding new clusters to the index.
+
+        Returns:
+            np.ndarray: int64 cluster ids, aligned with `texts`.
+        """
+        n = len(texts)
+        signatures = self.hasher.signatures(texts)
+        keys = self.hasher.band_keys(signatures)
+        rows = np.arange(n, dtype=np.int64)
+        band_frame = self._band_frame(keys, rows, "row")
+        cluster_ids = np.full(n, -1, dtype=np.int64)
+
+        # 1. existing clusters sharing a band, the lowest verified cluster id wins
+        candidates = band_frame.join(self.bands, on=["band", "key"]).select(["row", "dup_cluster_id"]).unique()
+        if candidates.height:
+            cand_rows = candidates["row"].to_numpy()
+            cand_clusters = candidates["dup_cluster_id"].to_numpy()
+            verified = similarity(signatures[cand_rows], self.signatures[cand_clusters]) >= self.threshold
+            matches = (
+                pl.DataFrame({"row": cand_rows[verified], "dup_cluster_id": cand_clusters[verified]})
+                .group_by("row").agg(pl.col("dup_cluster_id").min())
+            )
+            cluster_ids[matches["row"].to_numpy()] = matches["dup_cluster_id"].to_numpy()
+
+        # 2. the others, among themselves: every row against the first row of its bucket
+        unassigned = cluster_ids == -1
+        pairs = (
+            band_frame.filter(pl.Series(unassigned[band_frame["row"].to_numpy()]))
+            .group_by(["band", "key"])
+            .agg(pl.col("row").min().alias("first"), pl.col("row"))
+            .explode("row")
+            .filter(pl.col("row") != pl.col("first"))
+            .select(["first", "row"])
+            .unique()
+        )
+        union_find = _UnionFind(n)
+        if pairs.height:
+            first, other = pairs["first"].to_numpy(), pairs["row"].to_numpy()
+            verified = similarity(signatures[first], signatures[other]) >= self.threshold
+            for x, y in zip(first[verified], other[verified]):
+                union_find.union(x, y)
+
+        # 3. new clusters, represented by their first row
+        new_rows = np.flatnonzero(unassigned)
+        roots = np.array([union_find.find(r) for r in new_rows], dtype=np.int64)
+        new_roots, root_index = np.unique(roots, return_inverse=True)
+        new_ids = self.meta["clusters"] + np.arange(len(new_roots), dtype=np.int64)
+        cluster_ids[new_rows] = new_ids[root_index]
+
+        self.signatures = np.concatenate([self.signatures, signatures[new_roots]])
+        self.bands = pl.concat([self.bands, self._band_frame(keys[new_roots], new_ids, "dup_cluster_id")])
+        self.meta["clusters"] += len(new_roots)
+
+        metrics.inc("near_duplicate_comments_total", int(n - len(new_roots)))
+        metrics.set_gauge("near_duplicate_clusters", self.meta["clusters"])
+        return cluster_ids
+
+    def save(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        signatures_path = os.path.join(self.directory, "signatures.npy")
+        with open(signatures_path + ".tmp", "wb") as file:
+            np.save(file, self.signatures)
+        os.replace(signatures_path + ".tmp", signatures_path)
+        bands_path = os.path.join(self.directory, "bands.parquet")
+        self.bands.write_parquet(bands_path + ".tmp")
+        os.replace(bands_path + ".tmp", bands_path)
+        meta_path = os.path.join(self.directory, "meta.json")
+        with open(meta_path + ".tmp", "w") as file:
+            json.dump(self.meta, file, indent=4)
+        os.replace(meta_path + ".tmp", meta_path)
+
+def dedupe_comments(clean_comments_file_path: str, output_dir: str, index_dir: str, date_str: str) -> int:
+    """
+    Assigns the comments of a clean file to near-duplicate clusters and writes `comment_id`,
+    `dup_cluster_id` and `dup_representative` (first comment of its cluster in the file) as a
+    result part into `output_dir`, to be attached with `src.streaming.attach_results`.
+
+    Returns:
+        int: number of comments that are not the representative of their cluster.
+    """
+    index = NearDuplicateIndex(index_dir)
+    df = pl.read_parquet(clean_comments_file_path, columns=["comment_id", "comment"])
+    with metrics.timer("near_duplicates_seconds"):
+        cluster_ids = index.assign(df["comment"].to_list())
+
+    result = pl.DataFrame({"comment_id": df["comment_id"], "dup_cluster_id": cluster_ids}).with_columns(
+        (pl.int_range(pl.len()).over("dup_cluster_id") == 0).alias("dup_representative")
+    )
+    os.makedirs(output_dir, exist_ok=True)
+    part_path = os.path.join(output_dir, "part_000000.parquet")
+    result.write_parquet(part_path + ".tmp")
+    os.replace(part_path + ".tmp", part_path)
+
+    if date_str not in index.meta["dates"]:
+        index.meta["dates"].append(date_str)
+    index.save()
+    duplicates = result.height - int(result["dup_representative"].sum())
+    logging.info(f"{duplicates} of {result.height} comments are near duplicates of another comment.")
+    return duplicates
+
+def cluster_sizes(files: List[str]) -> pl.DataFrame:
+    """dup_cluster_id and its comment count over the clean files, largest clusters first."""
+    return (
+        pl.scan_parquet(files)
+        .group_by("dup_cluster_id")
+        .len()
+        .sort("len", descending=True)
+        .collect()
+    )
@@ -0,0 +1,480 @@
+"""
+Headless pipeline runner, the notebooks `01` to `03_6` as stages over the `Paths` layout:
+
+    harvest -> clean -> enrich -----------------------> clouds, search
+                     -> threads
+                     -> dedup -> langdetect -> stats, rollups
+                              -> sentiment  ->
+
+Every stage records a fingerprint of its inputs (input files, upstream outputs and the
+options it reads) and is skipped while it is up to date, so a nightly run only does the incremental
+work. Independent stages run concurrently. Heavy libraries are imported inside the stages.
+
+Usage, from the project root:
+    python -m src.pipeline                          # today, every stage
+    python -m src.pipeline --all-dates --skip harvest
+    python -m src.pipeline --stages clean,enrich --force
+"""
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import date, datetime
+from typing import Callable, List, Optional
+import argparse
+import hashlib
+import logging
+import shutil
+import json
+import threading
+import os
+
+import config
+from paths import Paths
+from src.metrics import metrics
+
+# analyzers attach their results to the clean file, one at a time
+_attach_lock = threading.Lock()
+# the near-duplicate index is shared by every date
+_dedup_lock = threading.Lock()
+# one vocabulary per channel, shared by the concurrent enrichment runs
+_vocabularies = {}
+_vocabularies_lock = threading.Lock()
+
+def get_vocabulary(paths: Paths):
+    from src.encoding import Vocabulary
+
+    with _vocabularies_lock:
+        if paths.vocabulary_file_path not in _vocabularies:
+            _vocabularies[paths.vocabulary_file_path] = Vocabulary(paths.vocabulary_file_path)
+        return _vocabularies[paths.vocabulary_file_path]
+
+class Stage:
+    """
+    A pipeline stage.
+
+    Args:
+        name (str): stage name.
+        run (Callable): run(paths, options), does the work.
+        deps (List[str]): upstream stages.
+        inputs (Callable): inputs(paths) -> files read from outside the pipeline state.
+        outputs (Callable): outputs(paths) -> files or folders the stage produces.
+        per_date (bool): one run per date, otherwise a single run over all dates.
+        always (bool): never considered up to date (e.g. the harvest).
+        clear_outputs (bool): remove output folders left by a run over different inputs.
+        version (int): bump when the stage logic changes, to invalidate its fingerprints.
+        enabled (Callable): enabled(options) -> whether the stage runs by default, a stage named
+            in --stages always runs.
+        options (tuple): command line options the outputs depend on, part of the fingerprint.
+        serial (bool): per-date runs go in date order, each one after the run of the previous date.
+    """
+    def __init__(self, name: str, run: Callable, deps: tuple = (), inputs: Optional[Callable] = None,
+                 outputs: Optional[Callable] = None, per_date: bool = True, always: bool = False,
+                 clear_outputs: bool = False, version: int = 1, enabled: Optional[Callable] = None,
+                 options: tuple = (), serial: bool = False):
+        self.name = name
+        self.run = run
+        self.deps = tuple(deps)
+        self.inputs = inputs or (lambda paths: [])
+        self.outputs = outputs or (lambda paths: [])
+        self.per_date = per_date
+        self.always = always
+        self.clear_outputs = clear_outputs
+        self.version = version
+        self.enabled = enabled or (lambda options: True)
+        self.options = tuple(options)
+        self.serial = serial
+
+# --- stage implementations ---
+def run_harvest(paths: Paths, options: argparse.Namespace) -> None:
+    from src.harvest import harvest_channel
+    from src.quota import KeyPool
+
+    # every key of config.API_KEYS, usage shared with `python -m src.harvest`
+    pool = KeyPool(config.API_KEYS)
+    harvest_channel(paths.channel_handle, pool, debugging=options.debugging, log_every_count=options.log_every,
+                    channel_paths=paths)
+    pool.flush()
+
+def run_clean(paths: Paths, options: argparse.Namespace) -> None:
+    from src.cleaning import clean_raw_comments
+
+    # comments are kept on the first day they were seen, later days are deduplicated against it
+    previous_files = [
+        Paths(paths.channel_handle, datetime.strptime(d, "%Y_%m_%d").date(), base_dir=paths.base_dir).clean_comments_file_path
+        for d in paths.list_processed_dates() if d < paths.date_str
+    ]
+    with metrics.stage("clean"):
+        df = clean_raw_comments(paths.raw_comments_file_path, previous_files)
+        metrics.inc("items_processed_total", df.height, stage="clean")
+        tmp_path = paths.clean_comments_file_path + ".tmp"
+        df.write_parquet(tmp_path)
+        os.replace(tmp_path, paths.clean_comments_file_path)
+
+def run_enrich(paths: Paths, options: argparse.Namespace) -> None:
+    from src.enrichment import enrich_comments
+
+    vocabulary = get_vocabulary(paths)
+    with metrics.stage("enrich"):
+        enrich_comments(paths.clean_comments_file_path, paths.enriched_comments_file_path, vocabulary=vocabulary)
+
+def run_dedup(paths: Paths, options: argparse.Namespace) -> None:
+    from src.near_duplicates import dedupe_comments
+    from src.streaming import attach_results
+
+    output_dir = paths.analyzer_output_dir("near_duplicates")
+    with metrics.stage("dedup"), _dedup_lock:
+        dedupe_comments(paths.clean_comments_file_path, output_dir, paths.near_duplicates_dir, paths.date_str)
+    with _attach_lock:
+        attach_results(paths.clean_comments_file_path, output_dir)
+
+def uses_representatives(paths: Paths, options: argparse.Namespace) -> bool:
+    """Analyzers run once per near-duplicate cluster if asked to, and the clusters are known."""
+    import polars as pl
+    return options.dedupe and "dup_cluster_id" in pl.scan_parquet(paths.clean_comments_file_path).collect_schema().names()
+
+def run_langdetect(paths: Paths, options: argparse.Namespace) -> None:
+    from src.lang_detect import detect_parquet
+    from src.streaming import attach_results
+
+    output_dir = paths.analyzer_output_dir("langdetect")
+    representatives_only = uses_representatives(paths, options)
+    detect_parquet(paths.clean_comments_file_path, output_dir, batch_size=options.batch_size, max_workers=options.workers,
+                   representatives_only=representatives_only)
+    with _attach_lock:
+        attach_results(paths.clean_comments_file_path, output_dir,
+                       broadcast_on="dup_cluster_id" if representatives_only else None)
+
+def run_sentiment(paths: Paths, options: argparse.Namespace) -> None:
+    from src.sentiment_analysis import get_compound_parquet
+    from src.streaming import attach_results
+
+    output_dir = paths.analyzer_output_dir("sentiment")
+    representatives_only = uses_representatives(paths, options)
+    get_compound_parquet(paths.clean_comments_file_path, output_dir, batch_size=options.batch_size, workers=options.workers,
+                         representatives_only=representatives_only)
+    with _attach_lock:
+        attach_results(paths.clean_comments_file_path, output_dir,
+                       broadcast_on="dup_cluster_id" if representatives_only else None)
+
+def run_rollups(paths: Paths, options: argparse.Namespace) -> None:
+    from src.rollups import update_rollup
+
+    with metrics.stage("rollups"):
+        update_rollup(paths.clean_comments_file_path, paths.rollup_file_path, force=True)
+
+def run_threads(paths: Paths, options: argparse.Namespace) -> None:
+    from src.thread_index import update_thread_index
+
+    with metrics.stage("threads"):
+        update_thread_index(paths)
+
+def run_search(paths: Paths, options: argparse.Namespace) -> None:
+    from src.search_index import update_search_index
+
+    with metrics.stage("search"):
+        update_search_index(paths)
+
+def statistics_file_path(paths: Paths) -> str:
+    return os.path.join(paths.results_dir, f"{paths.channel_handle}_statistics.json")
+
+def word_cloud_file_path(paths: Paths) -> str:
+    return os.path.join(paths.results_dir, f"{paths.channel_handle}_cloud_of_words.png")
+
+def run_stats(paths: Paths, options: argparse.Namespace) -> None:
+    import polars as pl
+    from src.stats import comment_statistics, language_shares, sentiment_distribution
+    from src.encoding import scan_clean_files
+
+    with metrics.stage("stats"):
+        ldf = scan_clean_files(paths.list_processed_files())
+        columns = ldf.collect_schema().names()
+        result = {"comments": comment_statistics(ldf).to_dicts()[0]}
+        if "lang" in columns:
+            result["languages"] = language_shares(ldf).to_dicts()
+        if "lang" in columns and "sentiment_score" in columns:
+            result["sentiment"] = sentiment_distribution(ldf).with_columns(pl.col("sentiment_category").cast(pl.Utf8)).to_dicts()
+        with open(statistics_file_path(paths), "w") as file:
+            json.dump(result, file, indent=4, ensure_ascii=False, default=str)
+
+def run_clouds(paths: Paths, options: argparse.Namespace) -> None:
+    from src.word_cloud import build_token_counter, render_word_cloud, LayoutCache
+
+    duplicates = None
+    if options.dedupe:
+        import polars as pl
+        clean_files = [f for f in paths.list_processed_files()
+                       if "dup_cluster_id" in pl.scan_parquet(f).collect_schema().names()]
+        if clean_files:
+            duplicates = pl.scan_parquet(clean_files).select(["comment_id", "dup_cluster_id"])
+    with metrics.stage("clouds"):
+        counter = build_token_counter(paths.list_enriched_files(), column="tokens_wo_stop", duplicates=duplicates,
+                                      vocabulary=get_vocabulary(paths))
+        render_word_cloud(counter, word_cloud_file_path(paths), cache=LayoutCache(paths.word_cloud_cache_dir))
+
+def raw_inputs(paths: Paths) -> List[str]:
+    from src.raw_storage import list_raw_segments
+    files = list_raw_segments(paths.raw_comments_file_path)
+    if os.path.exists(paths.raw_comments_file_path):
+        files.append(paths.raw_comments_file_path)
+    return files
+
+STAGES = {
+    "harvest": Stage("harvest", run_harvest, always=True, outputs=raw_inputs),
+    # date after date, each date is deduplicated against the clean files of the earlier ones
+    "clean": Stage("clean", run_clean, deps=("harvest",), inputs=raw_inputs, serial=True,
+                   outputs=lambda p: [p.clean_comments_file_path]),
+    "enrich": Stage("enrich", run_enrich, deps=("clean",),
+                    outputs=lambda p: [p.enriched_comments_file_path]),
+    # a full MinHash pass over every clean file, only worth it when the clusters are used
+    "dedup": Stage("dedup", run_dedup, deps=("clean",), enabled=lambda options: options.dedupe,
+                   outputs=lambda p: [p.analyzer_output_dir("near_duplicates")]),
+    "langdetect": Stage("langdetect", run_langdetect, deps=("clean", "dedup"), clear_outputs=True,
+                        options=("batch_size", "dedupe"),
+                        outputs=lambda p: [p.analyzer_output_dir("langdetect")]),
+    # after langdetect: both rewrite the clean file, neither may scan it while the other replaces it
+    "sentiment": Stage("sentiment", run_sentiment, deps=("clean", "dedup", "langdetect"), clear_outputs=True,
+                       options=("batch_size", "dedupe"),
+                       outputs=lambda p: [p.analyzer_output_dir("sentiment")]),
+    "rollups": Stage("rollups", run_rollups, deps=("clean", "langdetect", "sentiment"),
+                     outputs=lambda p: [p.rollup_file_path]),
+    "threads": Stage("threads", run_threads, deps=("clean",), per_date=False,
+                     inputs=lambda p: p.list_processed_files(), outputs=lambda p: [p.thread_index_dir]),
+    "search": Stage("search", run_search, deps=("enrich",), per_date=False,
+                    inputs=lambda p: p.list_enriched_files(), outputs=lambda p: [p.search_index_dir]),
+    "stats": Stage("stats", run_stats, deps=("clean", "langdetect", "sentiment"), per_date=False,
+                   inputs=lambda p: p.list_processed_files(), outputs=lambda p: [statistics_file_path(p)]),
+    "clouds": Stage("clouds", run_clouds, deps=("enrich", "dedup"), per_date=False, options=("dedupe",),
+                    inputs=lambda p: p.list_enriched_files(), outputs=lambda p: [word_cloud_file_path(p)]),
+}
+
+# --- state and fingerprints ---
+def file_signature(files: List[str]) -> list:
+    """Cheap content signature: name, size and modification time of every file."""
+    signature = []
+    for path in sorted(files):
+        try:
+            stat = os.stat(path)
+            signature.append([os.path.basename(path), stat.st_size, stat.st_mtime_ns])
+        except FileNotFoundError:
+            signature.append([os.path.basename(path), None, None])
+    return signature
+
+def output_signature(outputs: List[str]) -> list:
+    """`file_signature` of the outputs of a stage, folders by the files they hold."""
+    files = []
+    for output in outputs:
+        if os.path.isdir(output):
+            files.extend(os.path.join(root, name) for root, _, names in os.walk(output) for name in names)
+        else:
+            files.append(output)
+    return file_signature(files)
+
+def load_state(state_location: str) -> dict:
+    if not os.path.exists(state_location):
+        return {}
+    try:
+        with open(state_location, "r") as file:
+            return json.load(file)
+    except json.JSONDecodeError:
+        logging.error(f"Pipeline state at {state_location} is not valid JSON, every stage will run.")
+        return {}
+
+def save_state(state: dict, state_location: str) -> None:
+    with open(state_location + ".tmp", "w") as file:
+        json.dump(state, file, indent=4)
+    os.replace(state_location + ".tmp", state_location)
+
+class PipelineRunner:
+    """
+    Runs the selected stages for the given dates, in dependency order, skipping the up to date ones.
+
+    Args:
+        channel_handle (str): YouTube channel handle.
+        dates (List[date]): dates of the per-date stages.
+        stages (List[str]): stages to consider, the others are assumed up to date.
+        options (argparse.Namespace): command line options, passed to the stages.
+    """
+    def __init__(self, channel_handle: str, dates: List[date], stages: List[str], options: argparse.Namespace):
+        self.channel_handle = channel_handle
+        self.options = options
+        self.paths = {d.strftime("%Y_%m_%d"): Paths(channel_handle, d) for d in dates}
+        self.all_paths = Paths(channel_handle)
+        self.state_location = self.all_paths.pipeline_state_file_path
+        self.state = load_state(self.state_location)
+        self._lock = threading.Lock()
+
+        # nodes are (stage, date_str), "all" for the stages over every date
+        today = date.today().strftime("%Y_%m_%d")
+        self.nodes = []
+        for name in stages:
+            stage = STAGES[name]
+            if not stage.per_date:
+                self.nodes.append((name, "all"))
+            elif name == "harvest":
+                # comments can only be harvested into today's files
+                if today in self.paths:
+                    self.nodes.append((name, today))
+            else:
+                self.nodes.extend((name, d) for d in self.paths)
+
+    def node_paths(self, node: tuple) -> Paths:
+        return self.all_paths if node[1] == "all" else self.paths[node[1]]
+
+    def previous_node(self, node: tuple) -> Optional[tuple]:
+        """Run of the same serial stage on the latest earlier date, if any."""
+        name, date_str = node
+        if not STAGES[name].serial or date_str == "all":
+            return None
+        earlier = [n for n in self.nodes if n[0] == name and n[1] < date_str]
+        return max(earlier, key=lambda n: n[1]) if earlier else None
+
+    def node_deps(self, node: tuple) -> List[tuple]:
+        name, date_str = node
+        deps = []
+        for dep in STAGES[name].deps:
+            if date_str == "all":
+                deps.extend(n for n in self.nodes if n[0] == dep)
+            elif (dep, date_str) in self.nodes:
+                deps.append((dep, date_str))
+        previous = self.previous_node(node)
+        if previous is not None:
+            deps.append(previous)
+        return deps
+
+    def key(self, node: tuple) -> str:
+        return f"{node[1]}:{node[0]}"
+
+    def fingerprint(self, node: tuple) -> str:
+        name, date_str = node
+        stage = STAGES[name]
+        paths = self.node_paths(node)
+        dep_keys = []
+        for dep in stage.deps:
+            dep_keys.extend([self.key(n) for n in self.nodes if n[0] == dep] if date_str == "all" else [f"{date_str}:{dep}"])
+        previous = self.previous_node(node)
+        if previous is not None:
+            dep_keys.append(self.key(previous))
+        # what the upstream runs produced, a re-run with the same outputs changes nothing downstream
+        upstream = [(k, self.state.get(k, {}).get("outputs")) for k in sorted(dep_keys)]
+        payload = {
+            "stage": name,
+            "version": stage.version,
+            "inputs": file_signature(stage.inputs(paths)),
+            "upstream": upstream,
+            "options": {option: getattr(self.options, option) for option in stage.options},
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def is_up_to_date(self, node: tuple, fingerprint: str) -> bool:
+        stage = STAGES[node[0]]
+        if stage.always or self.options.force:
+            return False
+        recorded = self.state.get(self.key(node), {})
+        outputs_exist = all(os.path.exists(p) for p in stage.outputs(self.node_paths(node)))
+        return recorded.get("fingerprint") == fingerprint and outputs_exist
+
+    def run_node(self, node: tuple) -> str:
+        """Runs one node if stale. Returns "skipped" or "done"."""
+        name, _ = node
+        stage = STAGES[name]
+        paths = self.node_paths(node)
+        fingerprint = self.fingerprint(node)
+        if self.is_up_to_date(node, fingerprint):
+            logging.info(f"[{self.key(node)}] up to date, skipping.")
+            return "skipped"
+
+        with self._lock:
+            recorded = self.state.setdefault(self.key(node), {})
+            # a run over different inputs must not resume from partial outputs of the previous ones
+            if stage.clear_outputs and recorded.get("started") != fingerprint:
+                for output in stage.outputs(paths):
+                    if os.path.isdir(output):
+                        shutil.rmtree(output)
+            recorded["started"] = fingerprint
+            save_state(self.state, self.state_location)
+
+        logging.info(f"[{self.key(node)}] running...")
+        stage.run(paths, self.options)
+
+        with self._lock:
+            recorded = self.state[self.key(node)]
+            recorded["outputs"] = hashlib.sha256(json.dumps(output_signature(stage.outputs(paths))).encode()).hexdigest()
+            # the harvest output changes on every run, its fingerprint is what it produced
+            recorded["fingerprint"] = recorded["outputs"] if stage.always else fingerprint
+            recorded["finished_at"] = datetime.now().isoformat()
+            save_state(self.state, self.state_location)
+        return "done"
+
+    def run(self, jobs: int = 2) -> dict:
+        """Schedules every node once its upstream nodes finished. Returns {node key: status}."""
+        status = {}
+        pending = list(self.nodes)
+        running = {}
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            while pending or running:
+                for node in list(pending):
+                    deps = self.node_deps(node)
+                    if any(status.get(self.key(d)) in ("failed", "blocked") for d in deps):
+                        status[self.key(node)] = "blocked"
+                        pending.remove(node)
+                    elif all(self.key(d) in status for d in deps):
+                        running[executor.submit(self.run_node, node)] = node
+                        pending.remove(node)
+
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    node = running.pop(future)
+                    try:
+                        status[self.key(node)] = future.result()
+                    except Exception as e:
+                        logging.error(f"[{self.key(node)}] failed: {e}")
+                        status[self.key(node)] = "failed"
+        return status
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the YouTube comments pipeline, only the stages that are out of date.")
+    parser.add_argument("--channel", default=config.channel_handle, help="channel handle, defaults to config.channel_handle")
+    parser.add_argument("--date", type=lambda s: datetime.strptime(s, "%Y-%m-%d").date(), default=None, help="YYYY-MM-DD, defaults to today")
+    parser.add_argument("--all-dates", action="store_true", help="every date with raw comments, plus today")
+    parser.add_argument("--stages", default=None, help="comma separated stages to consider, defaults to every enabled stage")
+    parser.add_argument("--skip", default="", help="comma separated stages to leave out")
+    parser.add_argument("--force", action="store_true", help="run the stages even if they are up to date")
+    parser.add_argument("--jobs", type=int, default=2, help="stages running concurrently")
+    parser.add_argument("--workers", type=int, default=4, help="processes per analyzer")
+    parser.add_argument("--batch-size", type=int, default=50_000, help="rows per analyzer batch")
+    parser.add_argument("--dedupe", action="store_true", help="analyze and count near-duplicate comments once per cluster")
+    parser.add_argument("--log-every", type=int, default=10, help="harvest progress report every count of videos")
+    parser.add_argument("--debugging", action="store_true", help="harvest test run with a tiny quota")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO)
+    options = parse_args(argv)
+
+    skip = {s for s in options.skip.split(",") if s}
+    if options.stages:
+        stages = [s for s in options.stages.split(",") if s and s not in skip]
+    else:
+        stages = [s for s, stage in STAGES.items() if stage.enabled(options) and s not in skip]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        logging.error(f"Unknown stages: {unknown}. Available: {list(STAGES)}")
+        return 2
+
+    today_paths = Paths(options.channel, options.date)
+    metrics.configure(today_paths.metrics_log_file_path, today_paths.metrics_snapshot_file_path)
+
+    if options.all_dates:
+        dates = {datetime.strptime(d, "%Y_%m_%d").date() for d in today_paths.list_raw_dates()}
+        dates.add(date.today())
+    else:
+        dates = {today_paths.date_obj}
+
+    runner = PipelineRunner(options.channel, sorted(dates), stages, options)
+    status = runner.run(jobs=options.jobs)
+    for key, value in sorted(status.items()):
+        logging.info(f"{key}: {value}")
+    return 1 if any(v in ("failed", "blocked") for v in status.values()) else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,27 +1,37 @@
-import nltk
-from nltk.corpus import stopwords
+from functools import lru_cache
 from typing import List
-from soynlp.tokenizer import RegexTokenizer
 import regex
 import emoji
 import re
 
 # nltk.download('stopwords'), download the first time
 # -------- setup
-stopwords_latin = set(stopwords.words('english'))
-stopwords_latin.update(set(stopwords.words('spanish')))
+# NLTK corpora and soynlp are loaded on first use, so importing this module stays cheap
+other_stopwords = {'https','www','com','co', 'href', 'br', 'youtube', 'watch', 'quot', 'kyb', 'cvso','amp'}
+
+@lru_cache(maxsize=None)
+def get_stopwords_latin() -> frozenset:
+    """English and spanish NLTK stopwords plus the channel specific ones."""
+    from nltk.corpus import stopwords
+    stopwords_latin = set(stopwords.words('english'))
+    stopwords_latin.update(set(stopwords.words('spanish')))
+    stopwords_latin.update(other_stopwords)
+    return frozenset(stopwords_latin)
 
-stopwords_ko = {
+@lru_cache(maxsize=None)
+def get_stopwords_ko() -> frozenset:
+    stopwords_ko = {
         '이', '그', '저', '것', '수', '등', '들', '는', '은', '가', '에', '의', 
         '도', '로', '를', '을', '하다', '되다', '있다', '되', '하', '고', '아', 
         '이다', '것이다', '에서', '까지'
     }
+    stopwords_ko.update(other_stopwords)
+    return frozenset(stopwords_ko)
 
-other_stopwords = {'https','www','com','co', 'href', 'br', 'youtube', 'watch', 'quot', 'kyb', 'cvso','amp'}
-stopwords_latin.update(other_stopwords)
-stopwords_ko.update(other_stopwords)
-
-tokenizer_ko = RegexTokenizer()
+@lru_cache(maxsize=None)
+def get_tokenizer_ko():
+    from soynlp.tokenizer import RegexTokenizer
+    return RegexTokenizer()
 
 # Detect script (Hangul vs Latin)
 korean_re = re.compile(r'[\u3131-\uD79D]')
@@ -44,11 +54,13 @@ def extract_emojis(text: str) -> List[str]:
 def tokenize_mixed(text: str, keep_stopwords: bool=True) -> List[str]:
     """Tokenize and clean text depending on script."""
     tokens = []
+    stopwords_latin = get_stopwords_latin()
+    stopwords_ko = get_stopwords_ko()
     for word in text.split():
         if korean_re.search(word):  
             # Korean pipeline
             w = re.sub(r'[^ㄱ-ㅎㅏ-ㅣ가-힣]', '', word)
-            tks = tokenizer_ko.tokenize(w)
+            tks = get_tokenizer_ko().tokenize(w)
             if not keep_stopwords:
                 tks = [t for t in tks if t not in stopwords_ko and len(t) > 1]
         else:
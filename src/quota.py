@@ -0,0 +1,162 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from zoneinfo import ZoneInfo
+from src.metrics import metrics
+from src.locks import file_lock
+import threading
+import hashlib
+import atexit
+import logging
+import json
+import os
+
+DEFAULT_USAGE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "api_quota.json")
+# default daily quota of a project (10,000 units) minus a safety margin
+DEFAULT_DAILY_LIMIT = 9900
+# acquires between two saves of the usage file
+DEFAULT_SAVE_EVERY = 50
+# quotas reset at midnight Pacific Time
+QUOTA_TIMEZONE = ZoneInfo("America/Los_Angeles")
+
+class QuotaExhausted(Exception):
+    """No API key of the pool has quota left for the call."""
+
+def quota_day(now: Optional[datetime] = None) -> str:
+    """Quota day (YYYY-MM-DD, Pacific Time) of a moment, now by default."""
+    return (now or datetime.now(QUOTA_TIMEZONE)).astimezone(QUOTA_TIMEZONE).strftime("%Y-%m-%d")
+
+def next_reset(now: Optional[datetime] = None) -> datetime:
+    """Next quota reset, midnight Pacific Time."""
+    now = (now or datetime.now(QUOTA_TIMEZONE)).astimezone(QUOTA_TIMEZONE)
+    return datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), tzinfo=QUOTA_TIMEZONE)
+
+def key_fingerprint(api_key: str) -> str:
+    """Identifies a key in the usage file without storing the key itself."""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:12]
+
+class KeyPool:
+    """
+    Pool of YouTube Data API keys with a daily quota each.
+
+    Quota units are charged to a key before the call (`acquire`). The usage of every key is saved
+    every `save_every` calls, when a key runs out and at exit (`flush`), so a restart during the
+    same quota day does not spend the units again; a crash loses at most `save_every` calls.
+    Several processes can share the usage file (the pipeline and `python -m src.harvest`): a save
+    adds the units charged since the previous one to the counts on disk, under a file lock, and
+    reloads them.
+    Calls go to the key with the most units left. A key answering `quotaExceeded` is marked as
+    spent until the next reset.
+
+    Args:
+        api_keys (List[str]): API keys, see `config.API_KEYS`.
+        usage_file_path (str): JSON file with the usage of every key.
+        daily_limit (int | Dict[str, int]): units per key and day, or per key.
+        save_every (int): acquires between two saves of the usage file.
+    """
+    def __init__(self, api_keys: List[str], usage_file_path: str = DEFAULT_USAGE_PATH,
+                 daily_limit: int | Dict[str, int] = DEFAULT_DAILY_LIMIT, save_every: int = DEFAULT_SAVE_EVERY):
+        if not api_keys:
+            raise ValueError("The key pool needs at least one API key.")
+        self.api_keys = list(dict.fromkeys(api_keys))
+        self.usage_file_path = usage_file_path
+        self.limits = {
+            key: daily_limit.get(key, DEFAULT_DAILY_LIMIT) if isinstance(daily_limit, dict) else daily_limit
+            for key in self.api_keys
+        }
+        self.save_every = max(1, save_every)
+        self._unsaved = 0
+        # units charged since the last save, by (key fingerprint, quota day)
+        self._pending: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+        self.usage = self._load()
+        atexit.register(self.flush)
+
+    def _load(self) -> dict:
+        if not os.path.exists(self.usage_file_path):
+            return {}
+        try:
+            with open(self.usage_file_path, "r") as file:
+                return json.load(file)
+        except json.JSONDecodeError:
+            logging.error(f"Quota usage at {self.usage_file_path} is not valid JSON, starting from zero.")
+            return {}
+
+    def _save(self) -> None:
+        """
+        Adds the pending units to the usage on disk, written to a temporary file and swapped in,
+        so a crash never leaves it truncated, and takes the merged usage as the current one.
+        """
+        os.makedirs(os.path.dirname(self.usage_file_path), exist_ok=True)
+        with file_lock(self.usage_file_path + ".lock"):
+            usage = self._load()
+            for (fingerprint, day), units in self._pending.items():
+                entry = usage.get(fingerprint)
+                if entry is None or entry["day"] < day:
+                    usage[fingerprint] = {"day": day, "used": units}
+                elif entry["day"] == day:
+                    entry["used"] += units
+            tmp_path = f"{self.usage_file_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as file:
+                json.dump(usage, file, indent=4)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, self.usage_file_path)
+        self.usage = usage
+        self._pending.clear()
+        self._unsaved = 0
+
+    def _charge(self, api_key: str, units: int) -> None:
+        entry = self._entry(api_key)
+        entry["used"] += units
+        pending_key = (key_fingerprint(api_key), entry["day"])
+        self._pending[pending_key] = self._pending.get(pending_key, 0) + units
+
+    def flush(self) -> None:
+        """Saves the usage charged since the last save."""
+        with self._lock:
+            if self._unsaved:
+                self._save()
+
+    def _entry(self, api_key: str) -> dict:
+        """Usage of a key for the current quota day, reset when the day changed."""
+        fingerprint = key_fingerprint(api_key)
+        today = quota_day()
+        entry = self.usage.get(fingerprint)
+        if entry is None or entry["day"] != today:
+            entry = {"day": today, "used": 0}
+            self.usage[fingerprint] = entry
+        return entry
+
+    def remaining(self, api_key: Optional[str] = None) -> int:
+        """Units left today, for one key or the whole pool."""
+        with self._lock:
+            keys = [api_key] if api_key else self.api_keys
+            return sum(max(0, self.limits[k] - self._entry(k)["used"]) for k in keys)
+
+    def acquire(self, quota_cost: int = 1) -> str:
+        """
+        Charges `quota_cost` units to the key with the most units left and returns it.
+
+        Raises:
+            QuotaExhausted: if no key can afford the call before the next reset.
+        """
+        with self._lock:
+            left = {k: self.limits[k] - self._entry(k)["used"] for k in self.api_keys}
+            api_key = max(left, key=left.get)
+            if left[api_key] < quota_cost:
+                raise QuotaExhausted(f"Every API key spent its daily quota, next reset at {next_reset().isoformat()}.")
+            self._charge(api_key, quota_cost)
+            self._unsaved += 1
+            if self._unsaved >= self.save_every:
+                self._save()
+        metrics.set_gauge("api_key_quota_remaining", left[api_key] - quota_cost, key=key_fingerprint(api_key))
+        return api_key
+
+    def mark_exhausted(self, api_key: str) -> None:
+        """The API reported the key out of quota, it is not used again until the next reset."""
+        with self._lock:
+            # whatever other processes charged, the key ends up at its limit or above
+            self._charge(api_key, max(0, self.limits[api_key] - self._entry(api_key)["used"]))
+            self._save()
+        metrics.set_gauge("api_key_quota_remaining", 0, key=key_fingerprint(api_key))
+        logging.warning(f"API key {key_fingerprint(api_key)} is out of quota until {next_reset().isoformat()}.")
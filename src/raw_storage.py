@@ -0,0 +1,187 @@
+from typing import Iterator, List, Optional
+from src.metrics import metrics
+import pyarrow as pa
+import polars as pl
+import logging
+import json
+import glob
+import os
+
+SEGMENT_SUFFIX = ".arrows"
+
+# fixed schema of the raw comments, the flattened YouTube API fields
+RAW_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("videoId", pa.string()),
+    ("channelId", pa.string()),
+    ("textDisplay", pa.string()),
+    ("authorDisplayName", pa.string()),
+    ("authorChannelId", pa.string()),
+    ("likeCount", pa.int64()),
+    ("publishedAt", pa.string()),
+    ("parentId", pa.string()),
+    ("totalReplyCount", pa.int64()),
+])
+
+def flatten_comment(comment: dict, video_id: str, total_reply_count: Optional[int] = None) -> dict:
+    """
+    Flattens a comment resource (topLevelComment or reply) into a RAW_SCHEMA record.
+
+    Args:
+        comment (dict): comment resource, {id, snippet: {...}}.
+        video_id (str): ID of the YouTube video, replies do not carry it.
+        total_reply_count (int | None): totalReplyCount of the thread, only for top level comments.
+    """
+    snippet = comment.get('snippet', {})
+    return {
+        "id": comment['id'],
+        "videoId": video_id,
+        "channelId": snippet.get('channelId'),
+        "textDisplay": snippet.get('textDisplay'),
+        "authorDisplayName": snippet.get('authorDisplayName'),
+        "authorChannelId": snippet.get('authorChannelId', {}).get('value'),
+        "likeCount": snippet.get('likeCount'),
+        "publishedAt": snippet.get('publishedAt'),
+        "parentId": snippet.get('parentId'),
+        "totalReplyCount": total_reply_count,
+    }
+
+def segment_base(raw_comments_file_path: str) -> str:
+    """Segments of a day are stored next to `Paths.raw_comments_file_path`, sharing its name."""
+    return os.path.splitext(raw_comments_file_path)[0]
+
+def list_raw_segments(raw_comments_file_path: str) -> List[str]:
+    """List the compressed segments written for a raw comments file, in write order."""
+    return sorted(glob.glob(glob.escape(segment_base(raw_comments_file_path)) + ".*" + SEGMENT_SUFFIX))
+
+class RawCommentWriter:
+    """
+    Buffered writer of raw comments into rotating, zstd-compressed Arrow IPC stream segments
+    with a fixed schema: `<raw comments file name>.<seq>.arrows`.
+
+    Records are serialized in batches of `buffer_size`. `checkpoint` flushes and fsyncs the
+    current segment, it must be called before saving the harvesting progress, so every
+    comment accounted for in the progress state is on disk. Every writer session starts a
+    new segment, a stream is never appended after it was closed.
+    """
+    def __init__(self, raw_comments_file_path: str, buffer_size: int = 1_000, segment_max_records: int = 250_000):
+        self.base = segment_base(raw_comments_file_path)
+        self.buffer_size = buffer_size
+        self.segment_max_records = segment_max_records
+        self._options = pa.ipc.IpcWriteOptions(compression="zstd")
+        self._buffer = []
+        self._sink = None
+        self._stream = None
+        self._segment_records = 0
+        self.records_written = 0
+
+    def __enter__(self) -> "RawCommentWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def _next_segment_path(self) -> str:
+        existing = list_raw_segments(self.base)
+        seq = int(existing[-1][len(self.base) + 1:-len(SEGMENT_SUFFIX)]) + 1 if existing else 0
+        return f"{self.base}.{seq:05d}{SEGMENT_SUFFIX}"
+
+    def _open_segment(self) -> None:
+        os.makedirs(os.path.dirname(self.base), exist_ok=True)
+        path = self._next_segment_path()
+        self._sink = open(path, "wb")
+        self._stream = pa.ipc.new_stream(self._sink, RAW_SCHEMA, options=self._options)
+        self._segment_records = 0
+        metrics.inc("raw_segments_opened_total")
+
+    def _close_segment(self, sync: bool = True) -> None:
+        if self._stream is None:
+            return
+        self._stream.close()
+        self._sink.flush()
+        if sync:
+            os.fsync(self._sink.fileno())
+        self._sink.close()
+        self._stream = None
+        self._sink = None
+
+    def write(self, record: dict) -> None:
+        """Buffer one RAW_SCHEMA record, see `flatten_comment`."""
+        self._buffer.append(record)
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def write_many(self, records: List[dict]) -> None:
+        self._buffer.extend(records)
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Serialize the buffered records as one record batch."""
+        if not self._buffer:
+            return
+        if self._stream is None:
+            self._open_segment()
+
+        batch = pa.RecordBatch.from_pylist(self._buffer, schema=RAW_SCHEMA)
+        self._stream.write_batch(batch)
+        self._segment_records += batch.num_rows
+        self.records_written += batch.num_rows
+        metrics.inc("raw_records_written_total", batch.num_rows)
+        self._buffer = []
+
+        if self._segment_records >= self.segment_max_records:
+            self._close_segment()
+
+    def checkpoint(self) -> None:
+        """Flush the buffer and fsync the current segment."""
+        self.flush()
+        if self._sink is not None:
+            self._sink.flush()
+            os.fsync(self._sink.fileno())
+
+    def close(self) -> None:
+        self.flush()
+        self._close_segment()
+
+def iter_raw_batches(raw_comments_file_path: str) -> Iterator[pa.RecordBatch]:
+    """
+    Yields the record batches of every segment of a raw comments file. A segment cut short by
+    an interrupted run is read up to its last complete batch.
+    """
+    for path in list_raw_segments(raw_comments_file_path):
+        with pa.memory_map(path, "r") as source:
+            try:
+                reader = pa.ipc.open_stream(source)
+                for batch in reader:
+                    yield batch
+            except (pa.ArrowInvalid, OSError) as e:
+                logging.warning(f"Segment {path} is truncated, keeping its complete batches: {e}")
+
+def read_legacy_ndjson(raw_comments_file_path: str) -> pl.DataFrame:
+    """Reads an uncompressed NDJSON raw comments file into the RAW_SCHEMA columns."""
+    with open(raw_comments_file_path, 'r') as comments:
+        data = [json.loads(comment) for comment in comments]
+    df = pl.json_normalize(data)
+    df = df.rename({col: col.replace("snippet.", "").replace(".value", "") for col in df.columns})
+    for name in RAW_SCHEMA.names:
+        if name not in df.columns:
+            df = df.with_columns(pl.lit(None).alias(name))
+    return df.select(RAW_SCHEMA.names)
+
+def read_raw_comments(raw_comments_file_path: str) -> pl.DataFrame:
+    """
+    Reads all raw comments of a day into a flat DataFrame with the RAW_SCHEMA columns,
+    from the compressed segments and, for older harvests, the NDJSON file.
+    """
+    frames = []
+    if os.path.exists(raw_comments_file_path):
+        frames.append(read_legacy_ndjson(raw_comments_file_path))
+
+    batches = list(iter_raw_batches(raw_comments_file_path))
+    if batches:
+        frames.append(pl.from_arrow(pa.Table.from_batches(batches, schema=RAW_SCHEMA)))
+
+    if not frames:
+        return pl.from_arrow(RAW_SCHEMA.empty_table())
+    return pl.concat(frames, how="vertical_relaxed")
@@ -0,0 +1,138 @@
+from datetime import datetime
+from typing import List, Optional
+from src.stats import sentiment_category, SENTIMENT_LABELS
+from src.metrics import metrics
+import polars as pl
+import logging
+import os
+
+# grain of the rollups, every measure below is additive over it
+ROLLUP_KEYS = ["video_id", "day", "lang", "is_reply", "sentiment_category"]
+SENTIMENT_ENUM = pl.Enum(SENTIMENT_LABELS)
+
+MEASURES = [
+    pl.len().alias("comments"),
+    # widened, the clean files keep counts as small unsigned ints
+    pl.col("likes").cast(pl.Int64).sum().alias("likes_sum"),
+    pl.col("reply_count").cast(pl.Int64).sum().alias("reply_count_sum"),
+    pl.col("sentiment_score").count().alias("sentiment_count"),
+    pl.col("sentiment_score").sum().alias("sentiment_sum"),
+    (pl.col("sentiment_score") ** 2).sum().alias("sentiment_sq_sum"),
+]
+MEASURE_COLUMNS = [m.meta.output_name() for m in MEASURES]
+
+def rollup_comments(ldf: pl.LazyFrame) -> pl.DataFrame:
+    """
+    Aggregates clean comments into ROLLUP_KEYS with additive measures. Comments without
+    language or sentiment yet are kept, with null keys.
+    """
+    columns = ldf.collect_schema().names()
+    if "lang" not in columns:
+        ldf = ldf.with_columns(pl.lit(None, dtype=pl.Categorical).alias("lang"))
+    if "sentiment_score" not in columns:
+        ldf = ldf.with_columns(pl.lit(None, dtype=pl.Float64).alias("sentiment_score"))
+
+    return (
+        ldf.with_columns([
+            pl.col("published_at").dt.date().alias("day"),
+            pl.col("video_id").cast(pl.Categorical),
+            pl.col("lang").cast(pl.Categorical),
+            sentiment_category(pl.col("sentiment_score")).cast(pl.Utf8).cast(SENTIMENT_ENUM).alias("sentiment_category"),
+        ])
+        .group_by(ROLLUP_KEYS)
+        .agg(MEASURES)
+        .sort(ROLLUP_KEYS, nulls_last=True)
+        .collect()
+    )
+
+def update_rollup(clean_comments_file_path: str, rollup_file_path: str, force: bool = False) -> bool:
+    """
+    Rolls up the comments of one day into its own rollup file. Every clean file only holds the
+    comments new on that day, so older rollups never change; a day is only rolled up again when
+    its clean file is newer than its rollup (e.g. after the analyzers attached their columns).
+
+    Returns:
+        bool: True if the rollup was (re)written.
+    """
+    if not os.path.exists(clean_comments_file_path):
+        logging.warning(f"No clean comments at {clean_comments_file_path}, nothing to roll up.")
+        return False
+    if (not force and os.path.exists(rollup_file_path)
+            and os.path.getmtime(rollup_file_path) >= os.path.getmtime(clean_comments_file_path)):
+        return False
+
+    with metrics.timer("rollup_seconds"):
+        rollup = rollup_comments(pl.scan_parquet(clean_comments_file_path))
+    rollup.write_parquet(rollup_file_path + ".tmp")
+    os.replace(rollup_file_path + ".tmp", rollup_file_path)
+    metrics.inc("rollup_rows_written_total", rollup.height)
+    return True
+
+def update_rollups(paths, force: bool = False) -> List[str]:
+    """
+    Brings the rollups of every processed date up to date.
+
+    Args:
+        paths (Paths): paths of the channel, any date.
+    Returns:
+        List[str]: dates (YYYY_MM_DD) rolled up again.
+    """
+    from paths import Paths
+
+    updated = []
+    for date_str in paths.list_processed_dates():
+        day_paths = Paths(paths.channel_handle, datetime.strptime(date_str, "%Y_%m_%d").date(), paths.base_dir)
+        if update_rollup(day_paths.clean_comments_file_path, day_paths.rollup_file_path, force=force):
+            updated.append(date_str)
+    return updated
+
+def scan_rollups(files: List[str]) -> pl.LazyFrame:
+    """The rollups of many dates as one LazyFrame, re-aggregated so every key appears once."""
+    return (
+        pl.scan_parquet(files)
+        .group_by(ROLLUP_KEYS)
+        .agg([pl.col(c).sum() for c in MEASURE_COLUMNS])
+    )
+
+def summarize(rollups: pl.LazyFrame, by: List[str], lang: Optional[str] = None) -> pl.DataFrame:
+    """
+    Rolls the rollups up to the keys in `by` and derives the usual statistics from the sums:
+    mean likes, mean replies of top level comments, sentiment mean and standard deviation.
+
+    Args:
+        rollups (pl.LazyFrame): see `scan_rollups`.
+        by (List[str]): subset of ROLLUP_KEYS, e.g. ["video_id"] or ["day", "lang"].
+        lang (str | None): keep only one language.
+    """
+    if lang is not None:
+        rollups = rollups.filter(pl.col("lang") == lang)
+    top_level = ~pl.col("is_reply")
+    return (
+        rollups.group_by(by)
+        .agg([pl.col(c).sum() for c in MEASURE_COLUMNS] + [
+            pl.col("comments").filter(top_level).sum().alias("top_level_comments"),
+            pl.col("reply_count_sum").filter(top_level).sum().alias("top_level_reply_count_sum"),
+            pl.col("comments").filter(pl.col("is_reply")).sum().alias("replies"),
+        ])
+        .with_columns([
+            (pl.col("likes_sum") / pl.col("comments")).alias("mean_likes"),
+            (pl.col("top_level_reply_count_sum") / pl.col("top_level_comments")).alias("mean_reply_count"),
+            (pl.col("replies") / pl.col("comments") * 100).alias("reply_share_%"),
+            (pl.col("sentiment_sum") / pl.col("sentiment_count")).alias("sentiment_mean"),
+            # population variance from the sums of the scores and of their squares
+            ((pl.col("sentiment_sq_sum") / pl.col("sentiment_count")
+              - (pl.col("sentiment_sum") / pl.col("sentiment_count")) ** 2).clip(lower_bound=0).sqrt()
+            ).alias("sentiment_std"),
+        ])
+        .drop(["top_level_reply_count_sum"])
+        .sort(by, nulls_last=True)
+        .collect()
+    )
+
+def per_video(rollups: pl.LazyFrame, lang: Optional[str] = None) -> pl.DataFrame:
+    """Engagement per video."""
+    return summarize(rollups, ["video_id"], lang=lang)
+
+def per_day(rollups: pl.LazyFrame, lang: Optional[str] = None) -> pl.DataFrame:
+    """Engagement per day the comments were published."""
+    return summarize(rollups, ["day"], lang=lang)
@@ -0,0 +1,313 @@
+from statistics import NormalDist
+from typing import Dict, List, Optional
+from src.stats import sentiment_category, SENTIMENT_LABELS
+from src.metrics import metrics
+import numpy as np
+import polars as pl
+import hashlib
+import logging
+import json
+
+# a stratum is the comments of one video published on one day
+STRATUM_KEY = pl.concat_str([
+    pl.col("video_id").cast(pl.Utf8), pl.col("published_at").dt.date().cast(pl.Utf8)
+], separator="|").alias("stratum")
+
+DEFAULT_MIN_PER_STRATUM = 2
+# worst case variance of a share (p = 0.5), used to size samples for a margin on shares
+SHARE_VARIANCE = 0.25
+
+def z_value(confidence: float) -> float:
+    """Two-sided normal quantile, 1.96 for 0.95."""
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
+
+# splitmix64 constants, see `_mix64`
+_GOLDEN = 0x9E3779B97F4A7C15
+_MIX_1 = 0xBF58476D1CE4E5B9
+_MIX_2 = 0x94D049BB133111EB
+# 7-byte words of a comment id that are hashed, ids are far shorter than these 112 bytes
+_ID_WORDS = 16
+# name of the hash behind `unit_value`, part of the sample descriptor
+UNIT_HASH = "splitmix64/7x16"
+
+def _mix64(x: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer, uint64 arithmetic wraps around."""
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(_MIX_1)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(_MIX_2)
+    return x ^ (x >> np.uint64(31))
+
+def _unit_values(comment_ids: pl.Series, seed: int) -> pl.Series:
+    hex_ids = comment_ids.cast(pl.Utf8).str.encode("hex")
+    total = np.zeros(comment_ids.len(), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for i in range(_ID_WORDS):
+            word = hex_ids.str.slice(14 * i, 14).str.to_integer(base=16, strict=False)
+            present = word.is_not_null().to_numpy()
+            if not present.any():
+                break
+            offset = np.uint64(((i + 1) * _GOLDEN + seed * _MIX_1) % 2 ** 64)
+            mixed = _mix64(word.fill_null(0).cast(pl.UInt64).to_numpy() + offset)
+            # words past the end of the id add nothing
+            total += np.where(present, mixed, np.uint64(0))
+        # the top 53 bits, exactly representable as a float below 1
+        values = (_mix64(total) >> np.uint64(11)).astype(np.float64) / float(2 ** 53)
+    return pl.Series(comment_ids.name, values, dtype=pl.Float64)
+
+def unit_value(seed: int = 0) -> pl.Expr:
+    """
+    Pseudo-random value in [0, 1) of every comment, from a seeded hash of its `comment_id`.
+    Unlike `Expr.hash`, the hash is plain integer arithmetic, the same on every platform and
+    library version: the UTF-8 bytes are cut into 7-byte words, each word is mixed with its
+    position and the seed, and the mixed words are summed. It runs on whole batches, in numpy.
+    """
+    return pl.col("comment_id").map_batches(lambda ids: _unit_values(ids, seed), return_dtype=pl.Float64,
+                                            is_elementwise=True)
+
+def stratum_sizes(ldf: pl.LazyFrame) -> pl.DataFrame:
+    """Comments per stratum (`stratum`, `N`), over the whole population of `ldf`."""
+    return ldf.group_by(STRATUM_KEY).agg(pl.len().alias("N")).collect()
+
+def inclusion_rates(strata: pl.DataFrame, fraction: float, min_per_stratum: int = DEFAULT_MIN_PER_STRATUM) -> pl.DataFrame:
+    """
+    Adds the sampling `rate` of every stratum: `fraction`, raised in small strata so each one
+    expects at least `min_per_stratum` comments (all of them when smaller).
+    """
+    return strata.with_columns(
+        pl.max_horizontal(pl.lit(fraction), pl.min_horizontal(pl.lit(1.0), min_per_stratum / pl.col("N"))).alias("rate")
+    )
+
+def sample_predicate(strata: pl.DataFrame, fraction: float, seed: int = 0) -> pl.Expr:
+    """
+    Rows of the stratified sample, as a filter over clean files. Membership only depends on the
+    comment, the seed and the `rate` of its stratum in `strata` (see `inclusion_rates`), so the
+    same sample is drawn on every run, over one file or many, and can be handed to the analyzers
+    (`detect_parquet(..., predicate=...)`). Strata missing from `strata` are drawn at `fraction`.
+    """
+    rate = STRATUM_KEY.replace_strict(strata["stratum"], strata["rate"], default=fraction, return_dtype=pl.Float64)
+    return unit_value(seed) < rate
+
+def fraction_for_margin(population: int, margin: float, confidence: float = 0.95,
+                        variance: float = SHARE_VARIANCE) -> float:
+    """
+    Sampling fraction whose confidence interval half-width is about `margin`, for a statistic
+    with the given per-comment `variance` (finite population corrected).
+    """
+    n0 = z_value(confidence) ** 2 * variance / margin ** 2
+    return min(1.0, n0 / (1 + n0 / population) / population)
+
+def _ratio_estimates(frame: pl.DataFrame, numerators: Dict[str, pl.Expr], denominator: pl.Expr,
+                     confidence: float) -> pl.DataFrame:
+    """
+    Stratified ratio estimates sum(y) / sum(x) of every numerator y over the population, with
+    linearized standard errors. With x = 1 they are means, with indicators they are shares of a
+    domain. Strata drawn with a single comment add no variance.
+    """
+    # per comment values first, so literals are broadcast to every row
+    values = frame.select([
+        pl.col("stratum"), pl.col("N"), denominator.cast(pl.Float64).alias("x"),
+        *[y.cast(pl.Float64).alias(f"y{i}") for i, y in enumerate(numerators.values())],
+    ])
+    x = pl.col("x")
+    aggregations = [pl.first("N").cast(pl.Float64), pl.len().cast(pl.Float64).alias("n"),
+                    x.sum().alias("sx"), (x * x).sum().alias("sxx")]
+    for i in range(len(numerators)):
+        y = pl.col(f"y{i}")
+        aggregations += [y.sum().alias(f"sy{i}"), (y * y).sum().alias(f"syy{i}"), (x * y).sum().alias(f"sxy{i}")]
+    per_stratum = values.group_by("stratum").agg(aggregations)
+
+    N, n = per_stratum["N"].to_numpy(), per_stratum["n"].to_numpy()
+    sx, sxx = per_stratum["sx"].to_numpy(), per_stratum["sxx"].to_numpy()
+    weight = N / n
+    x_total = (weight * sx).sum()
+    z = z_value(confidence)
+
+    rows = []
+    for i, name in enumerate(numerators):
+        sy, syy, sxy = (per_stratum[f"{c}{i}"].to_numpy() for c in ("sy", "syy", "sxy"))
+        ratio = (weight * sy).sum() / x_total if x_total > 0 else float("nan")
+        # within-stratum variance of the linearized values z = y - ratio * x
+        sz = sy - ratio * sx
+        szz = syy - 2 * ratio * sxy + ratio ** 2 * sxx
+        with np.errstate(divide="ignore", invalid="ignore"):
+            s2 = np.where(n > 1, (szz - sz ** 2 / n) / (n - 1), 0.0)
+        variance = (N ** 2 * (1 - n / N) * np.maximum(s2, 0) / n).sum() / x_total ** 2 if x_total > 0 else float("nan")
+        std_error = float(np.sqrt(variance))
+        rows.append({
+            "statistic": name,
+            "estimate": ratio,
+            "std_error": std_error,
+            "lower": ratio - z * std_error,
+            "upper": ratio + z * std_error,
+            "sample_count": int(sx.sum()),
+        })
+    return pl.DataFrame(rows, schema={
+        "statistic": pl.Utf8, "estimate": pl.Float64, "std_error": pl.Float64,
+        "lower": pl.Float64, "upper": pl.Float64, "sample_count": pl.Int64,
+    })
+
+class StratifiedSample:
+    """
+    Reproducible stratified sample of clean comments, with strata by `video_id` and publication
+    day, for exploratory questions. Give either the sampling `fraction` or a `margin`: the
+    half-width of the confidence interval wanted for shares, or for the mean of `column` (its
+    variance is then estimated from a small pilot sample).
+
+    Comments are drawn independently at their stratum's rate (`sample_predicate`), and the
+    estimates weight every stratum by its population size, so they carry standard errors and
+    confidence intervals. Medians, minimums and maximums need the full pass.
+
+    Args:
+        ldf (pl.LazyFrame): clean comments, see `src.encoding.scan_clean_files`.
+        seed (int): another seed draws another sample.
+        min_per_stratum (int): comments expected from every stratum, small ones are sampled whole.
+        strata (pl.DataFrame | None): `stratum_sizes` of the population, computed from `ldf` if not given.
+    """
+    def __init__(self, ldf: pl.LazyFrame, fraction: Optional[float] = None, margin: Optional[float] = None,
+                 column: Optional[str] = None, confidence: float = 0.95, seed: int = 0,
+                 min_per_stratum: int = DEFAULT_MIN_PER_STRATUM, pilot_fraction: float = 0.01,
+                 strata: Optional[pl.DataFrame] = None):
+        if (fraction is None) == (margin is None):
+            raise ValueError("Give either a sampling fraction or a margin.")
+        self.ldf = ldf
+        self.confidence = confidence
+        self.seed = seed
+        self.min_per_stratum = min_per_stratum
+        # sizes over the whole population, never over the file or batch a filter runs on
+        strata = stratum_sizes(ldf) if strata is None else strata.select(["stratum", "N"])
+        self.population = int(strata["N"].sum())
+
+        if fraction is None:
+            variance = SHARE_VARIANCE
+            if column is not None:
+                pilot = StratifiedSample(ldf, fraction=pilot_fraction, confidence=confidence, seed=seed + 1,
+                                         min_per_stratum=min_per_stratum, strata=strata)
+                variance = pilot.unit_variance(column)
+            fraction = fraction_for_margin(self.population, margin, confidence, variance)
+            logging.info(f"Sampling fraction {fraction:.4f} for a margin of {margin} at {confidence:.0%} confidence.")
+        if not 0 < fraction <= 1:
+            raise ValueError(f"The sampling fraction must be in (0, 1], got {fraction}.")
+        self.fraction = fraction
+        self.strata = inclusion_rates(strata, fraction, min_per_stratum)
+        self._frame: Optional[pl.DataFrame] = None
+
+    def descriptor(self) -> dict:
+        """
+        What identifies the sample, for resume manifests (see `src.streaming.run_streaming`):
+        the repr of `predicate()` shows neither the seed nor the rates.
+        """
+        rates = self.strata.select(["stratum", "rate"]).sort("stratum").rows()
+        return {
+            "hash": UNIT_HASH,
+            "seed": self.seed,
+            "fraction": self.fraction,
+            "rates": hashlib.sha256(json.dumps(rates).encode()).hexdigest(),
+        }
+
+    def predicate(self) -> pl.Expr:
+        """Filter of the sampled rows, for the analyzers or `src.streaming.run_streaming`."""
+        return sample_predicate(self.strata, self.fraction, self.seed)
+
+    def collect(self) -> pl.DataFrame:
+        """The sampled comments with their `stratum` and its population size `N`, drawn once."""
+        if self._frame is None:
+            with metrics.timer("sample_seconds"):
+                self._frame = (
+                    self.ldf.filter(self.predicate())
+                    .with_columns(STRATUM_KEY)
+                    .collect()
+                    .join(self.strata.select(["stratum", "N"]), on="stratum", how="left")
+                )
+            metrics.inc("sampled_comments_total", self._frame.height)
+            logging.info(f"Sampled {self._frame.height} of {self.population} comments "
+                         f"({self.fraction:.2%} + small strata) from {self.strata.height} strata.")
+        return self._frame
+
+    def lazy(self) -> pl.LazyFrame:
+        """The sample as a LazyFrame, unweighted: only for looking at comments, not for statistics."""
+        return self.collect().lazy()
+
+    def unit_variance(self, column: str) -> float:
+        """Pooled within-stratum variance of `column`, what a stratified sample of it has to beat."""
+        frame = self.collect()
+        per_stratum = frame.group_by("stratum").agg([
+            pl.first("N"), pl.col(column).cast(pl.Float64).var().fill_null(0).alias("s2")
+        ])
+        return float((per_stratum["N"] * per_stratum["s2"]).sum() / per_stratum["N"].sum())
+
+    def estimate(self, numerators: Dict[str, pl.Expr], denominator: pl.Expr = pl.lit(1.0),
+                 where: Optional[pl.Expr] = None) -> pl.DataFrame:
+        """
+        Ratio estimates of sum(numerator) / sum(denominator) over the population, optionally
+        within the domain `where`, columns `statistic`, `estimate`, `std_error`, `lower`, `upper`.
+        """
+        frame = self.collect()
+        if where is not None:
+            domain = where.fill_null(False)
+            numerators = {k: pl.when(domain).then(y).otherwise(0) for k, y in numerators.items()}
+            denominator = pl.when(domain).then(denominator).otherwise(0)
+        return _ratio_estimates(frame, numerators, denominator, self.confidence)
+
+    def mean(self, column: str, where: Optional[pl.Expr] = None) -> pl.DataFrame:
+        return self.estimate({f"mean_{column}": pl.col(column)}, where=where)
+
+    def shares(self, column: str, where: Optional[pl.Expr] = None, categories: Optional[List] = None) -> pl.DataFrame:
+        """Share of every category of `column` (the ones in the sample by default), within `where`."""
+        if categories is None:
+            categories = self.collect()[column].drop_nulls().unique().sort().to_list()
+        numerators = {str(c): (pl.col(column) == c).fill_null(False) for c in categories}
+        return self.estimate(numerators, where=where).rename({"statistic": column})
+
+def comment_statistics(sample: StratifiedSample) -> pl.DataFrame:
+    """Estimates of the means and shares of `src.stats.comment_statistics`, one row each."""
+    return sample.estimate({
+        "mean_comment_length": pl.col("comment_length"),
+        "mean_word_count": pl.col("word_count"),
+        "mean_emoji_count": pl.col("emoji_count"),
+        "comments_w_emoji_%": (pl.col("emoji_count") > 0) * 100,
+        "replies_%": pl.col("is_reply") * 100,
+    }).with_columns(pl.lit(sample.population).alias("total_comments"))
+
+def language_shares(sample: StratifiedSample, top: int = 15) -> pl.DataFrame:
+    """Estimated count and percentage of comments per language, like `src.stats.language_shares`."""
+    return (
+        sample.shares("lang")
+        .select([
+            "lang",
+            (pl.col("estimate") * sample.population).round().cast(pl.Int64).alias("count"),
+            (pl.col("estimate") * 100).round(2).alias("percentage"),
+            (pl.col("lower") * 100).round(2).alias("percentage_lower"),
+            (pl.col("upper") * 100).round(2).alias("percentage_upper"),
+            "sample_count",
+        ])
+        .sort("count", descending=True)
+        .head(top)
+    )
+
+def sentiment_distribution(sample: StratifiedSample, lang: str | None = "en") -> pl.DataFrame:
+    """
+    Estimated share of comments per sentiment category, and of replies within it, optionally
+    for one language, like `src.stats.sentiment_distribution`.
+    """
+    domain = pl.col("sentiment_score").is_not_null()
+    if lang is not None:
+        domain = domain & (pl.col("lang") == lang)
+    category = sentiment_category(pl.col("sentiment_score")).cast(pl.Utf8)
+
+    shares = sample.estimate({c: category == c for c in SENTIMENT_LABELS}, where=domain)
+    reply_shares = pl.concat([
+        sample.estimate({c: pl.col("is_reply") * 100}, where=domain & (category == c)) for c in SENTIMENT_LABELS
+    ])
+    return (
+        shares.rename({"statistic": "sentiment_category", "estimate": "share"})
+        .join(
+            reply_shares.select([
+                pl.col("statistic").alias("sentiment_category"),
+                pl.col("estimate").alias("reply_share_%"),
+                pl.col("lower").alias("reply_share_lower"),
+                pl.col("upper").alias("reply_share_upper"),
+            ]),
+            on="sentiment_category",
+        )
+        .with_columns(pl.col("sentiment_category").cast(pl.Enum(SENTIMENT_LABELS)))
+        .sort("sentiment_category")
+    )
@@ -0,0 +1,373 @@
+from bisect import bisect_left
+from datetime import datetime
+from typing import Dict, List, Optional
+from src.metrics import metrics
+from src.encoding import Vocabulary, decode_lists
+import numpy as np
+import polars as pl
+import logging
+import shutil
+import shlex
+import json
+import os
+
+POSITION_BITS = 20  # occurrences are stored as doc << POSITION_BITS | position
+_POSITION_MASK = (1 << POSITION_BITS) - 1
+# layout of meta.json and the segment folders, an index of another version is rebuilt
+INDEX_VERSION = 1
+
+# --- varint postings ---
+def varint_sizes(values: np.ndarray) -> np.ndarray:
+    """Bytes taken by every value in varint encoding."""
+    values = np.asarray(values, dtype=np.uint64)
+    n_bytes = np.ones(len(values), dtype=np.int64)
+    remaining = values >> np.uint64(7)
+    while remaining.any():
+        n_bytes += remaining > 0
+        remaining >>= np.uint64(7)
+    return n_bytes
+
+def varint_encode(values: np.ndarray) -> np.ndarray:
+    """LEB128 varint bytes of non-negative integers, 7 bits per byte, vectorized."""
+    values = np.asarray(values, dtype=np.uint64)
+    n_bytes = varint_sizes(values)
+    starts = np.cumsum(n_bytes) - n_bytes
+    out = np.empty(int(n_bytes.sum()), dtype=np.uint8)
+    for k in range(int(n_bytes.max(initial=0))):
+        mask = n_bytes > k
+        chunk = (values[mask] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        more = (n_bytes[mask] - 1 > k).astype(np.uint64) << np.uint64(7)
+        out[starts[mask] + k] = (chunk | more).astype(np.uint8)
+    return out
+
+def varint_decode(data: np.ndarray) -> np.ndarray:
+    """Inverse of `varint_encode`."""
+    data = np.asarray(data, dtype=np.uint8)
+    if len(data) == 0:
+        return np.empty(0, dtype=np.uint64)
+    is_last = data < 0x80
+    value_index = np.cumsum(is_last) - is_last
+    value_starts = np.flatnonzero(np.r_[True, is_last[:-1]])
+    shift = (np.arange(len(data)) - value_starts[value_index]) * 7
+    parts = (data & 0x7F).astype(np.uint64) << shift.astype(np.uint64)
+    return np.bitwise_or.reduceat(parts, value_starts)
+
+def _unique_sorted(values: np.ndarray) -> np.ndarray:
+    """np.unique of an already sorted array, without sorting again."""
+    if len(values) == 0:
+        return values
+    return values[np.r_[True, values[1:] != values[:-1]]]
+
+def _intersect_sorted(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """Intersection of two sorted arrays of unique values, by binary search of the smaller one."""
+    if len(left) > len(right):
+        left, right = right, left
+    if len(left) == 0:
+        return left
+    found = np.searchsorted(right, left).clip(max=len(right) - 1)
+    return left[right[found] == left]
+
+# --- segments ---
+class Segment:
+    """
+    Search index of one enriched file: a sorted term dictionary (`terms.parquet`), the
+    occurrences of every term as delta + varint encoded `doc << 20 | position` keys
+    (`postings.bin`, memory-mapped), the video of every doc (`videos.npy`) and the
+    comment_id of every doc (`docs.parquet`, read on first use).
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        terms = pl.read_parquet(os.path.join(directory, "terms.parquet"))
+        self.terms = terms["term"].to_list()
+        self.offsets = terms["offset"].to_numpy()
+        self.lengths = terms["length"].to_numpy()
+        self.doc_freq = terms["df"].to_numpy()
+        postings_path = os.path.join(directory, "postings.bin")
+        self.postings = (np.memmap(postings_path, dtype=np.uint8, mode="r")
+                         if os.path.getsize(postings_path) else np.empty(0, dtype=np.uint8))
+        self.videos = np.load(os.path.join(directory, "videos.npy"), mmap_mode="r")
+        self._comment_ids = None
+
+    def __len__(self) -> int:
+        return len(self.videos)
+
+    @property
+    def comment_ids(self) -> pl.Series:
+        if self._comment_ids is None:
+            self._comment_ids = pl.read_parquet(os.path.join(self.directory, "docs.parquet"))["comment_id"]
+        return self._comment_ids
+
+    def term_range(self, term: str, prefix: bool = False) -> range:
+        """Indices of `term` in the dictionary, or of every term starting with it."""
+        start = bisect_left(self.terms, term)
+        if not prefix:
+            return range(start, start + 1) if start < len(self.terms) and self.terms[start] == term else range(0)
+        end = bisect_left(self.terms, term + "\U0010FFFF")
+        return range(start, end)
+
+    def occurrences(self, term: str, prefix: bool = False) -> np.ndarray:
+        """Sorted occurrence keys of a term, or of every term with that prefix."""
+        keys = [
+            np.cumsum(varint_decode(self.postings[self.offsets[i]:self.offsets[i] + self.lengths[i]])).astype(np.int64)
+            for i in self.term_range(term, prefix)
+        ]
+        if not keys:
+            return np.empty(0, dtype=np.int64)
+        return keys[0] if len(keys) == 1 else np.unique(np.concatenate(keys))
+
+    def docs(self, term: str, prefix: bool = False) -> np.ndarray:
+        return _unique_sorted(self.occurrences(term, prefix) >> POSITION_BITS)
+
+    def phrase(self, terms: List[str], prefix_last: bool = False) -> np.ndarray:
+        """Docs where `terms` appear in a row (stopwords are not indexed), the last one possibly as a prefix."""
+        matches = None
+        for i, term in enumerate(terms):
+            keys = self.occurrences(term, prefix=prefix_last and i == len(terms) - 1) - i
+            matches = keys if matches is None else _intersect_sorted(matches, keys)
+            if len(matches) == 0:
+                break
+        return _unique_sorted(matches >> POSITION_BITS) if matches is not None else np.empty(0, dtype=np.int64)
+
+def build_segment(enriched_comments_file_path: str, clean_comments_file_path: str, directory: str,
+                  videos: Dict[str, int], column: str = "tokens_wo_stop", vocabulary: Optional[Vocabulary] = None) -> int:
+    """
+    Writes the segment of one enriched file to `directory`. Docs are the rows of the file, in order.
+    The files are written to a temporary folder renamed to `directory` once complete.
+
+    Args:
+        videos (Dict[str, int]): video_id -> code shared by every segment, extended in place.
+        vocabulary (Vocabulary | None): decodes the column if it is stored as token ids.
+    Returns:
+        int: number of docs.
+    """
+    df = pl.read_parquet(enriched_comments_file_path, columns=["comment_id", column])
+    if vocabulary is not None:
+        df = decode_lists(df, vocabulary, [column])
+    if os.path.exists(clean_comments_file_path):
+        video_ids = pl.read_parquet(clean_comments_file_path, columns=["comment_id", "video_id"]).with_columns(pl.col("video_id").cast(pl.Utf8))
+        df = df.join(video_ids, on="comment_id", how="left", maintain_order="left")
+    else:
+        df = df.with_columns(pl.lit(None, dtype=pl.Utf8).alias("video_id"))
+
+    for video_id in df["video_id"].drop_nulls().unique(maintain_order=True).to_list():
+        videos.setdefault(video_id, len(videos))
+    video_codes = df["video_id"].replace_strict(videos, default=-1, return_dtype=pl.Int32).to_numpy()
+
+    occurrences = (
+        df.select(column).with_row_index("doc")
+        .explode(column)
+        .drop_nulls(column)
+        .with_columns(pl.int_range(pl.len()).over("doc").alias("position"))
+        .select([
+            pl.col(column).str.to_lowercase().alias("term"),
+            (pl.col("doc").cast(pl.Int64) * (1 << POSITION_BITS)
+             + pl.col("position").clip(upper_bound=_POSITION_MASK).cast(pl.Int64)).alias("key"),
+        ])
+        .unique()
+        .sort(["term", "key"])
+    )
+    terms = occurrences.group_by("term", maintain_order=True).agg([
+        pl.len().alias("count"),
+        (pl.col("key") // (1 << POSITION_BITS)).n_unique().alias("df"),
+    ])
+
+    keys = occurrences["key"].to_numpy()
+    counts = terms["count"].to_numpy().astype(np.int64)
+    term_starts = np.cumsum(counts) - counts
+    deltas = np.diff(keys, prepend=0)
+    deltas[term_starts] = keys[term_starts]
+    encoded = varint_encode(deltas)
+    n_bytes = varint_sizes(deltas)
+    byte_ends = np.cumsum(n_bytes)
+    lengths = np.add.reduceat(n_bytes, term_starts) if len(term_starts) else np.empty(0, dtype=np.int64)
+    offsets = byte_ends[term_starts] - n_bytes[term_starts] if len(term_starts) else np.empty(0, dtype=np.int64)
+
+    tmp_dir = f"{directory}.{os.getpid()}.tmp"
+    for leftover in (tmp_dir, directory):
+        # an interrupted run, never referenced by meta.json
+        if os.path.isdir(leftover):
+            shutil.rmtree(leftover)
+    os.makedirs(tmp_dir)
+    encoded.tofile(os.path.join(tmp_dir, "postings.bin"))
+    pl.DataFrame({
+        "term": terms["term"],
+        "offset": offsets.astype(np.uint64),
+        "length": lengths.astype(np.uint64),
+        "df": terms["df"],
+    }).write_parquet(os.path.join(tmp_dir, "terms.parquet"))
+    np.save(os.path.join(tmp_dir, "videos.npy"), video_codes.astype(np.int32))
+    df.select("comment_id").write_parquet(os.path.join(tmp_dir, "docs.parquet"))
+    os.replace(tmp_dir, directory)
+    return df.height
+
+# --- index ---
+def split_query(query: str) -> List[str]:
+    """
+    Clauses of a query, "double quoted" phrases kept whole. Apostrophes are part of the words
+    (don't), and an unbalanced double quote falls back to whitespace splitting.
+    """
+    lexer = shlex.shlex(query, posix=True)
+    lexer.whitespace_split = True
+    lexer.quotes = '"'
+    lexer.escape = ""
+    try:
+        return list(lexer)
+    except ValueError:
+        return [word for word in query.replace('"', " ").split() if word]
+
+class SearchIndex:
+    """
+    Inverted index over the `tokens_wo_stop` enrichment of every enriched file, one segment per
+    file. Docs get global ordinals in segment order. Queries:
+
+        black hole          both terms (AND)
+        black OR hole       either term
+        gravit*             terms with a prefix
+        "black hol*"        phrase, the last term may be a prefix
+
+    `meta.json` points to the current folder of every segment. A rebuilt segment goes to a new
+    folder and `meta.json` is swapped afterwards, so a reader sees the old or the new segments,
+    never a mix; the folders of the previous `meta.json` are kept until the next update.
+
+    Args:
+        directory (str): folder of the index, see `Paths.search_index_dir`.
+    Raises:
+        ValueError: the index was written with another `INDEX_VERSION`.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.meta = {"version": INDEX_VERSION, "segments": [], "videos": {}}
+        meta_path = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r") as file:
+                self.meta = json.load(file)
+            if self.meta.get("version") != INDEX_VERSION:
+                raise ValueError(f"Search index at {directory} has version {self.meta.get('version')}, "
+                                 f"expected {INDEX_VERSION}, rebuild it.")
+        self.segments = [Segment(os.path.join(directory, s["dir"])) for s in self.meta["segments"]]
+        self.bases = np.cumsum([0] + [len(s) for s in self.segments])
+        self.video_ids = np.array(sorted(self.meta["videos"], key=self.meta["videos"].get), dtype=object)
+
+    def __len__(self) -> int:
+        return int(self.bases[-1])
+
+    def _clause(self, segment: Segment, clause: str) -> np.ndarray:
+        words = clause.lower().split()
+        prefix = bool(words) and words[-1].endswith("*")
+        if prefix:
+            words[-1] = words[-1].rstrip("*")
+        if not words or not words[-1]:
+            return np.empty(0, dtype=np.int64)
+        if len(words) == 1:
+            return segment.docs(words[0], prefix)
+        return segment.phrase(words, prefix)
+
+    def search(self, query: str) -> np.ndarray:
+        """Sorted global ordinals of the docs matching `query`, see the class docstring."""
+        groups = [[]]
+        for clause in split_query(query):
+            if clause == "OR":
+                groups.append([])
+            else:
+                groups[-1].append(clause)
+
+        with metrics.timer("search_seconds"):
+            hits = []
+            for base, segment in zip(self.bases, self.segments):
+                matched = []
+                for group in groups:
+                    docs = None
+                    for clause in group:
+                        clause_docs = self._clause(segment, clause)
+                        docs = clause_docs if docs is None else _intersect_sorted(docs, clause_docs)
+                    if docs is not None:
+                        matched.append(docs)
+                if matched:
+                    hits.append(np.unique(np.concatenate(matched)) + base)
+        return np.concatenate(hits) if hits else np.empty(0, dtype=np.int64)
+
+    def _locate(self, ordinals: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        segment_index = np.searchsorted(self.bases, ordinals, side="right") - 1
+        return segment_index, ordinals - self.bases[segment_index]
+
+    def comment_ids(self, ordinals: np.ndarray) -> List[str]:
+        segment_index, local = self._locate(np.asarray(ordinals))
+        ids = []
+        for i in np.unique(segment_index):
+            ids.extend(self.segments[i].comment_ids.gather(local[segment_index == i]).to_list())
+        return ids
+
+    def video_hits(self, ordinals: np.ndarray) -> pl.DataFrame:
+        """Hit count per video_id, most hits first."""
+        segment_index, local = self._locate(np.asarray(ordinals))
+        codes = np.concatenate([np.asarray(self.segments[i].videos)[local[segment_index == i]]
+                                for i in np.unique(segment_index)] or [np.empty(0, dtype=np.int32)])
+        codes, hits = np.unique(codes[codes >= 0], return_counts=True)
+        return pl.DataFrame({"video_id": self.video_ids[codes].tolist(), "hits": hits}, schema={"video_id": pl.Utf8, "hits": pl.UInt32}).sort("hits", descending=True)
+
+    def query(self, query: str, limit: Optional[int] = None) -> dict:
+        """comment_ids (up to `limit`) and per-video hit counts of the docs matching `query`."""
+        ordinals = self.search(query)
+        return {
+            "total": len(ordinals),
+            "comment_ids": self.comment_ids(ordinals[:limit]),
+            "videos": self.video_hits(ordinals),
+        }
+
+def update_search_index(paths) -> int:
+    """
+    Adds a segment for every enriched file not indexed yet, and rebuilds the segments of the
+    files that changed since they were indexed. An index of another version is rebuilt whole.
+
+    Args:
+        paths (Paths): paths of the channel, any date.
+    Returns:
+        int: number of segments written.
+    """
+    from paths import Paths
+
+    directory = paths.search_index_dir
+    try:
+        index = SearchIndex(directory)
+    except ValueError as e:
+        logging.warning(f"{e} Rebuilding it.")
+        shutil.rmtree(directory)
+        index = SearchIndex(directory)
+    segments = {s["name"]: s for s in index.meta["segments"]}
+    videos = dict(index.meta["videos"])
+    vocabulary = Vocabulary(paths.vocabulary_file_path) if os.path.exists(paths.vocabulary_file_path) else None
+    prefix = f"{paths.channel_handle}_enriched_comments_"
+    written = 0
+
+    for enriched_file in paths.list_enriched_files():
+        name = os.path.splitext(os.path.basename(enriched_file))[0]
+        stat = os.stat(enriched_file)
+        signature = [stat.st_size, stat.st_mtime_ns]
+        if name in segments and segments[name]["signature"] == signature:
+            continue
+        date_str = name[len(prefix):]
+        day_paths = Paths(paths.channel_handle, datetime.strptime(date_str, "%Y_%m_%d").date(), paths.base_dir)
+        # a new folder per build, readers of the current meta.json keep the old one
+        generation = segments[name]["generation"] + 1 if name in segments else 0
+        segment_dir = f"{name}.{generation}"
+        with metrics.timer("search_segment_seconds"):
+            docs = build_segment(enriched_file, day_paths.clean_comments_file_path, os.path.join(directory, segment_dir),
+                                 videos, vocabulary=vocabulary)
+        segments[name] = {"name": name, "dir": segment_dir, "generation": generation, "docs": docs, "signature": signature}
+        written += 1
+
+    meta = {"version": INDEX_VERSION, "segments": [segments[n] for n in sorted(segments)], "videos": videos}
+    os.makedirs(directory, exist_ok=True)
+    meta_path = os.path.join(directory, "meta.json")
+    with open(meta_path + ".tmp", "w") as file:
+        json.dump(meta, file)
+    os.replace(meta_path + ".tmp", meta_path)
+
+    # folders of neither meta.json, stale segments and interrupted builds
+    keep = {s["dir"] for s in meta["segments"]} | {s["dir"] for s in index.meta["segments"]}
+    for entry in os.listdir(directory):
+        if entry not in keep and os.path.isdir(os.path.join(directory, entry)):
+            shutil.rmtree(os.path.join(directory, entry))
+    metrics.inc("search_segments_written_total", written)
+    logging.info(f"Search index: {written} segments written, {len(meta['segments'])} in total.")
+    return written
@@ -1,6 +1,13 @@
 from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
 from tqdm.notebook import tqdm
-from typing import List
+from typing import Iterable, Iterator, List, Optional
+from src.metrics import metrics, track_batches
+from src.autotune import imap_autotuned
+from src.streaming import stream_analyzer, run_streaming
+from src.near_duplicates import REPRESENTATIVES
+from src.sampling import StratifiedSample
+import polars as pl
 import time
 
 def init_worker():
@@ -11,18 +18,57 @@ def init_worker():
 def get_compound(text):
     return analyzer.polarity_scores(text)["compound"]
 
-def get_compound_parallel(comments: List[str], workers: int = 4, chunk_size: int = None) -> List[str]:
-    
+def get_compound_parallel(comments: List[str], workers: int = 4, chunk_size: int = None, autotune: bool = False) -> List[str]:
+    """
+    Computes the VADER compound score of every comment in a process pool.
+    With `autotune=True` the worker count and chunk size are picked by `src.autotune`
+    for the current machine (cached per host), and `workers`/`chunk_size` are ignored.
+    """
     if chunk_size is None:
         chunk_size = max(1, len(comments) // (workers * 4))
 
     compound_list = []
-    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
-        futures_iterator = executor.map(get_compound, comments, chunksize=chunk_size)
+    with metrics.stage("sentiment"), ExitStack() as stack:
+        if autotune:
+            futures_iterator = imap_autotuned(get_compound, init_worker, comments, analyzer="sentiment")
+        else:
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=workers, initializer=init_worker))
+            futures_iterator = executor.map(get_compound, comments, chunksize=chunk_size)
 
-        for f in tqdm(futures_iterator, total=len(comments)):
+        start = time.time()
+        for f in tqdm(track_batches(futures_iterator, "sentiment", chunk_size), total=len(comments)):
             compound_list.append(f)
+        metrics.set_gauge("throughput_items_per_second", len(comments)/max(time.time() - start, 1e-9), stage="sentiment")
     return compound_list
 
+def get_compound_stream(batches: Iterable[tuple[int, pl.DataFrame]], workers: int = 4, chunk_size: int = 1_000,
+                        max_in_flight: Optional[int] = None) -> Iterator[tuple[int, pl.DataFrame]]:
+    """
+    Streaming variant of `get_compound_parallel`: consumes (batch_index, DataFrame[comment_id, comment])
+    batches and yields (batch_index, DataFrame[comment_id, sentiment_score]) as they complete.
+    """
+    return stream_analyzer(batches, get_compound, init_worker, "sentiment_score", pl.Float64,
+                           workers=workers, chunk_size=chunk_size, max_in_flight=max_in_flight)
+
+def get_compound_parquet(files: str | List[str], output_dir: str, batch_size: int = 50_000, workers: int = 4,
+                         chunk_size: int = 1_000, max_in_flight: Optional[int] = None,
+                         representatives_only: bool = False, predicate: Optional[pl.Expr] = None,
+                         sample: Optional[StratifiedSample] = None) -> int:
+    """
+    Out-of-core sentiment scoring over one or many clean Parquet files. Results are written
+    incrementally as `comment_id`/`sentiment_score` parts to `output_dir` and resumed on restart.
+    With `representatives_only`, near-duplicate comments are scored once per `dup_cluster_id`,
+    broadcast the results with `attach_results(..., broadcast_on="dup_cluster_id")`.
+    `predicate` restricts the run to some rows, `sample` to a stratified sample,
+    recorded in the resume manifest.
+    """
+    if sample is not None:
+        predicate = sample.predicate() if predicate is None else predicate & sample.predicate()
+    if representatives_only:
+        predicate = REPRESENTATIVES if predicate is None else REPRESENTATIVES & predicate
+    return run_streaming(files, output_dir, get_compound, init_worker, "sentiment_score", pl.Float64, "sentiment",
+                         batch_size=batch_size, workers=workers, chunk_size=chunk_size, max_in_flight=max_in_flight,
+                         predicate=predicate, sample=None if sample is None else sample.descriptor())
+
 if __name__ == "__main__":
     pass
\ No newline at end of file
@@ -0,0 +1,75 @@
+import polars as pl
+
+# sentiment bins and labels of notebook 03_6_2
+SENTIMENT_BINS = [-1, -0.75, -0.5, -0.25, -0.05, 0.05, 0.25, 0.5, 0.75, 1]
+SENTIMENT_LABELS = [
+    "Overwhelmingly Negative",
+    "Very Negative",
+    "Mostly Negative",
+    "Negative",
+    "Neutral",
+    "Positive",
+    "Mostly Positive",
+    "Very Positive",
+    "Overwhelmingly Positive"
+]
+
+def sentiment_category(score: pl.Expr) -> pl.Expr:
+    """Bins a sentiment score expression into SENTIMENT_LABELS, like `pd.cut(..., include_lowest=True)`."""
+    return score.cut(SENTIMENT_BINS[1:-1], labels=SENTIMENT_LABELS, left_closed=False)
+
+def comment_statistics(ldf: pl.LazyFrame) -> pl.DataFrame:
+    """Length, word and emoji statistics of notebook 03_3."""
+    return ldf.select([
+        pl.col("comment_length").mean().alias("mean_comment_length"),
+        pl.col("comment_length").median().alias("median_comment_length"),
+        pl.col("comment_length").min().alias("min_comment_length"),
+        pl.col("comment_length").max().alias("max_comment_length"),
+
+        pl.col("word_count").mean().alias("mean_word_count"),
+        pl.col("word_count").median().alias("median_word_count"),
+        pl.col("word_count").min().alias("min_word_count"),
+        pl.col("word_count").max().alias("max_word_count"),
+
+        pl.col("emoji_count").mean().alias("mean_emoji_count"),
+        pl.col("emoji_count").median().alias("median_emoji_count"),
+        pl.col("emoji_count").min().alias("min_emoji_count"),
+        pl.col("emoji_count").max().alias("max_emoji_count"),
+        pl.col("emoji_count").filter(pl.col("emoji_count") > 0).len().alias("comments_w_emoji"),
+        (pl.col("emoji_count").filter(pl.col("emoji_count") > 0).len() / pl.len() * 100).alias("comments_w_emoji_%"),
+
+        pl.col("is_reply").sum().alias("replies"),
+        pl.len().alias("total_comments")
+    ]).collect()
+
+def language_shares(ldf: pl.LazyFrame, top: int = 15) -> pl.DataFrame:
+    """Comment count and percentage per detected language, notebook 03_6_2."""
+    return (
+        ldf.group_by("lang")
+        .len()
+        .rename({"len": "count"})
+        .with_columns((pl.col("count") / pl.col("count").sum() * 100).round(2).alias("percentage"))
+        .sort("count", descending=True)
+        .head(top)
+        .collect()
+    )
+
+def sentiment_distribution(ldf: pl.LazyFrame, lang: str | None = "en") -> pl.DataFrame:
+    """Share of comments and of replies per sentiment category, optionally for one language."""
+    if lang is not None:
+        ldf = ldf.filter(pl.col("lang") == lang)
+    return (
+        ldf.filter(pl.col("sentiment_score").is_not_null())
+        .with_columns(sentiment_category(pl.col("sentiment_score")).alias("sentiment_category"))
+        .group_by("sentiment_category")
+        .agg([
+            pl.len().alias("count"),
+            pl.col("is_reply").sum().alias("replies"),
+        ])
+        .with_columns([
+            (pl.col("count") / pl.col("count").sum()).alias("share"),
+            (pl.col("replies") / pl.col("count") * 100).alias("reply_share_%"),
+        ])
+        .sort("sentiment_category")
+        .collect()
+    )
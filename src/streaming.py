@@ -0,0 +1,204 @@
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from typing import Callable, Iterable, Iterator, List, Optional
+from src.metrics import metrics
+import polars as pl
+import logging
+import json
+import time
+import os
+
+MANIFEST_FILE = "_manifest.json"
+
+def _apply_chunk(func: Callable, chunk: List[str]) -> list:
+    return [func(text) for text in chunk]
+
+def _chunked(items: Iterable, size: int) -> Iterator[list]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def imap_bounded(func: Callable, initializer: Callable, texts: Iterable[str], workers: int = 4,
+                 chunk_size: int = 1_000, max_in_flight: Optional[int] = None) -> Iterator:
+    """
+    Ordered parallel map over an iterator, keeping at most `max_in_flight` chunks submitted
+    at a time. Unlike `executor.map`, the input is not consumed ahead, so memory stays bounded.
+
+    Args:
+        func (Callable): top-level (picklable) function applied to each text.
+        initializer (Callable): pool initializer.
+        texts (Iterable[str]): input, consumed lazily.
+        workers (int): process count.
+        chunk_size (int): texts per submitted task.
+        max_in_flight (int): submitted chunks not yet consumed, defaults to 2 per worker.
+    """
+    max_in_flight = max_in_flight or workers * 2
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer) as executor:
+        for chunk in _chunked(texts, chunk_size):
+            if len(pending) >= max_in_flight:
+                yield from pending.popleft().result()
+            pending.append(executor.submit(_apply_chunk, func, chunk))
+        while pending:
+            yield from pending.popleft().result()
+
+def scan_batches(files: str | List[str], columns: List[str], batch_size: int = 50_000,
+                 skip: Optional[set] = None, predicate: Optional[pl.Expr] = None) -> Iterator[tuple[int, pl.DataFrame]]:
+    """
+    Yields (batch_index, DataFrame) record batches of `columns` from one or many Parquet files,
+    optionally only the rows matching `predicate`. Batch `i` always covers rows
+    [i * batch_size, (i + 1) * batch_size). The files are read once, in a single streaming
+    scan; batches in `skip` are read past but not yielded.
+    """
+    ldf = pl.scan_parquet(files)
+    if predicate is not None:
+        ldf = ldf.filter(predicate)
+    ldf = ldf.select(columns)
+    skip = skip or set()
+
+    batch_index = 0
+    buffered: List[pl.DataFrame] = []
+    buffered_rows = 0
+    # the engine's chunks may not line up with batch_size, they are re-cut to exact batches
+    for chunk in ldf.collect_batches(chunk_size=batch_size):
+        buffered.append(chunk)
+        buffered_rows += chunk.height
+        while buffered_rows >= batch_size:
+            pending = pl.concat(buffered, rechunk=False)
+            if batch_index not in skip:
+                yield batch_index, pending.slice(0, batch_size).rechunk()
+            batch_index += 1
+            rest = pending.slice(batch_size)
+            buffered, buffered_rows = ([rest] if rest.height else []), rest.height
+    if buffered_rows and batch_index not in skip:
+        yield batch_index, pl.concat(buffered).rechunk()
+
+def stream_analyzer(batches: Iterable[tuple[int, pl.DataFrame]], func: Callable, initializer: Callable,
+                    result_column: str, dtype: pl.DataType, text_column: str = "comment",
+                    workers: int = 4, chunk_size: int = 1_000, max_in_flight: Optional[int] = None) -> Iterator[tuple[int, pl.DataFrame]]:
+    """
+    Iterator-in/iterator-out analyzer: applies `func` to the `text_column` of each batch and yields
+    (batch_index, DataFrame[comment_id, result_column]) in input order.
+
+    Texts of consecutive batches share the same pool, so workers stay busy across batch boundaries,
+    while only the batches with chunks in flight are kept in memory.
+    """
+    open_batches = deque()
+
+    def texts() -> Iterator[str]:
+        for batch_index, batch in batches:
+            if batch.height == 0:
+                continue
+            open_batches.append((batch_index, batch["comment_id"]))
+            yield from batch[text_column].to_list()
+
+    buffer = []
+    for value in imap_bounded(func, initializer, texts(), workers, chunk_size, max_in_flight):
+        buffer.append(value)
+        batch_index, ids = open_batches[0]
+        if len(buffer) == ids.len():
+            open_batches.popleft()
+            yield batch_index, pl.DataFrame({"comment_id": ids, result_column: pl.Series(result_column, buffer, dtype=dtype)})
+            buffer = []
+
+def completed_batches(output_dir: str) -> set:
+    """Indices of the batches already written to `output_dir`."""
+    if not os.path.isdir(output_dir):
+        return set()
+    return {
+        int(f[len("part_"):-len(".parquet")])
+        for f in os.listdir(output_dir)
+        if f.startswith("part_") and f.endswith(".parquet")
+    }
+
+def _check_manifest(output_dir: str, manifest: dict) -> None:
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if os.path.exists(path):
+        with open(path, "r") as file:
+            previous = json.load(file)
+        if previous != manifest:
+            raise ValueError(f"Output at {output_dir} was written with a different input or batch size, "
+                             f"remove it to start over: {previous}")
+        return
+    with open(path, "w") as file:
+        json.dump(manifest, file, indent=4)
+
+def run_streaming(files: str | List[str], output_dir: str, func: Callable, initializer: Callable,
+                  result_column: str, dtype: pl.DataType, stage: str, batch_size: int = 50_000,
+                  workers: int = 4, chunk_size: int = 1_000, max_in_flight: Optional[int] = None,
+                  predicate: Optional[pl.Expr] = None, sample: Optional[dict] = None) -> int:
+    """
+    Out-of-core analyzer run: reads `comment_id` and `comment` from the Parquet `files` in batches
+    and writes one `part_<batch>.parquet` file per completed batch into `output_dir`.
+    Parts are written atomically, so an interrupted run resumes from the last completed batch.
+    With a `predicate`, only the matching rows are analyzed (e.g. `src.near_duplicates.REPRESENTATIVES`).
+    A `predicate` drawing a sample must come with its `sample` descriptor
+    (`src.sampling.StratifiedSample.descriptor()`), the repr of the expression does not tell samples apart.
+
+    Returns:
+        int: number of batches processed in this run.
+    """
+    files = [files] if isinstance(files, str) else list(files)
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = {"files": [os.path.basename(f) for f in files], "batch_size": batch_size, "column": result_column}
+    if predicate is not None:
+        manifest["predicate"] = str(predicate)
+    if sample is not None:
+        manifest["sample"] = sample
+    _check_manifest(output_dir, manifest)
+
+    done = completed_batches(output_dir)
+    if done:
+        logging.info(f"Resuming {stage}: {len(done)} batches already completed in {output_dir}")
+
+    processed = 0
+    batch_start = time.perf_counter()
+    with metrics.stage(stage):
+        batches = scan_batches(files, ["comment_id", "comment"], batch_size, skip=done, predicate=predicate)
+        results = stream_analyzer(batches, func, initializer, result_column, dtype,
+                                  workers=workers, chunk_size=chunk_size, max_in_flight=max_in_flight)
+        for batch_index, frame in results:
+            part_path = os.path.join(output_dir, f"part_{batch_index:06d}.parquet")
+            frame.write_parquet(part_path + ".tmp", compression="zstd")
+            os.replace(part_path + ".tmp", part_path)
+
+            # batches overlap in the pool, a batch takes the time since the previous one was written
+            elapsed = time.perf_counter() - batch_start
+            processed += 1
+            metrics.inc("items_processed_total", frame.height, stage=stage)
+            metrics.observe("batch_latency_seconds", elapsed, stage=stage)
+            metrics.event("batch", stage=stage, batch_index=batch_index, items=frame.height, duration_s=round(elapsed, 4))
+            batch_start = time.perf_counter()
+    logging.info(f"{stage} finished: {processed} batches written to {output_dir}")
+    return processed
+
+def attach_results(target_file: str, results_dir: str, broadcast_on: Optional[str] = None) -> None:
+    """
+    Joins the streamed results in `results_dir` onto `target_file` by `comment_id`, without loading
+    either side fully in memory. An existing column with the same name is replaced.
+
+    With `broadcast_on` (e.g. "dup_cluster_id"), results computed for some rows only are copied
+    to every row of `target_file` sharing that column's value.
+    """
+    results = pl.scan_parquet(os.path.join(results_dir, "part_*.parquet"))
+    result_columns = [c for c in results.collect_schema().names() if c != "comment_id"]
+    target = pl.scan_parquet(target_file)
+    target = target.drop([c for c in result_columns if c in target.collect_schema().names()])
+
+    on = "comment_id"
+    if broadcast_on is not None:
+        results = (
+            results.join(target.select(["comment_id", broadcast_on]), on="comment_id")
+            .drop("comment_id")
+            .unique(broadcast_on, keep="first")
+        )
+        on = broadcast_on
+
+    tmp_path = target_file + ".tmp"
+    target.join(results, on=on, how="left", maintain_order="left").sink_parquet(tmp_path)
+    os.replace(tmp_path, target_file)
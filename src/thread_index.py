@@ -0,0 +1,271 @@
+from datetime import datetime
+from typing import List, Optional
+from src.metrics import metrics
+import numpy as np
+import polars as pl
+import logging
+import shutil
+import json
+import os
+
+NO_PARENT = -1
+# node columns, one .npy file each, aligned by node id
+NODE_ARRAYS = {"parent": np.int64, "published_at": np.int64, "likes": np.int64}
+# children of node i are children[indptr[i]:indptr[i + 1]], in node (arrival) order
+CSR_ARRAYS = {"indptr": np.int64, "children": np.int64}
+# layout of meta.json and the arrays, an index of another version is rebuilt
+INDEX_VERSION = 1
+
+class ThreadIndex:
+    """
+    Reply-thread graph of the comments of a channel, with every `comment_id` mapped to a dense
+    node id (its arrival order). The parent of every node, its publication time (epoch ms) and
+    likes are stored as NumPy arrays, and the children of every node as CSR arrays
+    (`indptr`, `children`), so thread metrics are vectorized passes over the whole corpus.
+
+    On disk it is a folder of `.npy` files, memory-mapped on load, plus `ids.parquet`
+    (node -> comment_id) and `meta.json` (node count and the clean files already indexed). It grows
+    with `append`; replies whose parent is not indexed yet are kept as pending and linked when
+    the parent arrives.
+
+    Args:
+        directory (str): folder of the index, see `Paths.thread_index_dir`.
+        mmap (bool): memory-map the arrays instead of reading them.
+    Raises:
+        ValueError: the index was written with another `INDEX_VERSION`, or is inconsistent.
+    """
+    def __init__(self, directory: str, mmap: bool = True):
+        self.directory = directory
+        self.meta = {"version": INDEX_VERSION, "nodes": 0, "files": {}}
+        self.parent = np.empty(0, dtype=np.int64)
+        self.published_at = np.empty(0, dtype=np.int64)
+        self.likes = np.empty(0, dtype=np.int64)
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.children = np.empty(0, dtype=np.int64)
+        self._ids = None
+        self._pending = pl.DataFrame(schema={"node": pl.Int64, "parent_id": pl.Utf8})
+
+        meta_path = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r") as file:
+                self.meta = json.load(file)
+            if self.meta.get("version") != INDEX_VERSION:
+                raise ValueError(f"Thread index at {directory} has version {self.meta.get('version')}, "
+                                 f"expected {INDEX_VERSION}, rebuild it.")
+            mmap_mode = "r" if mmap else None
+            for name in {**NODE_ARRAYS, **CSR_ARRAYS}:
+                setattr(self, name, np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode))
+            pending_path = os.path.join(directory, "pending.parquet")
+            if os.path.exists(pending_path):
+                self._pending = pl.read_parquet(pending_path)
+            if len(self.parent) != self.meta["nodes"] or len(self.indptr) != self.meta["nodes"] + 1:
+                raise ValueError(f"Thread index at {directory} is inconsistent with its meta.json, rebuild it.")
+
+    def __len__(self) -> int:
+        return self.meta["nodes"]
+
+    @property
+    def ids(self) -> pl.Series:
+        """comment_id of every node, loaded on first use."""
+        if self._ids is None:
+            ids_path = os.path.join(self.directory, "ids.parquet")
+            self._ids = (
+                pl.read_parquet(ids_path)["comment_id"] if os.path.exists(ids_path)
+                else pl.Series("comment_id", [], dtype=pl.Utf8)
+            )
+        return self._ids
+
+    def node_ids(self, comment_ids: List[str] | pl.Series) -> np.ndarray:
+        """Node id of every comment id, -1 for the ones not indexed."""
+        lookup = pl.DataFrame({"comment_id": self.ids, "node": np.arange(len(self), dtype=np.int64)})
+        query = pl.DataFrame({"comment_id": pl.Series(comment_ids, dtype=pl.Utf8)})
+        return (
+            query.join(lookup, on="comment_id", how="left", maintain_order="left")["node"]
+            .fill_null(NO_PARENT)
+            .to_numpy()
+        )
+
+    def append(self, df: pl.DataFrame) -> int:
+        """
+        Adds the comments of `df` (comment_id, parent_id, published_at, likes) that are not
+        indexed yet and rebuilds the CSR arrays.
+
+        Returns:
+            int: number of new nodes.
+        """
+        new = df.select(["comment_id", "parent_id", "published_at", "likes"]).unique("comment_id", maintain_order=True)
+        new = new.join(pl.DataFrame({"comment_id": self.ids}), on="comment_id", how="anti")
+        if new.is_empty():
+            return 0
+
+        start = len(self)
+        ids = pl.concat([self.ids, new["comment_id"]])
+        lookup = pl.DataFrame({"comment_id": ids, "node": np.arange(len(ids), dtype=np.int64)})
+
+        # parents of the new nodes, and of the pending ones from earlier batches
+        orphans = pl.concat([
+            self._pending,
+            new.with_columns(pl.int_range(start, start + new.height, dtype=pl.Int64).alias("node"))
+               .filter(pl.col("parent_id").is_not_null())
+               .select(["node", "parent_id"]),
+        ])
+        resolved = orphans.join(lookup.rename({"comment_id": "parent_id", "node": "parent"}), on="parent_id", how="left")
+
+        parent = np.concatenate([np.asarray(self.parent), np.full(new.height, NO_PARENT, dtype=np.int64)])
+        linked = resolved.filter(pl.col("parent").is_not_null())
+        parent[linked["node"].to_numpy()] = linked["parent"].to_numpy()
+        self._pending = resolved.filter(pl.col("parent").is_null()).select(["node", "parent_id"])
+
+        published_at = new["published_at"].dt.cast_time_unit("ms").dt.epoch("ms").fill_null(0).to_numpy()
+        self.parent = parent
+        self.published_at = np.concatenate([np.asarray(self.published_at), published_at.astype(np.int64)])
+        self.likes = np.concatenate([np.asarray(self.likes), new["likes"].fill_null(0).to_numpy().astype(np.int64)])
+        self._ids = ids
+        self.meta["nodes"] = len(ids)
+        self.indptr, self.children = build_csr(self.parent)
+
+        metrics.inc("thread_index_nodes_added_total", new.height)
+        if self._pending.height:
+            logging.info(f"{self._pending.height} replies wait for their parent comment to be indexed.")
+        return new.height
+
+    def save(self) -> None:
+        """Writes every array, then `meta.json`, each file atomically."""
+        os.makedirs(self.directory, exist_ok=True)
+        for name, dtype in {**NODE_ARRAYS, **CSR_ARRAYS}.items():
+            path = os.path.join(self.directory, f"{name}.npy")
+            with open(path + ".tmp", "wb") as file:
+                np.save(file, np.asarray(getattr(self, name), dtype=dtype))
+            os.replace(path + ".tmp", path)
+        for name, frame in (("ids", pl.DataFrame({"comment_id": self.ids})), ("pending", self._pending)):
+            path = os.path.join(self.directory, f"{name}.parquet")
+            frame.write_parquet(path + ".tmp")
+            os.replace(path + ".tmp", path)
+        meta_path = os.path.join(self.directory, "meta.json")
+        with open(meta_path + ".tmp", "w") as file:
+            json.dump(self.meta, file, indent=4)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    # --- thread metrics ---
+    def child_counts(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    def roots(self) -> np.ndarray:
+        """Root (top level comment) of the thread of every node, by pointer jumping."""
+        root = np.where(self.parent == NO_PARENT, np.arange(len(self)), self.parent)
+        while True:
+            jumped = root[root]
+            if np.array_equal(jumped, root):
+                return root
+            root = jumped
+
+    def depth(self) -> np.ndarray:
+        """Distance of every node to the root of its thread, 0 for top level comments."""
+        depth = np.zeros(len(self), dtype=np.int64)
+        current = np.asarray(self.parent)
+        while True:
+            has_parent = current != NO_PARENT
+            if not has_parent.any():
+                return depth
+            depth += has_parent
+            current = np.where(has_parent, self.parent[np.where(has_parent, current, 0)], NO_PARENT)
+
+    def thread_sizes(self) -> np.ndarray:
+        """Number of comments in the thread of every node, the root included."""
+        roots = self.roots()
+        return np.bincount(roots, minlength=len(self))[roots]
+
+    def reduce_children(self, values: np.ndarray, ufunc: np.ufunc = np.add, empty: float = np.nan) -> np.ndarray:
+        """
+        Reduces `values` (aligned by node) over the children of every node with `ufunc`,
+        e.g. np.add or np.minimum. Nodes without children get `empty`.
+        """
+        counts = self.child_counts()
+        result = np.full(len(self), empty, dtype=np.result_type(values, type(empty)))
+        has_children = counts > 0
+        if has_children.any():
+            child_values = np.asarray(values)[self.children]
+            result[has_children] = ufunc.reduceat(child_values, self.indptr[:-1][has_children])
+        return result
+
+    def time_to_first_reply(self) -> np.ndarray:
+        """Seconds from every comment to its first reply, NaN without replies."""
+        first = self.reduce_children(self.published_at.astype(np.float64), np.minimum)
+        return (first - self.published_at) / 1_000
+
+    def child_mean(self, values: np.ndarray) -> np.ndarray:
+        """Mean of `values` over the children of every node, ignoring NaN, e.g. the sentiment of the replies."""
+        values = np.asarray(values, dtype=np.float64)
+        valid = ~np.isnan(values)
+        sums = self.reduce_children(np.where(valid, values, 0.0), np.add, empty=0.0)
+        counts = self.reduce_children(valid.astype(np.float64), np.add, empty=0.0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return sums / counts
+
+    def align(self, df: pl.DataFrame, column: str, fill: float = np.nan) -> np.ndarray:
+        """Values of `column` of `df` (with comment_id) in node order, `fill` for the missing ones."""
+        nodes = self.node_ids(df["comment_id"])
+        known = nodes != NO_PARENT
+        result = np.full(len(self), fill, dtype=np.float64)
+        result[nodes[known]] = df[column].cast(pl.Float64).fill_null(fill).to_numpy()[known]
+        return result
+
+    def thread_metrics(self) -> pl.DataFrame:
+        """Per comment: root comment, depth, replies, thread size and time to first reply."""
+        return pl.DataFrame({
+            "comment_id": self.ids,
+            "root_id": self.ids.gather(self.roots()),
+            "depth": self.depth(),
+            "replies": self.child_counts(),
+            "thread_size": self.thread_sizes(),
+            "time_to_first_reply_s": self.time_to_first_reply(),
+        })
+
+def build_csr(parent: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Children CSR arrays of a parent array, with a stable counting sort by parent."""
+    parent = np.asarray(parent)
+    n = len(parent)
+    has_parent = parent != NO_PARENT
+    counts = np.bincount(parent[has_parent], minlength=n)
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    children = np.flatnonzero(has_parent)[np.argsort(parent[has_parent], kind="stable")].astype(np.int64)
+    return indptr, children
+
+def update_thread_index(paths, dates: Optional[List[str]] = None) -> int:
+    """
+    Adds the clean comments of every processed date to the thread index of the channel. A date
+    is read again whenever its clean file changed since it was indexed (re-cleaned or appended),
+    only the comments not indexed yet are added. An index of another version is rebuilt from
+    every processed date.
+
+    Args:
+        paths (Paths): paths of the channel, any date.
+        dates (List[str] | None): dates (YYYY_MM_DD) to add, defaults to every processed date.
+    Returns:
+        int: number of new nodes.
+    """
+    from paths import Paths
+
+    try:
+        index = ThreadIndex(paths.thread_index_dir, mmap=False)
+    except ValueError as e:
+        logging.warning(f"{e} Rebuilding it.")
+        shutil.rmtree(paths.thread_index_dir)
+        index = ThreadIndex(paths.thread_index_dir, mmap=False)
+        dates = None
+    # signature of the clean file of every indexed date
+    indexed_files = index.meta["files"]
+    added = 0
+    for date_str in dates or paths.list_processed_dates():
+        day_paths = Paths(paths.channel_handle, datetime.strptime(date_str, "%Y_%m_%d").date(), paths.base_dir)
+        stat = os.stat(day_paths.clean_comments_file_path)
+        signature = [stat.st_size, stat.st_mtime_ns]
+        if indexed_files.get(date_str) == signature:
+            continue
+        df = pl.read_parquet(day_paths.clean_comments_file_path, columns=["comment_id", "parent_id", "published_at", "likes"])
+        added += index.append(df)
+        indexed_files[date_str] = signature
+    index.save()
+    logging.info(f"Thread index has {len(index)} comments, {added} new.")
+    return added
@@ -1,5 +1,6 @@
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from src.data_acquisition import execute_request
 import config
 
 API_SERVICE_NAME = config.API_SERVICE_NAME
@@ -28,7 +29,7 @@ def get_channel_id(user_handle: str) -> str | None:
     try:
         with build(API_SERVICE_NAME, API_VERSION, developerKey = API_KEY) as youtube:
             request = youtube.channels().list(**params) 
-            response = request.execute()
+            response = execute_request(request, "channels.list")
             return response['items'][0]['id']
 
     except (KeyError, IndexError):
@@ -0,0 +1,211 @@
+from concurrent.futures import ProcessPoolExecutor
+from collections import Counter
+from typing import Dict, List, Optional
+from src.encoding import Vocabulary, TOKEN_ID
+from src.metrics import metrics
+import numpy as np
+import polars as pl
+import hashlib
+import logging
+import json
+import os
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets")
+
+# colors and geometry of notebooks 03_1 and 03_4
+CLOUD_COLORS = ["#FBBE00", "#E30050", "#E32E01", "#FFFFFF", "#FF7F50"]
+CLOUD_BACKGROUND = "#0B0F33"
+DEFAULT_CLOUD_PARAMS = dict(
+    font_path = os.path.join(ASSETS_DIR, 'Montserrat-Regular.ttf'),
+    width = 1000,
+    height = 1000,
+    max_font_size = 150,
+    max_words = 100,
+    background_color = CLOUD_BACKGROUND,
+    contour_width = 0
+)
+# WordCloud parameters that change where the words go, colors and background do not
+LAYOUT_PARAMS = [
+    "font_path", "width", "height", "margin", "prefer_horizontal", "scale", "max_words", "min_font_size",
+    "max_font_size", "font_step", "relative_scaling", "random_state", "repeat", "mode", "mask", "contour_width",
+]
+
+def build_token_counter(files: List[str], column: str = "tokens_wo_stop", duplicates: Optional[pl.LazyFrame] = None,
+                        vocabulary: Optional[Vocabulary] = None) -> Counter:
+    """
+    Token frequencies of a list column over the enriched files, one file at a time.
+
+    Args:
+        duplicates (pl.LazyFrame | None): `comment_id`/`dup_cluster_id` of the clean files, to count
+            every near-duplicate cluster once instead of once per copy.
+        vocabulary (Vocabulary | None): vocabulary of the files with encoded token ids, ids are
+            counted and only the distinct ones decoded.
+    """
+    counter = Counter()
+    for path in files:
+        ldf = pl.scan_parquet(path)
+        if duplicates is not None:
+            ldf = ldf.join(duplicates, on="comment_id", how="left")
+            # comments without cluster info are all counted, one comment per cluster otherwise
+            ldf = pl.concat([
+                ldf.filter(pl.col("dup_cluster_id").is_null()),
+                ldf.filter(pl.col("dup_cluster_id").is_not_null()).unique("dup_cluster_id", keep="first"),
+            ])
+        token_counts = (
+            ldf.select(column)
+            .explode(column)
+            .drop_nulls(column)
+            .group_by(column)
+            .len()
+            .collect()
+        )
+        tokens = token_counts[column]
+        if vocabulary is not None and tokens.dtype == TOKEN_ID:
+            tokens = vocabulary.decode_ids(tokens)
+        counter.update(dict(zip(tokens, token_counts["len"])))
+    return counter
+
+def build_token_counters(files: List[str], clean_files: List[str], by: str, column: str = "tokens_wo_stop",
+                         vocabulary: Optional[Vocabulary] = None) -> Dict[str, Counter]:
+    """
+    Token frequencies per slice of comments, e.g. per `script` or `video_id` of the clean files,
+    for `render_word_clouds`.
+    """
+    from src.encoding import scan_clean_files
+
+    slices = scan_clean_files(clean_files).select(["comment_id", pl.col(by).cast(pl.Utf8)])
+    counters: Dict[str, Counter] = {}
+    for path in files:
+        token_counts = (
+            pl.scan_parquet(path)
+            .select(["comment_id", column])
+            .join(slices, on="comment_id", how="inner")
+            .explode(column)
+            .drop_nulls([column, by])
+            .group_by([by, column])
+            .len()
+            .collect()
+        )
+        tokens = token_counts[column]
+        if vocabulary is not None and tokens.dtype == TOKEN_ID:
+            tokens = vocabulary.decode_ids(tokens)
+        for key, token, count in zip(token_counts[by], tokens, token_counts["len"]):
+            counters.setdefault(key, Counter())[token] += count
+    return counters
+
+def top_frequencies(frequencies: dict, max_words: int) -> Dict[str, float]:
+    """The `max_words` most frequent words, ties by word, the only ones WordCloud places."""
+    top = sorted(frequencies.items(), key=lambda item: (-item[1], item[0]))[:max_words]
+    return {word: float(count) for word, count in top}
+
+def layout_key(frequencies: dict, params: dict) -> str:
+    """Hash of the top words and the geometry of a cloud, see LAYOUT_PARAMS."""
+    geometry = {k: params.get(k) for k in LAYOUT_PARAMS}
+    if geometry["font_path"]:
+        geometry["font_path"] = os.path.abspath(geometry["font_path"])
+    if not isinstance(geometry["random_state"], (int, type(None))):
+        geometry["random_state"] = repr(geometry["random_state"])
+    if geometry["mask"] is not None:
+        # the mask is an image array, keyed by its pixels
+        mask = np.ascontiguousarray(geometry["mask"])
+        geometry["mask"] = [mask.shape, str(mask.dtype), hashlib.sha256(mask.tobytes()).hexdigest()]
+    payload = json.dumps([geometry, list(frequencies.items())], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class LayoutCache:
+    """
+    Word placements of rendered clouds, one JSON file per `layout_key`, see `Paths.word_cloud_cache_dir`.
+    The layout search of WordCloud is most of a render, a cached layout is only recolored and drawn.
+    """
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def load(self, key: str) -> Optional[list]:
+        if not os.path.exists(self.path(key)):
+            return None
+        try:
+            with open(self.path(key), "r", encoding="utf-8") as file:
+                return [((word, freq), font_size, tuple(position), orientation, color)
+                        for (word, freq), font_size, position, orientation, color in json.load(file)]
+        except (json.JSONDecodeError, ValueError):
+            logging.warning(f"Unreadable cloud layout at {self.path(key)}, it is computed again.")
+            return None
+
+    def save(self, key: str, layout: list) -> None:
+        entries = [[[word, float(freq)], int(font_size), [int(position[0]), int(position[1])],
+                    None if orientation is None else int(orientation), color]
+                   for (word, freq), font_size, position, orientation, color in layout]
+        # unique temporary file, several worker processes may render the same cloud
+        tmp_path = f"{self.path(key)}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(entries, file, ensure_ascii=False)
+        os.replace(tmp_path, self.path(key))
+
+def make_word_cloud(frequencies: dict, cache: Optional[LayoutCache] = None, **kwargs):
+    """
+    WordCloud of a frequency map with the default parameters of the notebooks, overridden by
+    `kwargs`. With a `cache`, the layout is reused when the top words and the geometry did not
+    change, and only the colors follow `kwargs`.
+    """
+    from wordcloud import WordCloud
+    from matplotlib.colors import ListedColormap
+
+    params = {**DEFAULT_CLOUD_PARAMS, "colormap": ListedColormap(CLOUD_COLORS), **kwargs}
+    wordcloud = WordCloud(**params)
+    top = top_frequencies(frequencies, wordcloud.max_words)
+    key = layout_key(top, params) if cache is not None else None
+    layout = cache.load(key) if cache is not None else None
+
+    if layout is None:
+        with metrics.timer("word_cloud_layout_seconds"):
+            wordcloud.generate_from_frequencies(top)
+        if cache is not None:
+            cache.save(key, wordcloud.layout_)
+    else:
+        metrics.inc("word_cloud_layout_cache_hits_total")
+        wordcloud.layout_ = layout
+        max_frequency = max(top.values())
+        wordcloud.words_ = {word: count / max_frequency for word, count in top.items()}
+    # colors from the current parameters only, the same for a cached or a new layout
+    return wordcloud.recolor(random_state=params.get("random_state"))
+
+def render_word_cloud(frequencies: dict, output_file: str, cache: Optional[LayoutCache] = None, **kwargs) -> None:
+    """Renders a cloud of words from a frequency map into an image file."""
+    make_word_cloud(frequencies, cache, **kwargs).to_file(output_file)
+
+def _render_slice(frequencies: dict, output_file: str, cache_dir: Optional[str], kwargs: dict) -> str:
+    cache = LayoutCache(cache_dir) if cache_dir else None
+    render_word_cloud(frequencies, output_file, cache, **kwargs)
+    return output_file
+
+def render_word_clouds(slices: Dict[str, dict], output_dir: str, cache_dir: Optional[str] = None,
+                       max_workers: int = 4, prefix: str = "cloud_of_words", **kwargs) -> Dict[str, str]:
+    """
+    Renders one cloud per slice (e.g. from `build_token_counters`) in worker processes, sharing
+    the layout cache in `cache_dir`.
+
+    Returns:
+        Dict[str, str]: image file of every slice.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    files = {}
+    with metrics.stage("word_clouds"), ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            name: executor.submit(_render_slice, frequencies,
+                                  os.path.join(output_dir, f"{prefix}_{_safe_name(name)}.png"), cache_dir, kwargs)
+            for name, frequencies in slices.items() if frequencies
+        }
+        for name, future in futures.items():
+            try:
+                files[name] = future.result()
+            except Exception as e:
+                logging.error(f"Cloud of words for {name} failed: {e}")
+        metrics.inc("items_processed_total", len(files), stage="word_clouds")
+    return files
+
+def _safe_name(name: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in str(name))
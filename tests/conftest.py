@@ -0,0 +1,6 @@
+import os
+import sys
+
+# config.py refuses to load without an API key
+os.environ.setdefault("api_key", "test-key")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
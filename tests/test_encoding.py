@@ -0,0 +1,18 @@
+import polars as pl
+
+from src.encoding import Vocabulary, encode_lists, decode_lists
+
+def test_concurrent_vocabularies_agree_on_ids(tmp_path):
+    path = str(tmp_path / "vocabulary.parquet")
+    first = Vocabulary(path)
+    second = Vocabulary(path)
+
+    # each instance loaded the vocabulary before the other added its tokens
+    a = encode_lists(pl.DataFrame({"tokens_wo_stop": [["black", "hole"]]}), first)
+    b = encode_lists(pl.DataFrame({"tokens_wo_stop": [["white", "hole"]]}), second)
+
+    assert a["tokens_wo_stop"].to_list() == [[0, 1]]
+    assert b["tokens_wo_stop"].to_list() == [[2, 1]]
+    fresh = Vocabulary(path)
+    assert decode_lists(b, fresh)["tokens_wo_stop"].to_list() == [["white", "hole"]]
+    assert decode_lists(a, fresh)["tokens_wo_stop"].to_list() == [["black", "hole"]]
@@ -0,0 +1,98 @@
+import json
+
+import src.data_acquisition as data_acquisition
+from paths import Paths
+from src.harvest import harvest_channel, harvest_channels
+from src.quota import KeyPool
+
+class FakeRequest:
+    uri = "https://www.googleapis.com/youtube/v3/commentThreads?videoId=v"
+
+    def __init__(self, page: int):
+        self.page = page
+
+    def execute(self) -> dict:
+        # endless pages, one comment each
+        return {
+            "items": [{"snippet": {"totalReplyCount": 0, "topLevelComment": {
+                "id": f"c{self.page}", "snippet": {
+                    "channelId": "ch", "textDisplay": "hello", "authorDisplayName": "a",
+                    "authorChannelId": {"value": "a"}, "likeCount": 0,
+                    "publishedAt": "2024-01-01T00:00:00Z"}}}}],
+            "nextPageToken": str(self.page + 1),
+        }
+
+class FakeYouTube:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def commentThreads(self):
+        return self
+
+    def list(self, pageToken=None, **params):
+        return FakeRequest(int(pageToken or 0))
+
+def write_videos(channel_paths: Paths, count: int) -> None:
+    channel_paths.resolve_all_paths()
+    with open(channel_paths.videos_file_path, "w") as file:
+        json.dump([{"videoId": f"v{i}", "done": False, "nextPageToken": None} for i in range(count)], file)
+
+def test_units_charged_match_units_reported(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_acquisition, "build", lambda *args, **kwargs: FakeYouTube())
+    channel_paths = Paths("fake", base_dir=str(tmp_path))
+    write_videos(channel_paths, 5)
+    pool = KeyPool(["k1", "k2"], str(tmp_path / "quota.json"), daily_limit=100)
+
+    used, pending = harvest_channel("fake", pool, quota_budget=10, channel_paths=channel_paths)
+
+    assert used == 10
+    assert 200 - pool.remaining() == used
+    assert pending
+    with open(channel_paths.videos_file_path) as file:
+        videos = json.load(file)
+    # the budget ran out on the first video, the others were not touched
+    assert videos[0]["nextPageToken"] is not None
+    assert all(video["nextPageToken"] is None for video in videos[1:])
+
+def test_channels_with_work_left_share_the_rest(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_acquisition, "build", lambda *args, **kwargs: FakeYouTube())
+    for channel in ("a", "b"):
+        write_videos(Paths(channel, base_dir=str(tmp_path)), 2)
+    pool = KeyPool(["k1"], str(tmp_path / "quota.json"), daily_limit=120)
+
+    used = harvest_channels({"a": 2, "b": 1}, pool, max_workers=2, min_budget=5, base_dir=str(tmp_path))
+
+    # endless videos: both channels stay active until the pool is below the minimum share
+    assert used["a"] > used["b"] > 0
+    assert sum(used.values()) == 120 - pool.remaining()
+    assert pool.remaining() < 10
+
+QUOTA_EXCEEDED = json.dumps({"error": {"code": 403, "message": "quota exceeded", "errors": [
+    {"message": "quota exceeded", "domain": "youtube.quota", "reason": "quotaExceeded"}]}}).encode()
+
+def test_quota_exceeded_rotates_key_and_is_recorded(tmp_path):
+    import httplib2
+    from googleapiclient.errors import HttpError
+    from src.metrics import metrics
+
+    class QuotaExceededOnce(FakeRequest):
+        calls = 0
+
+        def execute(self) -> dict:
+            QuotaExceededOnce.calls += 1
+            if QuotaExceededOnce.calls == 1:
+                raise HttpError(httplib2.Response({"status": 403}), QUOTA_EXCEEDED)
+            return super().execute()
+
+    pool = KeyPool(["k1", "k2"], str(tmp_path / "quota.json"), daily_limit=100)
+    before = metrics.snapshot()["counters"].get("api_retries_total", {})
+    with data_acquisition.use_key_pool(pool):
+        data_acquisition.execute_request(QuotaExceededOnce(0), "commentThreads.list")
+    after = metrics.snapshot()["counters"]["api_retries_total"]
+
+    assert sum(after.values()) == sum(before.values()) + 1
+    # the first key is spent, the second one paid for the retry
+    assert pool.remaining() == 99
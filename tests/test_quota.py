@@ -0,0 +1,43 @@
+import json
+
+from src.quota import KeyPool
+
+def test_usage_saved_in_batches_and_on_flush(tmp_path):
+    usage_file = tmp_path / "quota.json"
+    pool = KeyPool(["k1"], str(usage_file), daily_limit=100, save_every=3)
+
+    pool.acquire()
+    pool.acquire()
+    assert not usage_file.exists()
+    pool.acquire()
+    assert next(iter(json.loads(usage_file.read_text()).values()))["used"] == 3
+
+    pool.acquire()
+    pool.flush()
+    assert KeyPool(["k1"], str(usage_file), daily_limit=100).remaining() == 96
+    assert not list(tmp_path.glob("*.tmp"))
+
+def test_concurrent_pools_add_up(tmp_path):
+    usage_file = tmp_path / "quota.json"
+    pipeline = KeyPool(["k1"], str(usage_file), daily_limit=100)
+    harvest = KeyPool(["k1"], str(usage_file), daily_limit=100)
+
+    pipeline.acquire(5)
+    harvest.acquire(7)
+    pipeline.flush()
+    harvest.flush()
+
+    assert KeyPool(["k1"], str(usage_file), daily_limit=100).remaining() == 88
+    # a save also brings in what the other process charged
+    assert harvest.remaining() == 88
+
+def test_exhausted_key_stays_spent_after_merge(tmp_path):
+    usage_file = tmp_path / "quota.json"
+    first = KeyPool(["k1"], str(usage_file), daily_limit=100)
+    second = KeyPool(["k1"], str(usage_file), daily_limit=100)
+
+    second.acquire(30)
+    second.flush()
+    first.mark_exhausted("k1")
+
+    assert KeyPool(["k1"], str(usage_file), daily_limit=100).remaining() == 0
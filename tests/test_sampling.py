@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+
+import polars as pl
+
+from src.sampling import StratifiedSample, sample_predicate, inclusion_rates, stratum_sizes, unit_value
+
+def make_comments(n: int = 3000) -> pl.DataFrame:
+    start = datetime(2024, 1, 1)
+    return pl.DataFrame({
+        "comment_id": [f"c{i}" for i in range(n)],
+        "video_id": [f"v{i % 3}" for i in range(n)],
+        # one large stratum per video, plus small strata on later days
+        "published_at": [start + timedelta(days=0 if i % 50 else 1 + i % 7) for i in range(n)],
+        "like_count": [i % 11 for i in range(n)],
+    })
+
+def test_unit_values_are_stable_and_in_range():
+    frame = pl.DataFrame({"comment_id": ["UgzA", "UgzB", "UgzC"]})
+    values = frame.select(unit_value(7))["comment_id"].to_list()
+    assert values == frame.select(unit_value(7))["comment_id"].to_list()
+    assert all(0 <= v < 1 for v in values)
+    assert values != frame.select(unit_value(8))["comment_id"].to_list()
+
+def test_unit_values_are_pinned():
+    # a change here redraws every sample, bump `UNIT_HASH` with it
+    frame = pl.DataFrame({"comment_id": ["UgzA", "Ugw-ABCDEFGHIJKLMNOPQRSTUVWXYZ.abcdefghijk"]})
+    assert frame.select(unit_value(3))["comment_id"].to_list() == [0.16570046971083174, 0.1434344372940538]
+
+def test_descriptor_tells_samples_apart():
+    ldf = make_comments().lazy()
+    descriptor = StratifiedSample(ldf, fraction=0.05, seed=3).descriptor()
+    assert descriptor == StratifiedSample(ldf, fraction=0.05, seed=3).descriptor()
+    assert descriptor != StratifiedSample(ldf, fraction=0.05, seed=4).descriptor()
+    assert descriptor != StratifiedSample(ldf, fraction=0.1, seed=3).descriptor()
+    assert descriptor != StratifiedSample(ldf, fraction=0.05, seed=3, min_per_stratum=5).descriptor()
+
+def test_sample_is_the_same_over_split_files(tmp_path):
+    comments = make_comments()
+    whole = StratifiedSample(comments.lazy(), fraction=0.05, seed=3).collect()
+
+    # the rows of every stratum spread over two files, as daily clean files are
+    comments[::2].write_parquet(tmp_path / "a.parquet")
+    comments[1::2].write_parquet(tmp_path / "b.parquet")
+    strata = inclusion_rates(stratum_sizes(pl.scan_parquet(tmp_path / "*.parquet")), 0.05)
+    predicate = sample_predicate(strata, 0.05, seed=3)
+    split = pl.concat([pl.read_parquet(tmp_path / name).filter(predicate) for name in ("a.parquet", "b.parquet")])
+
+    # small strata are drawn at rates from their population size, not their size in one file
+    assert sorted(split["comment_id"]) == sorted(whole["comment_id"])
@@ -0,0 +1,47 @@
+from datetime import date
+
+import polars as pl
+
+from paths import Paths
+from src.search_index import SearchIndex, split_query, update_search_index
+
+def test_split_query_tolerates_apostrophes_and_unbalanced_quotes():
+    assert split_query("don't stop") == ["don't", "stop"]
+    assert split_query('"black hol*" OR gravit*') == ["black hol*", "OR", "gravit*"]
+    assert split_query('"black hole') == ["black", "hole"]
+
+def test_apostrophe_query(tmp_path):
+    day_paths = Paths("fake", date(2024, 1, 1), base_dir=str(tmp_path))
+    day_paths.resolve_all_paths()
+    pl.DataFrame({
+        "comment_id": ["a", "b"],
+        "tokens_wo_stop": [["don't", "stop"], ["keep", "going"]],
+    }).write_parquet(day_paths.enriched_comments_file_path)
+    update_search_index(day_paths)
+
+    index = SearchIndex(day_paths.search_index_dir)
+    assert index.comment_ids(index.search("don't")) == ["a"]
+    assert index.comment_ids(index.search("'stop")) == []
+
+def test_rebuilt_segment_is_swapped_in(tmp_path):
+    import os
+
+    day_paths = Paths("fake", date(2024, 1, 1), base_dir=str(tmp_path))
+    day_paths.resolve_all_paths()
+    pl.DataFrame({"comment_id": ["a"], "tokens_wo_stop": [["black", "hole"]]}).write_parquet(day_paths.enriched_comments_file_path)
+    update_search_index(day_paths)
+    reader = SearchIndex(day_paths.search_index_dir)
+
+    pl.DataFrame({
+        "comment_id": ["a", "b"],
+        "tokens_wo_stop": [["black", "hole"], ["white", "dwarf", "star"]],
+    }).write_parquet(day_paths.enriched_comments_file_path)
+    update_search_index(day_paths)
+
+    # the open reader keeps its segment, a new one sees the rebuilt one
+    assert reader.comment_ids(reader.search("hole")) == ["a"]
+    index = SearchIndex(day_paths.search_index_dir)
+    assert index.comment_ids(index.search("dwarf")) == ["b"]
+
+    update_search_index(day_paths)
+    assert sorted(os.listdir(day_paths.search_index_dir)) == ["fake_enriched_comments_2024_01_01.1", "meta.json"]
@@ -0,0 +1,36 @@
+import polars as pl
+
+from src.streaming import scan_batches
+
+def test_batches_cover_fixed_row_ranges_across_files(tmp_path):
+    files = []
+    for i, rows in enumerate([7, 5, 11]):
+        path = tmp_path / f"part_{i}.parquet"
+        start = sum([7, 5, 11][:i])
+        pl.DataFrame({"comment_id": [f"c{n}" for n in range(start, start + rows)]}).write_parquet(path)
+        files.append(str(path))
+
+    batches = dict(scan_batches(files, ["comment_id"], batch_size=4, skip={1, 3}))
+
+    assert sorted(batches) == [0, 2, 4, 5]
+    assert batches[2]["comment_id"].to_list() == ["c8", "c9", "c10", "c11"]
+    assert batches[5]["comment_id"].to_list() == ["c20", "c21", "c22"]
+
+def _no_init():
+    pass
+
+def test_streaming_records_batch_latency(tmp_path):
+    from src.metrics import metrics
+    from src.streaming import run_streaming
+
+    source = tmp_path / "comments.parquet"
+    pl.DataFrame({"comment_id": [f"c{n}" for n in range(10)], "comment": ["hello"] * 10}).write_parquet(source)
+
+    def latency_count() -> int:
+        series = metrics.snapshot()["histograms"].get("batch_latency_seconds", {})
+        return series.get("stage=test_latency", {}).get("count", 0)
+
+    before = latency_count()
+    run_streaming(str(source), str(tmp_path / "out"), len, _no_init, "length", pl.Int64, "test_latency",
+                  batch_size=4, workers=1, chunk_size=2)
+    assert latency_count() == before + 3
@@ -0,0 +1,54 @@
+from datetime import date, datetime, timedelta
+import time
+
+import polars as pl
+
+from paths import Paths
+from src.thread_index import ThreadIndex, update_thread_index
+
+def write_clean(path: str, count: int) -> None:
+    start = datetime(2024, 1, 1)
+    pl.DataFrame({
+        "comment_id": [f"c{i}" for i in range(count)],
+        # every other comment replies to the one before it
+        "parent_id": [None if i % 2 == 0 else f"c{i - 1}" for i in range(count)],
+        "published_at": [start + timedelta(minutes=i) for i in range(count)],
+        "likes": list(range(count)),
+    }).write_parquet(path)
+
+def test_reindexing_a_changed_date_adds_its_new_comments(tmp_path):
+    day_paths = Paths("fake", date(2024, 1, 1), base_dir=str(tmp_path))
+    day_paths.resolve_all_paths()
+    write_clean(day_paths.clean_comments_file_path, 2)
+    assert update_thread_index(day_paths) == 2
+
+    # unchanged file: nothing to read again
+    assert update_thread_index(day_paths) == 0
+
+    # the same date cleaned again, with comments appended
+    time.sleep(0.01)
+    write_clean(day_paths.clean_comments_file_path, 4)
+    assert update_thread_index(day_paths) == 2
+
+    index = ThreadIndex(day_paths.thread_index_dir)
+    assert len(index) == 4
+    assert index.child_counts().tolist() == [1, 0, 1, 0]
+
+def test_index_of_another_version_is_rebuilt(tmp_path):
+    import json
+    import os
+
+    day_paths = Paths("fake", date(2024, 1, 1), base_dir=str(tmp_path))
+    day_paths.resolve_all_paths()
+    write_clean(day_paths.clean_comments_file_path, 4)
+    update_thread_index(day_paths)
+
+    meta_path = os.path.join(day_paths.thread_index_dir, "meta.json")
+    with open(meta_path) as file:
+        meta = json.load(file)
+    meta.pop("version")
+    with open(meta_path, "w") as file:
+        json.dump(meta, file)
+
+    assert update_thread_index(day_paths) == 4
+    assert len(ThreadIndex(day_paths.thread_index_dir)) == 4
@@ -0,0 +1,32 @@
+from collections import Counter
+
+import numpy as np
+import polars as pl
+
+from src.word_cloud import build_token_counter, layout_key
+
+def test_duplicates_counted_once_and_unclustered_comments_kept(tmp_path):
+    enriched = tmp_path / "enriched.parquet"
+    pl.DataFrame({
+        "comment_id": ["a", "b", "c", "d", "e", "f"],
+        "tokens_wo_stop": [["spam"], ["spam"], ["spam"], ["hello"], ["hello"], ["world"]],
+    }).write_parquet(enriched)
+    # a, b and c are copies of one comment, d and e have no cluster info
+    duplicates = pl.LazyFrame({
+        "comment_id": ["a", "b", "c", "f"],
+        "dup_cluster_id": [7, 7, 7, 8],
+    })
+
+    counter = build_token_counter([str(enriched)], duplicates=duplicates)
+
+    assert counter == Counter({"spam": 1, "hello": 2, "world": 1})
+
+def test_layout_key_depends_on_the_mask():
+    frequencies = {"hello": 3.0, "world": 1.0}
+    blank = np.zeros((100, 100), dtype=np.uint8)
+    square = blank.copy()
+    square[10:90, 10:90] = 255
+
+    assert layout_key(frequencies, {"mask": blank}) == layout_key(frequencies, {"mask": blank.copy()})
+    assert layout_key(frequencies, {"mask": blank}) != layout_key(frequencies, {"mask": square})
+    assert layout_key(frequencies, {"mask": blank}) != layout_key(frequencies, {"mask": blank, "contour_width": 2})